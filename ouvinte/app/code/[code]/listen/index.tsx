@@ -1,6 +1,6 @@
 import env from "@/config/env";
 import RoomService from "@/services/api/RoomService";
-import { setAudioModeAsync } from "expo-audio";
+import { AudioPlayer, createAudioPlayer, setAudioModeAsync } from "expo-audio";
 import InCallManager from "react-native-incall-manager";
 import { Stack, useLocalSearchParams, useRouter } from "expo-router";
 import React, {
@@ -53,6 +53,13 @@ const BLUE = "#0B66C3";
 const GREEN = "#059669";
 const GRAY = "#9CA3AF";
 
+// Capacidades anunciadas ao signal no join (ex.: receber ICE em lote).
+const SIGNAL_CAPS = ["ice-batch"];
+// Quantos outros ouvintes este aparelho reencaminha na árvore de relay.
+const RELAY_CAPACITY = 2;
+// Intervalo do qos-report (jitter/perda/RTT/nível) enviado ao signal.
+const QOS_REPORT_MS = 5000;
+
 type OfferPayload = {
   from: string | number;
   sdp: string;
@@ -76,6 +83,8 @@ type IcePayload = {
 type MemberMeta = {
   id: string | number;
   sid?: string;
+  caps?: string[];
+  relay_capacity?: number;
   role?: "translator" | "speaker" | "admin" | "user";
   src?: string;
   tgt?: string;
@@ -142,6 +151,27 @@ export default function ListenScreen() {
   const peerRoomRef = useRef<Map<string | number, string>>(new Map());
   const joinedRoomsRef = useRef<Set<string>>(new Set());
   const meIdRef = useRef<string>(uuid4());
+  // Árvore de relay: stream recebido do pai e PCs de envio para os filhos.
+  const upstreamStreamRef = useRef<any>(null);
+  const childPcsRef = useRef<Map<string | number, AnyRTCPeerConnection>>(
+    new Map()
+  );
+  const relayChildrenRef = useRef<{ room: string; children: string[] }>({
+    room: "",
+    children: [],
+  });
+  const relayDialRef = useRef<() => void>(() => {});
+  // Token de retomada: após queda de rede a sessão volta com o mesmo id.
+  const sessionTokenRef = useRef<string | null>(null);
+  // Player HLS usado quando o signal redireciona a audiência (room lotada).
+  const hlsPlayerRef = useRef<AudioPlayer | null>(null);
+
+  const stopHls = useCallback(() => {
+    try {
+      hlsPlayerRef.current?.remove();
+    } catch {}
+    hlsPlayerRef.current = null;
+  }, []);
 
   const [rx, setRx] = useState<RxStats>({
     level: 0,
@@ -156,6 +186,8 @@ export default function ListenScreen() {
 
   const [sheetVisible, setSheetVisible] = useState(false);
   const [tempLang, setTempLang] = useState<LanguageOption | null>(null);
+  // Posição na fila de entrada da sala (início de palestra lotado).
+  const [queuePosition, setQueuePosition] = useState<number | null>(null);
   const sheetAnim = useRef(new Animated.Value(0)).current;
 
   const safePadBottom = Math.max(16, insets.bottom + 16);
@@ -300,11 +332,14 @@ export default function ListenScreen() {
   }, []);
 
   const startRxMonitor = useCallback(
-    (pc: AnyRTCPeerConnection) => {
+    (pc: AnyRTCPeerConnection, peerId: string | number) => {
       stopRxMonitor();
       let lastBytes = 0;
       let lastPkts = 0;
       let lastTs = 0;
+      let reportPkts = 0;
+      let reportLost = 0;
+      let lastReportAt = Date.now();
 
       statsTimerRef.current = setInterval(async () => {
         try {
@@ -312,6 +347,7 @@ export default function ListenScreen() {
           let level = 0;
           let bytes = 0;
           let pkts = 0;
+          let lost = 0;
           let rttMs: number | undefined;
           let jitterMs: number | undefined;
 
@@ -328,6 +364,9 @@ export default function ListenScreen() {
               if (typeof r.packetsReceived === "number") {
                 pkts = r.packetsReceived;
               }
+              if (typeof r.packetsLost === "number") {
+                lost = Math.max(0, r.packetsLost);
+              }
               if (typeof r.jitter === "number") {
                 jitterMs = r.jitter * 1000;
               }
@@ -358,6 +397,22 @@ export default function ListenScreen() {
             jitter_ms: jitterMs,
           });
 
+          if (ts - lastReportAt >= QOS_REPORT_MS) {
+            const dPkts = Math.max(0, pkts - reportPkts);
+            const dLost = Math.max(0, lost - reportLost);
+            socketRef.current?.emit("qos-report", {
+              room: peerRoomRef.current.get(peerId) || roomCode,
+              from: peerId,
+              jitter_ms: jitterMs,
+              loss: dPkts + dLost > 0 ? dLost / (dPkts + dLost) : 0,
+              rtt_ms: rttMs,
+              level,
+            });
+            reportPkts = pkts;
+            reportLost = lost;
+            lastReportAt = ts;
+          }
+
           lastBytes = bytes;
           lastPkts = pkts;
           lastTs = ts;
@@ -374,7 +429,7 @@ export default function ListenScreen() {
         }
       }, 600);
     },
-    [stopRxMonitor]
+    [roomCode, stopRxMonitor]
   );
 
   const getOrCreatePC = useCallback(
@@ -401,15 +456,25 @@ export default function ListenScreen() {
         socketRef.current?.emit("ice-candidate", payload);
       };
 
-      (pc as AnyRTCPeerConnection).ontrack = async () => {
+      (pc as AnyRTCPeerConnection).ontrack = async (evt: any) => {
+        upstreamStreamRef.current = evt?.streams?.[0] ?? null;
+        relayDialRef.current();
         await configureAudioSession();
         setTimeout(() => configureAudioSession(), 500);
 
-        startRxMonitor(pc!);
+        startRxMonitor(pc!, peerId);
       };
 
       (pc as AnyRTCPeerConnection).onconnectionstatechange = async () => {
         const st = (pc as AnyRTCPeerConnection)?.connectionState;
+        if (st === "connected" || st === "failed") {
+          // time-to-first-audio medido pelo signal
+          socketRef.current?.emit("negotiation-state", {
+            room: peerRoomRef.current.get(peerId) || roomCode,
+            from: peerId,
+            state: st,
+          });
+        }
         if (st === "connected") {
           await configureAudioSession();
         }
@@ -424,6 +489,60 @@ export default function ListenScreen() {
     [roomCode, startRxMonitor, stopRxMonitor]
   );
 
+  const closeChild = useCallback((childId: string | number) => {
+    const pc = childPcsRef.current.get(childId);
+    if (!pc) return;
+    try {
+      (pc as AnyRTCPeerConnection).close();
+    } catch {}
+    childPcsRef.current.delete(childId);
+  }, []);
+
+  // Reencaminha o áudio recebido aos filhos atribuídos pelo signal.
+  const dialRelayChildren = useCallback(async () => {
+    const stream = upstreamStreamRef.current;
+    const { room, children } = relayChildrenRef.current;
+    if (!stream || !webrtcRef.current) return;
+    const { RTCPeerConnection: PC } = webrtcRef.current;
+    for (const childId of children) {
+      if (childPcsRef.current.has(childId)) continue;
+      const pc = new PC({ iceServers });
+      childPcsRef.current.set(childId, pc);
+      stream.getAudioTracks().forEach((t: any) => pc.addTrack(t, stream));
+      (pc as AnyRTCPeerConnection).onicecandidate = (evt: any) => {
+        if (!evt.candidate) return;
+        socketRef.current?.emit("ice-candidate", {
+          room,
+          to: childId,
+          candidate: evt.candidate?.toJSON?.() ?? evt.candidate,
+        });
+      };
+      (pc as AnyRTCPeerConnection).onconnectionstatechange = () => {
+        const st = (pc as AnyRTCPeerConnection)?.connectionState;
+        if (st === "failed" || st === "closed") closeChild(childId);
+      };
+      try {
+        const offer = await pc.createOffer({});
+        await pc.setLocalDescription(offer);
+        socketRef.current?.emit("offer", {
+          room,
+          to: childId,
+          sdp: pc.localDescription?.sdp || "",
+          type: "offer",
+          meta: { from_role: "user", tgt: audioLangRef.current },
+        });
+      } catch {
+        closeChild(childId);
+      }
+    }
+  }, [closeChild]);
+
+  useEffect(() => {
+    relayDialRef.current = () => {
+      dialRelayChildren().catch(() => {});
+    };
+  }, [dialRelayChildren]);
+
   const applyRemoteOfferAndAnswer = useCallback(
     async (pc: AnyRTCPeerConnection, sdp: string) => {
       if (!webrtcRef.current) throw new Error("WebRTC não carregado");
@@ -463,12 +582,15 @@ export default function ListenScreen() {
         role: "user",
         id: meIdRef.current,
         tgt: tgtCode,
+        caps: SIGNAL_CAPS,
+        relay_capacity: RELAY_CAPACITY,
       } as MemberMeta;
       if (!joinedRoomsRef.current.has(main)) {
         socket.emit("join", {
           room: main,
           role: "user",
           id: meIdRef.current,
+          caps: SIGNAL_CAPS,
         } as MemberMeta);
         joinedRoomsRef.current.add(main);
       }
@@ -502,9 +624,12 @@ export default function ListenScreen() {
       });
       pcsRef.current.clear();
       peerRoomRef.current.clear();
+      childPcsRef.current.forEach((_, id) => closeChild(id));
+      upstreamStreamRef.current = null;
       stopRxMonitor();
+      stopHls();
     },
-    [joinRoomsForTarget, roomCode, stopRxMonitor]
+    [joinRoomsForTarget, roomCode, stopRxMonitor, stopHls, closeChild]
   );
 
   useEffect(() => {
@@ -523,6 +648,25 @@ export default function ListenScreen() {
     const joinedRooms = joinedRoomsRef.current;
 
     const onConnect = () => {
+      if (sessionTokenRef.current) {
+        socket.emit("resume", { token: sessionTokenRef.current });
+        return;
+      }
+      joinRoomsForTarget(audioLangRef.current).catch(() => {});
+    };
+
+    const onSession = ({ token }: any) => {
+      if (token) sessionTokenRef.current = token;
+    };
+
+    const onJoinQueued = ({ position }: any) => {
+      setQueuePosition(typeof position === "number" ? position : null);
+    };
+    const onRoomInfo = () => setQueuePosition(null);
+
+    const onResumeFailed = () => {
+      sessionTokenRef.current = null;
+      joinedRoomsRef.current.clear();
       joinRoomsForTarget(audioLangRef.current).catch(() => {});
     };
 
@@ -534,10 +678,13 @@ export default function ListenScreen() {
         const senderRole =
           meta?.from_role ?? meta?.role ?? meta?.senderRole ?? "";
 
-        const offerLang =
+        const declaredLang =
           senderRole === "speaker"
             ? meta?.src ?? meta?.source
             : meta?.tgt ?? meta?.target;
+        // "*" = áudio que serve qualquer idioma (publisher sem idioma declarado)
+        const offerLang =
+          declaredLang === "*" ? audioLangRef.current : declaredLang;
 
         if (
           audioLangRef.current &&
@@ -571,7 +718,7 @@ export default function ListenScreen() {
     const onIce = async ({ from, candidate }: any) => {
       if (!webrtcRef.current) return;
       const { RTCIceCandidate } = webrtcRef.current;
-      const pc = pcsRef.current.get(from);
+      const pc = pcsRef.current.get(from) ?? childPcsRef.current.get(from);
       if (!pc || !candidate) return;
       try {
         await (pc as AnyRTCPeerConnection).addIceCandidate(
@@ -580,6 +727,10 @@ export default function ListenScreen() {
       } catch {}
     };
 
+    const onIceBatch = async ({ from, candidates }: any) => {
+      for (const candidate of candidates ?? []) await onIce({ from, candidate });
+    };
+
     const onBye = ({ from }: any) => {
       const pc = pcsRef.current.get(from);
       if (pc) {
@@ -592,9 +743,54 @@ export default function ListenScreen() {
       }
     };
 
+    const onAnswer = async ({ from, sdp }: any) => {
+      const pc = childPcsRef.current.get(from);
+      if (!pc || !sdp || !webrtcRef.current) return;
+      const { RTCSessionDescription } = webrtcRef.current;
+      try {
+        await (pc as AnyRTCPeerConnection).setRemoteDescription(
+          new RTCSessionDescription({ type: "answer", sdp })
+        );
+      } catch {}
+    };
+
+    const onRelayChildren = ({ room, children }: any) => {
+      const next: string[] = children ?? [];
+      childPcsRef.current.forEach((_, id) => {
+        if (!next.includes(String(id))) closeChild(id);
+      });
+      relayChildrenRef.current = { room, children: next };
+      relayDialRef.current();
+    };
+
+    const onHlsRedirect = ({ lang, url }: any) => {
+      if (!url || (audioLangRef.current && lang !== audioLangRef.current)) return;
+      pcsRef.current.forEach((pc) => {
+        try {
+          (pc as AnyRTCPeerConnection).close();
+        } catch {}
+      });
+      pcsRef.current.clear();
+      peerRoomRef.current.clear();
+      stopRxMonitor();
+      stopHls();
+      const uri = /^https?:/.test(url) ? url : `${env.ApiUrl()}${url}`;
+      const player = createAudioPlayer({ uri });
+      hlsPlayerRef.current = player;
+      player.play();
+    };
+
     socket.on("connect", onConnect);
+    socket.on("session", onSession);
+    socket.on("join-queued", onJoinQueued);
+    socket.on("room-info", onRoomInfo);
+    socket.on("resume-failed", onResumeFailed);
     socket.on("offer", onOffer);
+    socket.on("hls-redirect", onHlsRedirect);
+    socket.on("answer", onAnswer);
+    socket.on("relay-children", onRelayChildren);
     socket.on("ice-candidate", onIce);
+    socket.on("ice-candidates", onIceBatch);
     socket.on("bye", onBye);
 
     return () => {
@@ -604,8 +800,16 @@ export default function ListenScreen() {
         for (const r of rooms) socket.emit("leave", { room: r });
       } catch {}
       socket.off("connect", onConnect);
+      socket.off("session", onSession);
+      socket.off("join-queued", onJoinQueued);
+      socket.off("room-info", onRoomInfo);
+      socket.off("resume-failed", onResumeFailed);
       socket.off("offer", onOffer);
+      socket.off("hls-redirect", onHlsRedirect);
+      socket.off("answer", onAnswer);
+      socket.off("relay-children", onRelayChildren);
       socket.off("ice-candidate", onIce);
+      socket.off("ice-candidates", onIceBatch);
       socket.off("bye", onBye);
       socket.disconnect();
       socketRef.current = null;
@@ -617,7 +821,9 @@ export default function ListenScreen() {
       });
       pcs.clear();
       peerRooms.clear();
+      childPcsRef.current.forEach((_, id) => closeChild(id));
       stopRxMonitor();
+      stopHls();
       joinedRooms.clear();
     };
   }, [
@@ -627,6 +833,8 @@ export default function ListenScreen() {
     applyRemoteOfferAndAnswer,
     joinRoomsForTarget,
     stopRxMonitor,
+    stopHls,
+    closeChild,
   ]);
 
   useEffect(() => {
@@ -710,6 +918,11 @@ export default function ListenScreen() {
                 {rx.isReceiving ? "Online" : "Offline"}
               </Text>
             </View>
+            {queuePosition !== null && !rx.isReceiving && (
+              <Text style={{ color: "#6B7280" }}>
+                Aguardando para entrar: posição {queuePosition}
+              </Text>
+            )}
           </View>
         </View>
 
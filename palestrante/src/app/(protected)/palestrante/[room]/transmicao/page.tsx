@@ -8,15 +8,22 @@ import env from "@/config/env";
 import RoomService from "@/services/api/roomService";
 import { LocalStorage } from "@/storage/LocalStorage";
 import {
+  BitrateHintPayload,
+  IceBatchPayload,
   RoomDetails,
   Translator,
   MemberMeta,
   RoomInfoPayload,
+  RosterBatchPayload,
+  RosterDeltaPayload,
 } from "@/types/room";
 import { Paper, Typography } from "@mui/material";
 import MicLevelMeter from "@/components/room/MicLevelMeter";
+import { Roster, RosterDeltaKind } from "@/utils/roster";
+import { applyBitrateHint } from "@/utils/bitrate";
 
 const iceServers: RTCIceServer[] = [];
+const SIGNAL_CAPS = ["ice-batch"];
 
 type PeerKey = string | number;
 
@@ -30,6 +37,10 @@ export default function SpeakerPage({ params }: { params: { room: string } }) {
   const connectedPeersRef = useRef<Set<PeerKey>>(new Set());
   const iceQueueRef = useRef<Map<PeerKey, RTCIceCandidateInit[]>>(new Map());
   const peerReadyRef = useRef<Set<PeerKey>>(new Set());
+  // Árvore de relay: quando o signal a ativa, só os filhos atribuídos são discados.
+  const relayChildrenRef = useRef<Set<PeerKey> | null>(null);
+  // Último bitrate-hint do signal: vale para as conexões atuais e as próximas.
+  const bitrateHintRef = useRef<BitrateHintPayload | null>(null);
 
   const micStreamRef = useRef<MediaStream | null>(null);
 
@@ -38,6 +49,7 @@ export default function SpeakerPage({ params }: { params: { room: string } }) {
   const [micLevel, setMicLevel] = useState(0);
 
   const membersRef = useRef<MemberMeta[]>([]);
+  const rosterRef = useRef<Roster>(new Roster());
   const joinedSubRoomRef = useRef<string>("");
   const dialTimerRef = useRef<number | null>(null);
 
@@ -159,6 +171,7 @@ export default function SpeakerPage({ params }: { params: { room: string } }) {
 
         const offer = await pc.createOffer({ offerToReceiveAudio: false });
         await pc.setLocalDescription(offer);
+        applyBitrateHint(pc, bitrateHintRef.current);
 
         socketRef.current?.emit("offer", {
           room: joinedSubRoomRef.current,
@@ -180,9 +193,12 @@ export default function SpeakerPage({ params }: { params: { room: string } }) {
     if (!joinedSubRoomRef.current) return;
     const list = membersRef.current || [];
 
-    const relays = list.filter((m) => m.role === "relay");
+    const relays = list.filter((m) => m.role === "relay" || m.role === "sfu");
     const usersOriginal = list.filter(
-      (m) => m.role === "user" && (m.tgt === autoSrc || (!m.tgt && autoSrc))
+      (m) =>
+        m.role === "user" &&
+        (m.tgt === autoSrc || (!m.tgt && autoSrc)) &&
+        (!relayChildrenRef.current || relayChildrenRef.current.has(getPeerKey(m)))
     );
 
     const targets = [...relays, ...usersOriginal];
@@ -254,6 +270,7 @@ export default function SpeakerPage({ params }: { params: { room: string } }) {
         role: "speaker",
         id: meId ?? undefined,
         src,
+        caps: SIGNAL_CAPS,
       } as MemberMeta);
       joinedSubRoomRef.current = target;
 
@@ -288,13 +305,43 @@ export default function SpeakerPage({ params }: { params: { room: string } }) {
           transports: ["websocket", "polling"],
           path: "/signal",
           withCredentials: false,
+          auth: { token: LocalStorage.apiToken.get() ?? "" },
         });
         socketRef.current = socket;
 
         socket.on("room-info", (payload: RoomInfoPayload) => {
           if (!alive) return;
-          const list = Array.isArray(payload?.members) ? payload.members! : [];
-          membersRef.current = list;
+          rosterRef.current.applySnapshot(payload);
+          membersRef.current = rosterRef.current.members(payload?.room ?? "");
+          dialEligibleReceivers();
+        });
+
+        const onRosterDelta =
+          (kind: RosterDeltaKind) => (payload: RosterDeltaPayload) => {
+            if (!alive) return;
+            if (!rosterRef.current.applyDelta(kind, payload)) {
+              socket.emit("list-members", {
+                room: payload.room,
+                since: rosterRef.current.seqs(payload.room),
+              });
+              return;
+            }
+            membersRef.current = rosterRef.current.members(payload.room);
+            dialEligibleReceivers();
+          };
+        socket.on("member-added", onRosterDelta("added"));
+        socket.on("member-removed", onRosterDelta("removed"));
+        socket.on("member-updated", onRosterDelta("updated"));
+        socket.on("roster-delta", (payload: RosterBatchPayload) => {
+          if (!alive) return;
+          if (!rosterRef.current.applyBatch(payload)) {
+            socket.emit("list-members", {
+              room: payload.room,
+              since: rosterRef.current.seqs(payload.room),
+            });
+            return;
+          }
+          membersRef.current = rosterRef.current.members(payload.room);
           dialEligibleReceivers();
         });
 
@@ -322,11 +369,11 @@ export default function SpeakerPage({ params }: { params: { room: string } }) {
             peerReadyRef.current.add(from);
 
             const q = iceQueueRef.current.get(from) ?? [];
-            for (const cand of q) {
-              socketRef.current?.emit("ice-candidate", {
+            if (q.length) {
+              socketRef.current?.emit("ice-candidates", {
                 room: joinedSubRoomRef.current || roomCode,
                 to: from,
-                candidate: cand,
+                candidates: q,
               });
             }
             iceQueueRef.current.delete(from);
@@ -355,12 +402,51 @@ export default function SpeakerPage({ params }: { params: { room: string } }) {
           }
         });
 
-        socket.on("ice-candidate", async ({ from, candidate }) => {
+        const onIce = async ({ from, candidate }: any) => {
           const pc = pcsRef.current.get(from);
           if (!pc || !candidate) return;
           try {
             await pc.addIceCandidate(candidate);
           } catch {}
+        };
+        socket.on("ice-candidate", onIce);
+        socket.on("ice-candidates", async (payload: IceBatchPayload) => {
+          for (const candidate of payload?.candidates ?? [])
+            await onIce({ from: payload.from, candidate });
+        });
+
+        // Ouvinte servido pelo SFU ou por outro nó da árvore de relay:
+        // descarta o PC direto.
+        const dropSteered = ({ to }: { to: PeerKey }) => {
+          const pc = pcsRef.current.get(to);
+          if (pc) {
+            try {
+              pc.close();
+            } catch {}
+          }
+          pcsRef.current.delete(to);
+          connectedPeersRef.current.delete(to);
+          peerReadyRef.current.delete(to);
+          iceQueueRef.current.delete(to);
+        };
+        socket.on("sfu-steer", dropSteered);
+        socket.on("relay-steer", dropSteered);
+
+        socket.on("bitrate-hint", (hint: BitrateHintPayload) => {
+          bitrateHintRef.current = hint;
+          pcsRef.current.forEach((pc) => applyBitrateHint(pc, hint));
+        });
+
+        socket.on("relay-children", ({ children }) => {
+          const next = new Set<PeerKey>(children ?? []);
+          relayChildrenRef.current = next;
+          pcsRef.current.forEach((_, key) => {
+            const member = (membersRef.current || []).find(
+              (m) => getPeerKey(m) === key
+            );
+            if (member?.role === "user" && !next.has(key)) dropSteered({ to: key });
+          });
+          dialEligibleReceivers();
         });
 
         socket.on("bye", ({ from }) => {
@@ -383,6 +469,7 @@ export default function SpeakerPage({ params }: { params: { room: string } }) {
             room: roomCode,
             role: "speaker",
             id: meId ?? undefined,
+            caps: SIGNAL_CAPS,
           } as MemberMeta);
         }
       } catch {}
@@ -8,15 +8,22 @@ import env from "@/config/env";
 import RoomService from "@/services/api/roomService";
 import { LocalStorage } from "@/storage/LocalStorage";
 import {
+  BitrateHintPayload,
+  IceBatchPayload,
   RoomDetails,
   Translator,
   MemberMeta,
   RoomInfoPayload,
+  RosterBatchPayload,
+  RosterDeltaPayload,
 } from "@/types/room";
 import { Button, Paper, Typography, Chip, Stack } from "@mui/material";
 import MicLevelMeter from "@/components/room/MicLevelMeter";
+import { Roster, RosterDeltaKind } from "@/utils/roster";
+import { applyBitrateHint } from "@/utils/bitrate";
 
 const iceServers: RTCIceServer[] = [];
+const SIGNAL_CAPS = ["ice-batch"];
 
 type PeerKey = string | number;
 
@@ -28,6 +35,10 @@ export default function RelayPage({ params }: { params: { room: string } }) {
 
   const joinedSrcRoomRef = useRef<string>("");
   const joinedTgtRoomRef = useRef<string>("");
+  // Árvore de relay: quando o signal a ativa, só os filhos atribuídos são discados.
+  const relayChildrenRef = useRef<Set<PeerKey> | null>(null);
+  // Último bitrate-hint do signal: vale para as conexões atuais e as próximas.
+  const bitrateHintRef = useRef<BitrateHintPayload | null>(null);
 
   const upstreamPcRef = useRef<RTCPeerConnection | null>(null);
   const upstreamPeerIdRef = useRef<PeerKey | null>(null);
@@ -65,6 +76,7 @@ export default function RelayPage({ params }: { params: { room: string } }) {
   const [autoTgt, setAutoTgt] = useState<string>("");
 
   const membersRef = useRef<MemberMeta[]>([]);
+  const rosterRef = useRef<Roster>(new Roster());
   const dialTimerRef = useRef<number | null>(null);
 
   const computeAutoSrc = useCallback((d: RoomDetails | null) => {
@@ -182,6 +194,7 @@ export default function RelayPage({ params }: { params: { room: string } }) {
         role: "relay",
         id: meId ?? undefined,
         src,
+        caps: SIGNAL_CAPS,
       } as MemberMeta);
       joinedSrcRoomRef.current = srcRoom;
 
@@ -191,6 +204,7 @@ export default function RelayPage({ params }: { params: { room: string } }) {
         role: "relay",
         id: meId ?? undefined,
         tgt,
+        caps: SIGNAL_CAPS,
       } as MemberMeta);
       joinedTgtRoomRef.current = tgtRoom;
     },
@@ -431,6 +445,7 @@ export default function RelayPage({ params }: { params: { room: string } }) {
 
         const offer = await pc.createOffer({ offerToReceiveAudio: false });
         await pc.setLocalDescription(offer);
+        applyBitrateHint(pc, bitrateHintRef.current);
 
         socketRef.current?.emit("offer", {
           room: joinedTgtRoomRef.current,
@@ -449,7 +464,13 @@ export default function RelayPage({ params }: { params: { room: string } }) {
   );
 
   const dialEligibleUsers = useCallback(() => {
-    const users = (membersRef.current || []).filter((m) => m.role === "user");
+    const users = (membersRef.current || []).filter(
+      (m) =>
+        m.role === "sfu" ||
+        (m.role === "user" &&
+          (!relayChildrenRef.current ||
+            relayChildrenRef.current.has((m.sid as any) ?? m.id)))
+    );
     users.forEach((m) => callUser(m));
   }, [callUser]);
 
@@ -472,13 +493,43 @@ export default function RelayPage({ params }: { params: { room: string } }) {
           transports: ["websocket", "polling"],
           path: "/signal",
           withCredentials: false,
+          auth: { token: LocalStorage.apiToken.get() ?? "" },
         });
         socketRef.current = socket;
 
         socket.on("room-info", (payload: RoomInfoPayload) => {
           if (!alive) return;
-          const list = Array.isArray(payload?.members) ? payload!.members! : [];
-          membersRef.current = list;
+          rosterRef.current.applySnapshot(payload);
+          membersRef.current = rosterRef.current.members(payload?.room ?? "");
+          dialEligibleUsers();
+        });
+
+        const onRosterDelta =
+          (kind: RosterDeltaKind) => (payload: RosterDeltaPayload) => {
+            if (!alive) return;
+            if (!rosterRef.current.applyDelta(kind, payload)) {
+              socket.emit("list-members", {
+                room: payload.room,
+                since: rosterRef.current.seqs(payload.room),
+              });
+              return;
+            }
+            membersRef.current = rosterRef.current.members(payload.room);
+            dialEligibleUsers();
+          };
+        socket.on("member-added", onRosterDelta("added"));
+        socket.on("member-removed", onRosterDelta("removed"));
+        socket.on("member-updated", onRosterDelta("updated"));
+        socket.on("roster-delta", (payload: RosterBatchPayload) => {
+          if (!alive) return;
+          if (!rosterRef.current.applyBatch(payload)) {
+            socket.emit("list-members", {
+              room: payload.room,
+              since: rosterRef.current.seqs(payload.room),
+            });
+            return;
+          }
+          membersRef.current = rosterRef.current.members(payload.room);
           dialEligibleUsers();
         });
 
@@ -523,18 +574,18 @@ export default function RelayPage({ params }: { params: { room: string } }) {
             await pc.setRemoteDescription({ sdp, type });
             dsPeerReadyRef.current.add(from);
             const q = dsIceQueueRef.current.get(from) ?? [];
-            for (const cand of q) {
-              socketRef.current?.emit("ice-candidate", {
+            if (q.length) {
+              socketRef.current?.emit("ice-candidates", {
                 room: joinedTgtRoomRef.current || roomCode,
                 to: from,
-                candidate: cand,
+                candidates: q,
               });
             }
             dsIceQueueRef.current.delete(from);
           } catch {}
         });
 
-        socket.on("ice-candidate", async ({ from, candidate }) => {
+        const onIce = async ({ from, candidate }: any) => {
           if (!candidate) return;
           if (from != null && from === upstreamPeerIdRef.current) {
             const pc = upstreamPcRef.current;
@@ -549,6 +600,11 @@ export default function RelayPage({ params }: { params: { room: string } }) {
           try {
             await dpc.addIceCandidate(candidate);
           } catch {}
+        };
+        socket.on("ice-candidate", onIce);
+        socket.on("ice-candidates", async (payload: IceBatchPayload) => {
+          for (const candidate of payload?.candidates ?? [])
+            await onIce({ from: payload.from, candidate });
         });
 
         socket.on("bye", ({ from }) => {
@@ -574,6 +630,41 @@ export default function RelayPage({ params }: { params: { room: string } }) {
           }
         });
 
+        // Ouvinte servido pelo SFU ou por outro nó da árvore de relay:
+        // descarta o PC direto.
+        const dropSteered = ({ to }: { to: PeerKey }) => {
+          const dpc = dsPcsRef.current.get(to);
+          if (dpc) {
+            try {
+              dpc.close();
+            } catch {}
+          }
+          dsPcsRef.current.delete(to);
+          dsConnectedRef.current.delete(to);
+          dsPeerReadyRef.current.delete(to);
+          dsIceQueueRef.current.delete(to);
+          stopDownstreamMeter(to);
+        };
+        socket.on("sfu-steer", dropSteered);
+        socket.on("relay-steer", dropSteered);
+
+        socket.on("bitrate-hint", (hint: BitrateHintPayload) => {
+          bitrateHintRef.current = hint;
+          dsPcsRef.current.forEach((pc) => applyBitrateHint(pc, hint));
+        });
+
+        socket.on("relay-children", ({ children }) => {
+          const next = new Set<PeerKey>(children ?? []);
+          relayChildrenRef.current = next;
+          dsPcsRef.current.forEach((_, key) => {
+            const member = (membersRef.current || []).find(
+              (m) => ((m.sid as any) ?? m.id) === key
+            );
+            if (member?.role === "user" && !next.has(key)) dropSteered({ to: key });
+          });
+          dialEligibleUsers();
+        });
+
         joinLangRooms(chosenSrc, chosenTgt);
       } catch {}
     })();
@@ -40,10 +40,29 @@ export type IceServer = {
 export type MemberMeta = {
   id: string | number;
   sid?: string;
-  role?: "translator" | "speaker" | "admin" | "user" | "relay";
+  role?: "translator" | "speaker" | "admin" | "user" | "relay" | "sfu";
   pairs?: Array<{ source?: { code?: string }; target?: { code?: string } }>;
   src?: string;
   tgt?: string;
+  caps?: string[];
+};
+
+export type IceBatchPayload = {
+  from: string | number;
+  candidates?: RTCIceCandidateInit[];
+  end?: boolean;
+};
+
+export type BitrateHintPayload = {
+  room: string;
+  lang: string;
+  bitrate_kbps: number;
+  ptime_ms: number;
+  step: number;
+  steps: number;
+  reason: "degraded" | "healthy" | "current";
+  listeners?: number;
+  degraded?: number;
 };
 
 export type OfferPayload = {
@@ -57,6 +76,25 @@ export type RoomInfoPayload = {
   members?: MemberMeta[];
   details?: RoomDetails;
   room?: string;
+  seqs?: Record<string, number>;
+  room_size?: number;
+  unchanged?: boolean;
+};
+
+export type RosterDeltaPayload = {
+  room: string;
+  view: string;
+  seq: number;
+  room_size?: number;
+  member: MemberMeta;
+};
+
+export type RosterBatchPayload = {
+  room: string;
+  view: string;
+  seq: number;
+  room_size?: number;
+  changes: Array<{ type: "added" | "removed" | "updated"; member: MemberMeta }>;
 };
 
 export type RxStats = {
@@ -0,0 +1,25 @@
+import { BitrateHintPayload } from "@/types/room";
+
+/**
+ * Aplica aos senders de áudio da conexão o degrau sugerido pelo signal
+ * (`bitrate-hint`): `maxBitrate` e, nos navegadores que suportam, `ptime`.
+ * Antes da negociação o sender ainda não tem encodings; nesse caso o hint é
+ * aplicado de novo depois do offer.
+ */
+export async function applyBitrateHint(
+  pc: RTCPeerConnection,
+  hint: BitrateHintPayload | null
+) {
+  if (!hint) return;
+  for (const sender of pc.getSenders()) {
+    if (sender.track?.kind !== "audio") continue;
+    try {
+      const params = sender.getParameters();
+      const encoding = params.encodings?.[0];
+      if (!encoding) continue;
+      encoding.maxBitrate = hint.bitrate_kbps * 1000;
+      (encoding as any).ptime = hint.ptime_ms;
+      await sender.setParameters(params);
+    } catch {}
+  }
+}
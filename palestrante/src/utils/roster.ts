@@ -0,0 +1,72 @@
+import {
+  MemberMeta,
+  RoomInfoPayload,
+  RosterBatchPayload,
+  RosterDeltaPayload,
+} from "@/types/room";
+
+export type RosterDeltaKind = "added" | "removed" | "updated";
+
+type RoomRoster = {
+  seqs: Record<string, number>;
+  members: Map<string, MemberMeta>;
+};
+
+/**
+ * Roster por room na visão deste socket. Aplica snapshots (room-info),
+ * deltas (member-added/removed/updated) e lotes (roster-delta). Cada delta
+ * vem de um stream (`view`) com sequência própria; `applyDelta` e
+ * `applyBatch` devolvem false quando há salto e o chamador deve pedir
+ * `list-members` com `since`.
+ */
+export class Roster {
+  private rooms = new Map<string, RoomRoster>();
+
+  seqs(room: string): Record<string, number> | undefined {
+    return this.rooms.get(room)?.seqs;
+  }
+
+  members(room: string): MemberMeta[] {
+    return Array.from(this.rooms.get(room)?.members.values() ?? []);
+  }
+
+  applySnapshot(payload: RoomInfoPayload): boolean {
+    const room = payload?.room ?? "";
+    if (payload?.unchanged) return this.rooms.has(room);
+    const members = new Map<string, MemberMeta>();
+    for (const m of payload?.members ?? []) members.set(String(m.id), m);
+    this.rooms.set(room, { seqs: { ...(payload?.seqs ?? {}) }, members });
+    return true;
+  }
+
+  applyDelta(kind: RosterDeltaKind, payload: RosterDeltaPayload): boolean {
+    return this.applyBatch({
+      room: payload.room,
+      view: payload.view,
+      seq: payload.seq,
+      room_size: payload.room_size,
+      changes: [{ type: kind, member: payload.member }],
+    });
+  }
+
+  applyBatch(payload: RosterBatchPayload): boolean {
+    const state = this.rooms.get(payload.room);
+    if (!state) return false;
+    const last = state.seqs[payload.view];
+    if (last === undefined) return false;
+    if (payload.seq <= last) return true;
+    if (payload.seq !== last + 1) return false;
+
+    for (const { type, member } of payload.changes ?? []) {
+      const id = String(member.id);
+      if (type === "removed") state.members.delete(id);
+      else state.members.set(id, member);
+    }
+    state.seqs[payload.view] = payload.seq;
+    return true;
+  }
+
+  forget(room: string) {
+    this.rooms.delete(room);
+  }
+}
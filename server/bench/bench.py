@@ -0,0 +1,552 @@
+"""
+Gerador de carga e benchmark do signal.
+
+Sobe o `server/signal/app.py` localmente (gunicorn + eventlet, como em
+produção) ou usa um já rodando, e o dirige com milhares de clientes
+python-socketio seguindo o protocolo real:
+
+  - publishers (`speaker`/`translator`) entram, recebem o roster e mandam
+    offer + ICE para cada listener que quer um idioma que servem (em lote,
+    `ice-candidates`, quando os caps incluem "ice-batch", como os apps);
+  - listeners entram no ritmo do perfil (`join` com role/want/caps),
+    respondem com answer + ICE, e uma parte troca de idioma (`update-meta`)
+    ou sai e volta (churn).
+
+Mede latência de join (emit -> room-info), time-to-answer (offer -> answer
+no publisher), bytes/pacotes emitidos e percentis do hub (do /metrics), e
+CPU do processo do signal. Os cenários ficam em `profiles/*.json`,
+versionados; o resultado (JSON) pode ser comparado com um anterior.
+
+Uso:
+  python bench.py profiles/smoke.json --spawn
+  python bench.py profiles/palestra-2000.json --spawn --out results/
+  python bench.py profiles/palestra-2000.json --url http://localhost:5002 \\
+      --compare results/baseline.json --fail-over 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import psutil
+import socketio
+
+HERE = Path(__file__).resolve().parent
+SIGNAL_DIR = HERE.parent / "signal"
+
+# Versão do formato dos perfis/resultados: muda quando um campo muda de
+# significado, para a comparação não misturar cenários diferentes.
+PROFILE_VERSION = 2
+
+DEFAULT_PROFILE = {
+    "room": "BENCH-0001",
+    "publishers": [
+        {
+            "role": "speaker",
+            "pairs": [{"source": {"code": "pt-BR"}, "target": {"code": "pt-BR"}}],
+        }
+    ],
+    "listeners": 100,
+    "listener_role": "user",
+    "want": {"pt-BR": 1.0},
+    "caps": [],
+    "connect_rate_per_s": 50,
+    "hold_s": 30,
+    "churn_per_s": 0,
+    "update_meta_per_s": 0,
+    "ice_per_peer": 4,
+    "sdp_bytes": 2500,
+    "server_env": {},
+}
+
+QUANTILES = (0.5, 0.9, 0.99)
+ICE_BATCH_CAP = "ice-batch"
+METRIC_LINE_RE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$")
+
+
+# =========================
+# Perfis e estatísticas
+# =========================
+def load_profile(path: Path) -> dict:
+    with open(path, encoding="utf-8") as f:
+        profile = json.load(f)
+    version = profile.get("version", PROFILE_VERSION)
+    if version != PROFILE_VERSION:
+        raise SystemExit(f"{path}: versão de perfil {version} (esperada {PROFILE_VERSION})")
+    return {**DEFAULT_PROFILE, "name": path.stem, **profile, "version": version}
+
+
+def _quantiles(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+    out = {
+        f"p{int(q * 100)}": values[min(len(values) - 1, int(q * len(values)))]
+        for q in QUANTILES
+    }
+    out["max"] = values[-1]
+    out["n"] = len(values)
+    return {k: round(v, 2) for k, v in out.items()}
+
+
+class Stats:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.counts: dict[str, int] = {}
+
+    def observe(self, name: str, value_ms: float):
+        self.samples.setdefault(name, []).append(value_ms)
+
+    def inc(self, name: str, amount: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def summary(self) -> dict:
+        return {
+            "latency_ms": {k: _quantiles(v) for k, v in sorted(self.samples.items())},
+            "counts": dict(sorted(self.counts.items())),
+        }
+
+
+def fake_sdp(kind: str, size: int) -> dict:
+    body = "a=x-bench:" + "0" * max(0, size - 40)
+    return {"type": kind, "sdp": f"v=0\r\no=- 0 0 IN IP4 127.0.0.1\r\n{body}\r\n"}
+
+
+def fake_candidate(i: int) -> dict:
+    typ = ("host", "srflx", "relay")[i % 3]
+    return {
+        "candidate": f"candidate:{i} 1 udp 2122260223 10.0.0.{i % 250 + 1} {50000 + i} typ {typ}",
+        "sdpMid": "0",
+        "sdpMLineIndex": 0,
+    }
+
+
+# =========================
+# /metrics e processo do signal
+# =========================
+def scrape_metrics(url: str) -> dict[str, float]:
+    """Soma cada métrica sobre os labels (quantis do hub ficam por label)."""
+    out: dict[str, float] = {}
+    try:
+        with urllib.request.urlopen(f"{url}/metrics", timeout=5) as resp:
+            text = resp.read().decode()
+    except OSError:
+        return out
+    for line in text.splitlines():
+        m = METRIC_LINE_RE.match(line)
+        if not m:
+            continue
+        name, labels, value = m.groups()
+        if name == "signal_hub_lag_quantile_seconds":
+            name = f"{name}{labels or ''}"
+        try:
+            out[name] = out.get(name, 0.0) + float(value)
+        except ValueError:
+            continue
+    return out
+
+
+def spawn_signal(port: int, env: dict) -> subprocess.Popen:
+    # os clientes do bench não fazem login: publishers sem JWT
+    proc_env = {**os.environ, "PORT": str(port), "LOG_LEVEL": "WARNING", "PUBLISHER_AUTH": "0"}
+    proc_env.update({k: str(v) for k, v in env.items()})
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "-k", "eventlet", "-w", "1", "--worker-connections", "20000",
+            "--timeout", "0", "-b", f"127.0.0.1:{port}", "app:app",
+        ],
+        cwd=SIGNAL_DIR,
+        env=proc_env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"signal saiu com código {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1):
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("signal não respondeu /healthz em 30s")
+
+
+def worker_process(pid: int) -> psutil.Process:
+    """O gunicorn atende no worker (filho); sem filho, o próprio processo."""
+    proc = psutil.Process(pid)
+    children = proc.children()
+    return children[0] if children else proc
+
+
+def cpu_seconds(proc: psutil.Process | None) -> float | None:
+    if proc is None:
+        return None
+    times = proc.cpu_times()
+    return times.user + times.system
+
+
+# =========================
+# Clientes
+# =========================
+class Bench:
+    def __init__(self, profile: dict, url: str):
+        self.profile = profile
+        self.url = url
+        self.room = profile["room"]
+        self.stats = Stats()
+        self.listeners: list[socketio.AsyncClient] = []
+        self.publishers: list[socketio.AsyncClient] = []
+        self.langs = list(profile["want"].keys())
+        self.weights = list(profile["want"].values())
+
+    async def _connect(self, sio: socketio.AsyncClient):
+        await sio.connect(self.url, socketio_path="signal", transports=["websocket"])
+
+    def _count_events(self, sio: socketio.AsyncClient, prefix: str, events: tuple[str, ...]):
+        for event in events:
+            sio.on(event, lambda *_, e=event: self.stats.inc(f"{prefix}.{e}"))
+
+    async def _send_ice(self, sio: socketio.AsyncClient, to: str, batched: bool):
+        count = self.profile["ice_per_peer"]
+        if batched:
+            await sio.emit(
+                "ice-candidates",
+                {
+                    "room": self.room,
+                    "to": to,
+                    "candidates": [fake_candidate(i) for i in range(count)],
+                    "end": True,
+                },
+            )
+            return
+        for i in range(count):
+            await sio.emit(
+                "ice-candidate",
+                {"room": self.room, "to": to, "candidate": fake_candidate(i)},
+            )
+
+    async def start_publisher(self, spec: dict):
+        sio = socketio.AsyncClient(reconnection=False)
+        served = {
+            (p.get("source" if spec["role"] == "speaker" else "target") or {}).get("code")
+            for p in spec.get("pairs", [])
+        }
+        pending: dict[str, float] = {}  # listener -> instante do offer
+        offered: set[str] = set()
+        caps = spec.get("caps", self.profile["caps"])
+        batched = ICE_BATCH_CAP in caps
+
+        async def maybe_offer(member: dict):
+            to = member.get("id")
+            if not to or to in offered or member.get("role") != self.profile["listener_role"]:
+                return
+            if member.get("want") and member["want"] not in served:
+                return
+            offered.add(to)
+            pending[to] = time.perf_counter()
+            await sio.emit(
+                "offer",
+                {
+                    "room": self.room,
+                    "to": to,
+                    "offer": fake_sdp("offer", self.profile["sdp_bytes"]),
+                },
+            )
+            await self._send_ice(sio, to, batched)
+            self.stats.inc("offers_sent")
+
+        @sio.on("room-info")
+        async def on_room_info(data):
+            for member in data.get("members", []):
+                await maybe_offer(member)
+
+        @sio.on("peer-joined")
+        async def on_peer_joined(data):
+            await maybe_offer(data.get("member") or {})
+
+        @sio.on("roster-delta")
+        async def on_roster_delta(data):
+            self.stats.inc("publisher.roster-delta")
+            for change in data.get("changes", []):
+                if change.get("type") == "added":
+                    await maybe_offer(change.get("member") or {})
+
+        @sio.on("peer-left")
+        def on_peer_left(data):
+            gone = (data.get("member") or {}).get("id")
+            pending.pop(gone, None)
+            offered.discard(gone)
+
+        @sio.on("answer")
+        def on_answer(data):
+            started = pending.pop(data.get("from"), None)
+            if started is not None:
+                self.stats.observe("time_to_answer", (time.perf_counter() - started) * 1000)
+
+        self._count_events(
+            sio,
+            "publisher",
+            ("ice-candidate", "ice-candidates", "sfu-steer", "relay-steer", "rate-limited"),
+        )
+        await self._connect(sio)
+        await sio.emit("join", {"room": self.room, "caps": caps, **spec})
+        self.publishers.append(sio)
+
+    async def start_listener(self, want: str | None = None):
+        sio = socketio.AsyncClient(reconnection=False)
+        want = want or random.choices(self.langs, self.weights)[0]
+        state = {"joined": False, "queued": False}
+
+        @sio.on("room-info")
+        def on_room_info(data):
+            if not state["joined"]:
+                state["joined"] = True
+                self.stats.observe("join", (time.perf_counter() - started) * 1000)
+
+        @sio.on("join-queued")
+        def on_join_queued(data):
+            if not state["queued"]:
+                state["queued"] = True
+                self.stats.inc("joins_queued")
+
+        @sio.on("offer")
+        async def on_offer(data):
+            to = data.get("from")
+            await sio.emit(
+                "answer",
+                {
+                    "room": self.room,
+                    "to": to,
+                    "answer": fake_sdp("answer", self.profile["sdp_bytes"]),
+                },
+            )
+            await self._send_ice(sio, to, ICE_BATCH_CAP in self.profile["caps"])
+
+        self._count_events(
+            sio,
+            "listener",
+            (
+                "ice-candidate",
+                "ice-candidates",
+                "roster-delta",
+                "join-rejected",
+                "hls-redirect",
+                "relay-parent",
+                "rate-limited",
+            ),
+        )
+        try:
+            await self._connect(sio)
+        except socketio.exceptions.ConnectionError:
+            self.stats.inc("connect_failed")
+            return
+        started = time.perf_counter()
+        await sio.emit(
+            "join",
+            {
+                "room": self.room,
+                "role": self.profile["listener_role"],
+                "want": want,
+                "caps": self.profile["caps"],
+            },
+        )
+        self.listeners.append(sio)
+
+    async def ramp(self):
+        interval = 1.0 / max(1e-6, self.profile["connect_rate_per_s"])
+        tasks = []
+        for _ in range(self.profile["listeners"]):
+            tasks.append(asyncio.create_task(self.start_listener()))
+            await asyncio.sleep(interval)
+        await asyncio.gather(*tasks)
+
+    async def churn(self, stop: asyncio.Event):
+        rate = self.profile["churn_per_s"]
+        while rate > 0 and not stop.is_set():
+            await asyncio.sleep(1.0 / rate)
+            if not self.listeners:
+                continue
+            sio = self.listeners.pop(random.randrange(len(self.listeners)))
+            await sio.disconnect()
+            self.stats.inc("churned")
+            asyncio.create_task(self.start_listener())
+
+    async def retune(self, stop: asyncio.Event):
+        rate = self.profile["update_meta_per_s"]
+        while rate > 0 and not stop.is_set():
+            await asyncio.sleep(1.0 / rate)
+            if not self.listeners or len(self.langs) < 2:
+                continue
+            sio = random.choice(self.listeners)
+            await sio.emit("update-meta", {"want": random.choices(self.langs, self.weights)[0]})
+            self.stats.inc("update_meta_sent")
+
+    async def run(self) -> dict:
+        for spec in self.profile["publishers"]:
+            await self.start_publisher(spec)
+        t0 = time.perf_counter()
+        await self.ramp()
+        ramp_s = time.perf_counter() - t0
+
+        stop = asyncio.Event()
+        background = [
+            asyncio.create_task(self.churn(stop)),
+            asyncio.create_task(self.retune(stop)),
+        ]
+        await asyncio.sleep(self.profile["hold_s"])
+        stop.set()
+        await asyncio.gather(*background)
+
+        for sio in self.listeners + self.publishers:
+            await sio.disconnect()
+        return {"ramp_s": round(ramp_s, 2), **self.stats.summary()}
+
+
+# =========================
+# Relatório e comparação
+# =========================
+def git_rev() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=HERE,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def _flatten(prefix: str, value, out: dict[str, float]):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{prefix}.{k}" if prefix else k, v, out)
+    elif isinstance(value, (int, float)):
+        out[prefix] = float(value)
+
+
+def compare(current: dict, baseline: dict, fail_over: float | None) -> bool:
+    """Imprime a variação de cada número; False se algum piorou além do limite."""
+    if baseline.get("profile", {}).get("version") != current["profile"]["version"]:
+        print("baseline com outra versão de perfil: comparação ignorada")
+        return True
+    cur: dict[str, float] = {}
+    base: dict[str, float] = {}
+    _flatten("", current["results"], cur)
+    _flatten("", baseline["results"], base)
+    ok = True
+    for key in sorted(cur.keys() & base.keys()):
+        if not base[key]:
+            continue
+        delta = (cur[key] - base[key]) / base[key] * 100
+        flag = ""
+        # latência, bytes e CPU: maior é pior
+        worse = any(s in key for s in ("latency_ms", "emitted", "cpu", "hub_lag"))
+        if fail_over is not None and worse and delta > fail_over:
+            flag = "  <-- regressão"
+            ok = False
+        print(f"{key:60s} {base[key]:>12.2f} -> {cur[key]:>12.2f} ({delta:+.1f}%){flag}")
+    return ok
+
+
+def add_server_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--url", default="http://127.0.0.1:5002")
+    parser.add_argument("--spawn", action="store_true", help="sobe o signal localmente")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--pid", type=int, help="pid do signal já rodando (CPU)")
+    parser.add_argument("--out", type=Path, default=HERE / "results")
+    parser.add_argument("--compare", type=Path, help="resultado anterior para comparar")
+    parser.add_argument("--fail-over", type=float, help="% de piora que falha a comparação")
+
+
+def run_measured(args, server_env: dict, make_run) -> tuple[dict, float]:
+    """
+    Roda `make_run(url)` (corrotina que devolve o dict de resultados) contra o
+    signal, acrescentando o que o servidor gastou: bytes/pacotes emitidos,
+    atraso do hub e CPU do worker.
+    """
+    server = None
+    url = args.url
+    if args.spawn:
+        server = spawn_signal(args.port, server_env)
+        url = f"http://127.0.0.1:{args.port}"
+    pid = server.pid if server else args.pid
+    worker = worker_process(pid) if pid else None
+
+    try:
+        before = scrape_metrics(url)
+        cpu_before = cpu_seconds(worker)
+        wall = time.perf_counter()
+        results = asyncio.run(make_run(url))
+        wall = time.perf_counter() - wall
+        after = scrape_metrics(url)
+        cpu_after = cpu_seconds(worker)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    results["server"] = {
+        "emitted_bytes": after.get("signal_emitted_bytes_total", 0)
+        - before.get("signal_emitted_bytes_total", 0),
+        "emitted_packets": after.get("signal_emitted_packets_total", 0)
+        - before.get("signal_emitted_packets_total", 0),
+        "hub_lag_ms": {
+            k.split('"')[1]: round(v * 1000, 2)
+            for k, v in after.items()
+            if k.startswith("signal_hub_lag_quantile_seconds{")
+        },
+    }
+    if cpu_before is not None and cpu_after is not None:
+        used = cpu_after - cpu_before
+        results["server"]["cpu_s"] = round(used, 2)
+        results["server"]["cpu_pct"] = round(used / wall * 100, 1)
+    return results, wall
+
+
+def save_report(args, profile: dict, results: dict, wall: float) -> int:
+    report = {
+        "profile": profile,
+        "git_rev": git_rev(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "wall_s": round(wall, 2),
+        "results": results,
+    }
+    args.out.mkdir(parents=True, exist_ok=True)
+    out_path = args.out / f"{profile['name']}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"resultado: {out_path}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        return 0 if compare(report, baseline, args.fail_over) else 1
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark do signal")
+    parser.add_argument("profile", type=Path)
+    add_server_args(parser)
+    args = parser.parse_args()
+
+    profile = load_profile(args.profile)
+    results, wall = run_measured(
+        args, profile["server_env"], lambda url: Bench(profile, url).run()
+    )
+    return save_report(args, profile, results, wall)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
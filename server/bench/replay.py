@@ -0,0 +1,199 @@
+"""
+Replay de um trace gravado pelo signal (SIGNAL_RECORD_DIR).
+
+Cada alias do trace vira um cliente python-socketio; os eventos são
+reenviados na ordem e no ritmo gravados (ou acelerados com --speed), com os
+`to` traduzidos para os sids reais do replay e SDP/candidatos sintéticos do
+tamanho/tipo gravado. Um `resume` é reenviado com o token que o signal do
+replay deu à sessão, e a desconexão anterior dela derruba só o transporte
+(sem o pacote de close), para a sessão ficar suspensa como na gravação.
+Mede o atraso do replay em relação ao cronograma e o que o signal gastou
+(como o bench.py), para comparar mudanças de roteamento e broadcast com
+sessões reais.
+
+Uso:
+  python replay.py traces/signal-20250101-120000.trace.gz --spawn
+  python replay.py trace.gz --spawn --speed 4 --compare results/<anterior>.json
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+
+import socketio
+
+from bench import (
+    Stats,
+    add_server_args,
+    fake_candidate,
+    fake_sdp,
+    run_measured,
+    save_report,
+)
+
+TRACE_VERSION = 2
+
+
+def load_trace(path: Path) -> tuple[dict, list[list]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        raise SystemExit(f"{path}: trace vazio")
+    header = json.loads(lines[0])
+    if header.get("v") != TRACE_VERSION:
+        raise SystemExit(f"{path}: versão de trace {header.get('v')} (esperada {TRACE_VERSION})")
+    events = []
+    for line in lines[1:]:
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue  # última linha truncada
+    return header, events
+
+
+def _candidates(typs: list, base: int = 0) -> list[dict]:
+    kinds = ("host", "srflx", "relay")
+    out = []
+    for i, typ in enumerate(typs):
+        cand = fake_candidate(base + i)
+        if typ in kinds:
+            cand["candidate"] = cand["candidate"].rsplit(" ", 1)[0] + f" {typ}"
+        out.append(cand)
+    return out
+
+
+class Replay:
+    def __init__(self, events: list[list], url: str, speed: float):
+        self.events = events
+        self.url = url
+        self.speed = max(0.01, speed)
+        self.stats = Stats()
+        self.clients: dict[str, asyncio.Task] = {}  # alias -> conexão
+        self.sids: dict[str, str] = {}  # alias -> sid real
+        self.tokens: dict[str, str] = {}  # alias da sessão -> token de resume
+        self.resumed = {
+            (item[3] if len(item) > 3 else {}).get("session")
+            for item in events
+            if item[1] == "resume"
+        }
+        self.pending: set[asyncio.Task] = set()
+
+    def _client(self, alias: str) -> asyncio.Task:
+        """
+        Conexão do alias. Quem já estava conectado quando a gravação começou
+        não tem `connect` no trace: o primeiro evento dele abre a conexão.
+        """
+        task = self.clients.get(alias)
+        if task is None:
+            task = self.clients[alias] = asyncio.create_task(self._connect(alias))
+        return task
+
+    async def _connect(self, alias: str) -> socketio.AsyncClient | None:
+        sio = socketio.AsyncClient(reconnection=False)
+        for event in ("rate-limited", "join-queued", "join-rejected", "resume-failed"):
+            sio.on(event, lambda *_, e=event: self.stats.inc(f"received.{e}"))
+
+        def on_session(data):
+            self.tokens[alias] = (data or {}).get("token")
+
+        sio.on("session", on_session)
+        try:
+            await sio.connect(self.url, socketio_path="signal", transports=["websocket"])
+        except socketio.exceptions.ConnectionError:
+            self.stats.inc("connect_failed")
+            return None
+        self.sids[alias] = sio.get_sid()
+        return sio
+
+    def _payload(self, event: str, payload: dict) -> dict:
+        data = {k: v for k, v in payload.items() if k not in ("to", "sdp_len", "typ", "typs")}
+        if "to" in payload:
+            data["to"] = self.sids.get(payload["to"], f"gone-{payload['to']}")
+        if event in ("offer", "answer"):
+            data[event] = fake_sdp(event, payload.get("sdp_len", 0))
+        elif event == "ice-candidate":
+            typ = payload.get("typ")
+            data["candidate"] = _candidates([typ])[0] if typ else None
+        elif event == "ice-candidates":
+            data["candidates"] = _candidates(payload.get("typs", []))
+        return data
+
+    async def _send(self, event: str, alias: str, payload: dict, scheduled: float):
+        if event == "disconnect":
+            task = self.clients.pop(alias, None)
+            sio = await task if task else None
+            if sio is not None:
+                if alias in self.resumed:
+                    await sio.eio.disconnect(abort=True)
+                else:
+                    await sio.disconnect()
+            return
+        sio = await self._client(alias)
+        if sio is None or event == "connect":
+            return
+        if event == "resume":
+            # daqui em diante os eventos da sessão saem por este socket
+            session = payload.get("session")
+            self.clients[session] = self.clients[alias]
+            await sio.emit("resume", {"token": self.tokens.get(session)})
+            self.stats.inc("sent.resume")
+            return
+        self.stats.observe("send_lag", (time.perf_counter() - scheduled) * 1000)
+        await sio.emit(event, self._payload(event, payload))
+        self.stats.inc(f"sent.{event}")
+
+    async def run(self) -> dict:
+        start = time.perf_counter()
+        for item in self.events:
+            t_ms, event, alias = item[0], item[1], item[2]
+            payload = item[3] if len(item) > 3 else {}
+            scheduled = start + t_ms / 1000 / self.speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(self._send(event, alias, payload, scheduled))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+        await asyncio.gather(*self.pending)
+
+        for task in set(self.clients.values()):
+            sio = await task
+            if sio is not None:
+                await sio.disconnect()
+        return {
+            "events": len(self.events),
+            "clients": len(self.sids),
+            **self.stats.summary(),
+        }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay de trace do signal")
+    parser.add_argument("trace", type=Path)
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = tempo real")
+    parser.add_argument("--server-env", default="{}", help="JSON de env para --spawn")
+    add_server_args(parser)
+    args = parser.parse_args()
+
+    header, events = load_trace(args.trace)
+    profile = {
+        "version": header["v"],
+        "name": f"replay-{args.trace.name.split('.')[0]}-x{args.speed:g}",
+        "trace": args.trace.name,
+        "trace_started_at": header.get("started_at"),
+        "speed": args.speed,
+    }
+    results, wall = run_measured(
+        args,
+        json.loads(args.server_env),
+        lambda url: Replay(events, url, args.speed).run(),
+    )
+    return save_report(args, profile, results, wall)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
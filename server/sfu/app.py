@@ -0,0 +1,545 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+from datetime import datetime
+
+import socketio
+from aiortc import (
+    RTCConfiguration,
+    RTCIceServer,
+    RTCPeerConnection,
+    RTCSessionDescription,
+)
+from aiortc.contrib.media import MediaRecorder, MediaRelay
+from aiortc.sdp import candidate_from_sdp
+
+# =========================
+# Logging
+# =========================
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+RESERVED_LOG_KEYS = set(
+    logging.LogRecord("", 0, "", 0, "", (), None).__dict__.keys()
+) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        extra = {k: v for k, v in record.__dict__.items() if k not in RESERVED_LOG_KEYS}
+        if extra:
+            payload.update(extra)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+root_logger = logging.getLogger()
+root_logger.handlers.clear()
+handler = logging.StreamHandler()
+if LOG_FORMAT == "json":
+    handler.setFormatter(JsonFormatter())
+else:
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s - %(message)s")
+    )
+root_logger.addHandler(handler)
+root_logger.setLevel(LOG_LEVEL)
+
+log = logging.getLogger("webrtc_sfu")
+
+# =========================
+# Config
+# =========================
+SIGNAL_URL = os.getenv("SIGNAL_URL", "http://signal:5002")
+SIGNAL_PATH = os.getenv("SIGNAL_PATH", "/signal")
+SFU_SECRET = os.getenv("SFU_SECRET", "")
+CAPS = ["ice-batch"]
+
+# Fallback HLS: playlists em HLS_DIR/{room}/{idioma}/index.m3u8, servidas pelo
+# gateway. Segmentos CMAF (fmp4) curtos mantêm a latência baixa.
+HLS_DIR = os.getenv("HLS_DIR", "/var/hls")
+HLS_SEGMENT_SECONDS = os.getenv("HLS_SEGMENT_SECONDS", "1")
+HLS_LIST_SIZE = os.getenv("HLS_LIST_SIZE", "6")
+_HLS_UNSAFE_RE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def _ice_servers() -> list[RTCIceServer]:
+    """SFU_ICE_SERVERS: JSON no formato do RTCIceServer do navegador."""
+    raw = os.getenv("SFU_ICE_SERVERS", "")
+    if not raw:
+        return []
+    return [
+        RTCIceServer(
+            urls=s["urls"], username=s.get("username"), credential=s.get("credential")
+        )
+        for s in json.loads(raw)
+    ]
+
+
+RTC_CONFIG = RTCConfiguration(iceServers=_ice_servers())
+
+sio = socketio.AsyncClient(reconnection=True, logger=False, engineio_logger=False)
+relay = MediaRelay()
+
+PUBLISHER_ROLES = {"speaker", "translator", "relay"}
+ANY = "*"
+
+
+class RoomState:
+    """
+    Estado do SFU numa room: recebe o áudio de cada publisher uma vez por
+    idioma e repassa (MediaRelay) a cada listener que quer aquele idioma.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.members: dict[str, dict] = {}
+        self.tracks: dict[str, object] = {}  # idioma -> track do publisher
+        self.track_owner: dict[str, str] = {}  # idioma -> sid do publisher
+        self.upstream: dict[str, RTCPeerConnection] = {}  # publisher sid -> pc
+        self.downstream: dict[str, tuple[RTCPeerConnection, str]] = {}  # listener -> (pc, idioma)
+        self.hls_langs: set[str] = set()  # idiomas pedidos via hls-start
+        self.recorders: dict[str, MediaRecorder] = {}  # idioma -> empacotador HLS
+
+
+rooms: dict[str, RoomState] = {}
+
+
+# =========================
+# Helpers
+# =========================
+def _first(values) -> str | None:
+    for v in values or []:
+        if isinstance(v, str) and v:
+            return v
+    return None
+
+
+def _publisher_language(meta: dict, member: dict) -> str:
+    """Idioma do áudio que o publisher envia (meta da oferta ou roster)."""
+    role = meta.get("from_role") or meta.get("role") or member.get("role")
+    if role == "speaker":
+        lang = (
+            meta.get("src")
+            or meta.get("source")
+            or member.get("source")
+            or _first(member.get("sources"))
+        )
+    else:
+        targets = [((p or {}).get("target") or {}).get("code") for p in member.get("pairs") or []]
+        lang = meta.get("tgt") or meta.get("target") or _first(targets)
+    return lang or ANY
+
+
+def _listener_track(state: RoomState, member: dict):
+    want = member.get("want")
+    if want and want in state.tracks:
+        return want, state.tracks[want]
+    if ANY in state.tracks:
+        return ANY, state.tracks[ANY]
+    if (not want or want == ANY) and len(state.tracks) == 1:
+        lang, track = next(iter(state.tracks.items()))
+        return lang, track
+    return None, None
+
+
+def _is_listener(member: dict) -> bool:
+    role = member.get("role")
+    return role not in PUBLISHER_ROLES and role not in ("admin", "sfu")
+
+
+def _is_webrtc_listener(member: dict) -> bool:
+    """Listeners entregues ao HLS não recebem oferta do SFU."""
+    return _is_listener(member) and member.get("transport") != "hls"
+
+
+def _hls_dir(room: str, lang: str) -> str:
+    return os.path.join(HLS_DIR, _HLS_UNSAFE_RE.sub("_", room), _HLS_UNSAFE_RE.sub("_", lang))
+
+
+def _hls_playlist(room: str, lang: str) -> str:
+    path = _hls_dir(room, lang)
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, "index.m3u8")
+
+
+def _remove_hls_dir(path: str):
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(path))  # a room fica vazia sem outro idioma
+    except OSError:
+        pass
+
+
+async def _remove_hls_later(room: str, lang: str):
+    """
+    Apaga os segmentos de um idioma parado depois de a playlist ter saído das
+    caches (duração da janela), a menos que o HLS tenha voltado.
+    """
+    await asyncio.sleep(float(HLS_SEGMENT_SECONDS) * int(HLS_LIST_SIZE))
+    state = rooms.get(room)
+    if state is not None and lang in state.recorders:
+        return
+    await asyncio.to_thread(_remove_hls_dir, _hls_dir(room, lang))
+    log.info("hls_removed", extra={"event": "hls", "room": room, "lang": lang})
+
+
+async def _start_hls(state: RoomState, lang: str):
+    """Empacota a track do idioma em HLS (uma vez por room/idioma)."""
+    track = state.tracks.get(lang)
+    if track is None or lang in state.recorders:
+        return
+    recorder = MediaRecorder(
+        _hls_playlist(state.name, lang),
+        format="hls",
+        options={
+            "hls_time": HLS_SEGMENT_SECONDS,
+            "hls_list_size": HLS_LIST_SIZE,
+            "hls_segment_type": "fmp4",
+            "hls_flags": "delete_segments+independent_segments+omit_endlist",
+        },
+    )
+    recorder.addTrack(relay.subscribe(track))
+    state.recorders[lang] = recorder
+    await recorder.start()
+    log.info("hls_started", extra={"event": "hls", "room": state.name, "lang": lang})
+
+
+async def _stop_hls(state: RoomState, lang: str):
+    recorder = state.recorders.pop(lang, None)
+    if recorder is None:
+        return
+    try:
+        await recorder.stop()
+    except Exception:
+        log.debug("hls_stop_failed", exc_info=True)
+    asyncio.create_task(_remove_hls_later(state.name, lang))
+    log.info("hls_stopped", extra={"event": "hls", "room": state.name, "lang": lang})
+
+
+async def _close(pc: RTCPeerConnection):
+    try:
+        await pc.close()
+    except Exception:
+        log.debug("pc_close_failed", exc_info=True)
+
+
+async def _drop_downstream(state: RoomState, sid: str):
+    entry = state.downstream.pop(sid, None)
+    if entry:
+        await _close(entry[0])
+
+
+async def _drop_upstream(state: RoomState, sid: str):
+    pc = state.upstream.pop(sid, None)
+    if pc:
+        await _close(pc)
+    for lang in [code for code, owner in state.track_owner.items() if owner == sid]:
+        state.track_owner.pop(lang, None)
+        state.tracks.pop(lang, None)
+        await _stop_hls(state, lang)
+        for listener, (_, served) in list(state.downstream.items()):
+            if served == lang:
+                await _drop_downstream(state, listener)
+
+
+async def _close_room(name: str):
+    state = rooms.pop(name, None)
+    if not state:
+        return
+    for sid in list(state.downstream):
+        await _drop_downstream(state, sid)
+    for sid in list(state.upstream):
+        await _drop_upstream(state, sid)
+    log.info("room_detached", extra={"event": "detach", "room": name})
+
+
+async def _offer_listener(state: RoomState, sid: str):
+    member = state.members.get(sid)
+    if not member or sid in state.downstream:
+        return
+    lang, track = _listener_track(state, member)
+    if track is None:
+        return
+
+    pc = RTCPeerConnection(RTC_CONFIG)
+    state.downstream[sid] = (pc, lang)
+
+    @pc.on("connectionstatechange")
+    async def _on_state():
+        if pc.connectionState in ("failed", "closed"):
+            if state.downstream.get(sid, (None,))[0] is pc:
+                await _drop_downstream(state, sid)
+
+    pc.addTrack(relay.subscribe(track))
+    offer = await pc.createOffer()
+    await pc.setLocalDescription(offer)
+    # track "*" (publisher sem idioma declarado) serve o idioma que o ouvinte
+    # pediu: o app rejeita ofertas cujo tgt difere do seu idioma de áudio
+    tgt = member.get("want") if lang == ANY and member.get("want") else lang
+    await sio.emit(
+        "offer",
+        {
+            "room": state.name,
+            "to": sid,
+            "sdp": pc.localDescription.sdp,
+            "type": pc.localDescription.type,
+            "meta": {"from_role": "sfu", "src": tgt, "tgt": tgt},
+        },
+    )
+    log.info(
+        "listener_offered",
+        extra={"event": "offer", "room": state.name, "to": sid, "lang": lang},
+    )
+
+
+async def _serve_listeners(state: RoomState):
+    for sid, member in list(state.members.items()):
+        if _is_webrtc_listener(member) and sid not in state.downstream:
+            await _offer_listener(state, sid)
+
+
+async def _apply_roster(state: RoomState, members: list[dict], replace: bool):
+    if replace:
+        gone = set(state.members) - {m.get("id") for m in members}
+        state.members = {}
+        for sid in gone:
+            await _drop_downstream(state, sid)
+            await _drop_upstream(state, sid)
+    for m in members:
+        if m.get("id") and m.get("id") != sio.get_sid():
+            state.members[m["id"]] = m
+            if m.get("transport") == "hls":
+                await _drop_downstream(state, m["id"])
+
+
+async def _remove_member(state: RoomState, sid: str):
+    state.members.pop(sid, None)
+    await _drop_downstream(state, sid)
+    await _drop_upstream(state, sid)
+
+
+async def _after_roster_change(state: RoomState):
+    if not state.members:
+        await sio.emit("leave", {"room": state.name})
+        await _close_room(state.name)
+        return
+    await _serve_listeners(state)
+
+
+def _parse_candidate(cand):
+    if isinstance(cand, str):
+        cand = {"candidate": cand}
+    if not isinstance(cand, dict) or not cand.get("candidate"):
+        return None
+    text = cand["candidate"]
+    if text.startswith("candidate:"):
+        text = text[len("candidate:"):]
+    ice = candidate_from_sdp(text)
+    ice.sdpMid = cand.get("sdpMid")
+    ice.sdpMLineIndex = cand.get("sdpMLineIndex")
+    return ice
+
+
+async def _add_candidates(data: dict, candidates: list):
+    state = rooms.get(data.get("room"))
+    sender = data.get("from")
+    if not state or not sender:
+        return
+    pc = state.upstream.get(sender) or state.downstream.get(sender, (None,))[0]
+    if pc is None:
+        return
+    for cand in candidates:
+        ice = _parse_candidate(cand)
+        if ice is None:
+            continue
+        try:
+            await pc.addIceCandidate(ice)
+        except Exception:
+            log.debug("ice_candidate_rejected", exc_info=True)
+
+
+# =========================
+# Signal events
+# =========================
+@sio.event
+async def connect():
+    for name in list(rooms):
+        await _close_room(name)
+    await sio.emit("sfu-register", {"secret": SFU_SECRET})
+    log.info("signal_connected", extra={"event": "connect", "url": SIGNAL_URL})
+
+
+@sio.on("sfu-registered")
+async def on_registered(data):
+    if not (data or {}).get("ok"):
+        log.error("sfu_register_rejected", extra={"event": "sfu-register"})
+        return
+    log.info("sfu_registered", extra={"event": "sfu-register", "sid": data.get("id")})
+
+
+@sio.on("sfu-attach")
+async def on_attach(data):
+    name = (data or {}).get("room")
+    if not name or name in rooms:
+        return
+    rooms[name] = RoomState(name)
+    await sio.emit("join", {"room": name, "role": "sfu", "caps": CAPS})
+    log.info("room_attached", extra={"event": "attach", "room": name})
+
+
+@sio.on("hls-start")
+async def on_hls_start(data):
+    state = rooms.get((data or {}).get("room"))
+    lang = (data or {}).get("lang")
+    if not state or not lang:
+        return
+    state.hls_langs.add(lang)
+    await _start_hls(state, lang)
+
+
+@sio.on("room-info")
+async def on_room_info(data):
+    state = rooms.get((data or {}).get("room"))
+    if not state or data.get("unchanged"):
+        return
+    await _apply_roster(state, data.get("members") or [], replace=True)
+    await _after_roster_change(state)
+
+
+@sio.on("roster-delta")
+async def on_roster_delta(data):
+    state = rooms.get((data or {}).get("room"))
+    if not state:
+        return
+    for change in data.get("changes") or []:
+        member = change.get("member") or {}
+        if change.get("type") == "removed":
+            await _remove_member(state, member.get("id"))
+        else:
+            await _apply_roster(state, [member], replace=False)
+    await _after_roster_change(state)
+
+
+async def _on_member_delta(kind: str, data: dict):
+    await on_roster_delta(
+        {"room": data.get("room"), "changes": [{"type": kind, "member": data.get("member")}]}
+    )
+
+
+@sio.on("member-added")
+async def on_member_added(data):
+    await _on_member_delta("added", data or {})
+
+
+@sio.on("member-updated")
+async def on_member_updated(data):
+    await _on_member_delta("updated", data or {})
+
+
+@sio.on("member-removed")
+async def on_member_removed(data):
+    await _on_member_delta("removed", data or {})
+
+
+@sio.on("offer")
+async def on_offer(data):
+    """Publisher (speaker/tradutor) enviando áudio ao SFU."""
+    state = rooms.get((data or {}).get("room"))
+    sender = (data or {}).get("from")
+    sdp = data.get("sdp") or (data.get("offer") or {}).get("sdp")
+    if not state or not sender or not sdp:
+        return
+
+    await _drop_upstream(state, sender)
+    member = state.members.get(sender, {})
+    lang = _publisher_language(data.get("meta") or {}, member)
+
+    pc = RTCPeerConnection(RTC_CONFIG)
+    state.upstream[sender] = pc
+
+    @pc.on("track")
+    def _on_track(track):
+        if track.kind != "audio":
+            return
+        state.tracks[lang] = track
+        state.track_owner[lang] = sender
+        log.info(
+            "publisher_track",
+            extra={"event": "track", "room": state.name, "sid": sender, "lang": lang},
+        )
+        asyncio.ensure_future(_serve_listeners(state))
+        if lang in state.hls_langs:
+            asyncio.ensure_future(_start_hls(state, lang))
+
+    @pc.on("connectionstatechange")
+    async def _on_state():
+        if pc.connectionState in ("failed", "closed"):
+            if state.upstream.get(sender) is pc:
+                await _drop_upstream(state, sender)
+
+    await pc.setRemoteDescription(RTCSessionDescription(sdp=sdp, type="offer"))
+    answer = await pc.createAnswer()
+    await pc.setLocalDescription(answer)
+    await sio.emit(
+        "answer",
+        {
+            "room": state.name,
+            "to": sender,
+            "sdp": pc.localDescription.sdp,
+            "type": pc.localDescription.type,
+            "meta": {"from_role": "sfu"},
+        },
+    )
+
+
+@sio.on("answer")
+async def on_answer(data):
+    """Listener respondendo à oferta do SFU."""
+    state = rooms.get((data or {}).get("room"))
+    if state is None:
+        # o listener responde na room em que está; procura pelo remetente
+        state = next(
+            (s for s in rooms.values() if data.get("from") in s.downstream), None
+        )
+    sender = (data or {}).get("from")
+    if not state or sender not in state.downstream:
+        return
+    pc = state.downstream[sender][0]
+    sdp = data.get("sdp") or (data.get("answer") or {}).get("sdp")
+    if not sdp or pc.signalingState != "have-local-offer":
+        return
+    await pc.setRemoteDescription(RTCSessionDescription(sdp=sdp, type="answer"))
+
+
+@sio.on("ice-candidate")
+async def on_ice_candidate(data):
+    await _add_candidates(data or {}, [(data or {}).get("candidate")])
+
+
+@sio.on("ice-candidates")
+async def on_ice_candidates(data):
+    await _add_candidates(data or {}, (data or {}).get("candidates") or [])
+
+
+# =========================
+# Main
+# =========================
+async def main():
+    if not SFU_SECRET:
+        raise SystemExit("SFU_SECRET não definido")
+    log.info("starting_sfu", extra={"signal_url": SIGNAL_URL, "log_level": LOG_LEVEL})
+    await sio.connect(SIGNAL_URL, socketio_path=SIGNAL_PATH, transports=["websocket"])
+    await sio.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
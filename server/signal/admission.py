@@ -0,0 +1,163 @@
+"""
+Controle de admissão de joins por room.
+
+No início de uma palestra centenas de listeners entram ao mesmo tempo e cada
+join vira peer-joined/roster-delta para os publishers, que então negociam com
+todos de uma vez. Aqui cada room tem um token bucket (`rate` joins/s, rajada
+`burst`): o que passa do limite espera numa fila e é liberado no ritmo do
+bucket, então os publishers recebem os novos listeners de forma cadenciada.
+Quem está na fila recebe `join-queued` com a posição e uma estimativa.
+Um bucket cheio de uma room sem fila é igual a nenhum, então esses são
+descartados de tempos em tempos.
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Any, Callable
+
+from metrics import EventLogger
+
+log = EventLogger(logging.getLogger("webrtc_signaling.admission"))
+
+
+class JoinAdmission:
+    def __init__(
+        self,
+        socketio,
+        release: Callable[[str, dict], None],
+        rate_per_s: float = 20.0,
+        burst: int = 40,
+        max_queue: int = 5000,
+        update_every_s: float = 1.0,
+        prune_every_s: float = 60.0,
+    ):
+        self.socketio = socketio
+        self.release = release
+        self.rate = max(0.0, rate_per_s)
+        self.burst = max(1, burst)
+        self.max_queue = max_queue
+        self.update_every = update_every_s
+        self.prune_every = prune_every_s
+        self.pruned_at = time.monotonic()
+        # room -> [tokens, último refill]
+        self.buckets: dict[str, list[float]] = {}
+        # room -> fila de (sid, data); quem saiu antes da vez some de `waiting`
+        self.queues: dict[str, deque[tuple[str, dict[str, Any]]]] = {}
+        self.waiting: dict[str, set[str]] = {}  # sid -> rooms em espera
+        self.draining: set[str] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _take(self, room: str) -> bool:
+        now = time.monotonic()
+        bucket = self.buckets.setdefault(room, [float(self.burst), now])
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+        return False
+
+    def admit(self, room: str, sid: str, data: dict[str, Any]) -> bool:
+        """
+        True: o join segue agora. False: ficou na fila (ou foi recusado) e
+        será liberado por `release(sid, data)`.
+        """
+        if time.monotonic() - self.pruned_at >= self.prune_every:
+            self.prune()
+        queue = self.queues.get(room)
+        if not queue and self._take(room):
+            return True
+
+        if self.is_waiting(sid, room):
+            return False
+        if queue is not None and len(queue) >= self.max_queue:
+            self.socketio.emit(
+                "join-rejected",
+                {"room": room, "reason": "busy", "retry_ms": self._eta_ms(len(queue))},
+                to=sid,
+            )
+            return False
+
+        queue = self.queues.setdefault(room, deque())
+        queue.append((sid, data))
+        self.waiting.setdefault(sid, set()).add(room)
+        self.socketio.emit(
+            "join-queued",
+            {"room": room, "position": len(queue), "eta_ms": self._eta_ms(len(queue))},
+            to=sid,
+        )
+        if room not in self.draining:
+            self.draining.add(room)
+            self.socketio.start_background_task(self._drain, room)
+        return False
+
+    def _eta_ms(self, position: int) -> int:
+        return int(position / self.rate * 1000) if self.rate else 0
+
+    def _drain(self, room: str):
+        queue = self.queues[room]
+        last_update = time.monotonic()
+        try:
+            while queue:
+                if not self._take(room):
+                    self.socketio.sleep(1.0 / self.rate)
+                    continue
+                sid, data = queue.popleft()
+                if not self.is_waiting(sid, room):
+                    self._refund(room)
+                    continue
+                self.drop(sid, room)
+                try:
+                    self.release(sid, data)
+                except Exception:
+                    log.exception("join_release_failed", extra={"sid": sid, "room": room})
+
+                if time.monotonic() - last_update >= self.update_every:
+                    last_update = time.monotonic()
+                    self._send_positions(room, queue)
+        finally:
+            self.draining.discard(room)
+            if not queue:
+                self.queues.pop(room, None)
+
+    def prune(self):
+        """Descarta os buckets já recarregados de rooms sem fila."""
+        now = self.pruned_at = time.monotonic()
+        for room, (tokens, last) in list(self.buckets.items()):
+            if room not in self.queues and tokens + (now - last) * self.rate >= self.burst:
+                del self.buckets[room]
+
+    def _refund(self, room: str):
+        bucket = self.buckets.get(room)
+        if bucket is not None:
+            bucket[0] = min(self.burst, bucket[0] + 1)
+
+    def _send_positions(self, room: str, queue: deque):
+        position = 0
+        for sid, _ in queue:
+            if not self.is_waiting(sid, room):
+                continue
+            position += 1
+            self.socketio.emit(
+                "join-queued",
+                {"room": room, "position": position, "eta_ms": self._eta_ms(position)},
+                to=sid,
+            )
+
+    def drop(self, sid: str, room: str | None = None):
+        """Tira o sid da fila (leave/disconnect antes de ser admitido)."""
+        if room is None:
+            self.waiting.pop(sid, None)
+            return
+        rooms = self.waiting.get(sid)
+        if rooms is not None:
+            rooms.discard(room)
+            if not rooms:
+                self.waiting.pop(sid, None)
+
+    def is_waiting(self, sid: str, room: str) -> bool:
+        return room in self.waiting.get(sid, ())
@@ -1,13 +1,53 @@
+import atexit
+import functools
+import gc
 import json
 import logging
 import os
 import re
-from collections import defaultdict
-from datetime import datetime
-from typing import Any
-
-from flask import Flask, jsonify, request
-from flask_socketio import SocketIO, emit, join_room, leave_room
+import secrets
+import time
+import tracemalloc
+import zlib
+
+from eventlet import tpool
+from flask import Flask, Response, jsonify, request
+from flask_socketio import SocketIO, disconnect, emit, join_room, leave_room
+
+from admission import JoinAdmission
+from broadcast import RosterBroadcaster
+from hub_monitor import HubMonitor
+from ice_batch import IceBatcher, supports_ice_batch
+from log_pipeline import (
+    DEFAULT_SAMPLES,
+    Lazy,
+    SamplingFilter,
+    parse_sample_rates,
+    start_async_logging,
+)
+from member_meta import clean_client_meta
+from metrics import EventLogger, Registry
+from negotiation_timing import TTFA_BUCKETS, NegotiationTimer
+from offer_cache import OfferCache
+from presence import make_presence
+from qos import BitrateAdvisor, QosAggregator, parse_ladder
+from rate_limit import DEFAULT_LIMITS, RateLimiter, parse_limits
+from relay_tree import RelayTree, children_of
+from roster_view import (
+    ANY,
+    OBSERVER_ROLES,
+    PUBLISHER_ROLES,
+    SFU_ROLE,
+    audience_keys,
+    served_languages,
+    view_keys,
+    view_room,
+    viewer_kind,
+    visible_keys,
+    wanted_language,
+)
+from state_journal import StateJournal
+from traffic_recorder import TrafficRecorder
 
 # =========================
 # Logging
@@ -15,6 +55,12 @@ from flask_socketio import SocketIO, emit, join_room, leave_room
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
 ENGINEIO_LOGS = os.getenv("ENGINEIO_LOGS", "0") == "1"
+# LOG_ASYNC=1 formata e escreve os logs numa thread fora do hub (fila de até
+# LOG_QUEUE_MAX registros; o excedente é descartado e contado no /metrics).
+# LOG_SAMPLE: fração emitida de cada evento DEBUG/INFO de alto volume.
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", DEFAULT_SAMPLES)
 
 RESERVED_LOG_KEYS = {
     "name",
@@ -43,7 +89,8 @@ RESERVED_LOG_KEYS = {
 class JsonFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
         payload = {
-            "ts": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            # instante do evento, não o da escrita (que pode vir depois)
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(record.created)),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
@@ -63,13 +110,59 @@ else:
     handler.setFormatter(
         logging.Formatter("%(asctime)s %(levelname)s %(name)s - %(message)s")
     )
+log_sampler = SamplingFilter(parse_sample_rates(LOG_SAMPLE))
+handler.addFilter(log_sampler)
+log_queue_handler = None
+if LOG_ASYNC:
+    log_queue_handler, stop_log_writer = start_async_logging(handler, LOG_QUEUE_MAX)
+    handler = log_queue_handler
+    atexit.register(stop_log_writer)
 root_logger.addHandler(handler)
 root_logger.setLevel(LOG_LEVEL)
 
-log = logging.getLogger("webrtc_signaling")
+log = EventLogger(logging.getLogger("webrtc_signaling"))
+
+# =========================
+# Métricas (/metrics)
+# =========================
+metrics = Registry()
+handler_seconds = metrics.histogram(
+    "signal_handler_seconds", "Duração dos handlers Socket.IO", ("event",)
+)
+log_events_total = metrics.counter(
+    "signal_log_events_total", "Eventos de log por nome e nível", ("name", "level")
+)
+emitted_packets_total = metrics.counter(
+    "signal_emitted_packets_total", "Pacotes Engine.IO enviados aos clientes"
+)
+emitted_bytes_total = metrics.counter(
+    "signal_emitted_bytes_total", "Bytes (caracteres, em texto) enviados aos clientes"
+)
+EventLogger.counter = log_events_total
 
 app = Flask(__name__)
-socketio_logger = log if ENGINEIO_LOGS else False
+socketio_logger = log.logger if ENGINEIO_LOGS else False
+
+# =========================
+# Presença / multi-nó
+# =========================
+# PRESENCE_URL vazio mantém rooms/meta em memória (single-worker).
+# Com "redis://..." o estado é compartilhado e MESSAGE_QUEUE_URL faz os
+# emits para rooms atravessarem workers/nós.
+PRESENCE_URL = os.getenv("PRESENCE_URL", "")
+MESSAGE_QUEUE_URL = os.getenv("MESSAGE_QUEUE_URL") or None
+# Heartbeat do nó no backend compartilhado: um nó que fica PRESENCE_NODE_TTL_S
+# sem renovar é dado como morto e os sids dele são removidos pelos demais.
+PRESENCE_NODE_TTL_S = float(os.getenv("PRESENCE_NODE_TTL_S", "30"))
+
+# Formato dos pacotes Socket.IO: "json" (padrão) ou "msgpack" (binário; os
+# clientes precisam usar o socket.io-msgpack-parser). Publicado em
+# /signal-config para o cliente escolher o parser.
+SIGNAL_SERIALIZER = os.getenv("SIGNAL_SERIALIZER", "json").lower()
+SERIALIZERS = {"json": "default", "msgpack": "msgpack"}
+if SIGNAL_SERIALIZER not in SERIALIZERS:
+    raise ValueError(f"SIGNAL_SERIALIZER não suportado: {SIGNAL_SERIALIZER}")
+
 socketio = SocketIO(
     app,
     cors_allowed_origins="*",
@@ -77,16 +170,186 @@ socketio = SocketIO(
     logger=False,
     engineio_logger=socketio_logger,
     path="/signal",
+    message_queue=MESSAGE_QUEUE_URL,
+    serializer=SERIALIZERS[SIGNAL_SERIALIZER],
+)
+
+presence = make_presence(PRESENCE_URL)
+
+# Janela (ms) em que mudanças do roster de uma room viram um único emit.
+ROSTER_COALESCE_MS = int(os.getenv("ROSTER_COALESCE_MS", "100"))
+roster_broadcaster = RosterBroadcaster(socketio, presence, ROSTER_COALESCE_MS)
+
+# Micro-batching de ICE por par (from, to) para destinos com "ice-batch".
+ICE_BATCH_MS = int(os.getenv("ICE_BATCH_MS", "20"))
+ICE_BATCH_MAX = int(os.getenv("ICE_BATCH_MAX", "32"))
+ice_batcher = IceBatcher(socketio, ICE_BATCH_MS, ICE_BATCH_MAX)
+
+# Último offer broadcast de cada publisher (com os ICE seguintes), entregue
+# na hora a quem entra depois. OFFER_CACHE_TTL_S=0 desativa.
+OFFER_CACHE_TTL_S = float(os.getenv("OFFER_CACHE_TTL_S", "300"))
+OFFER_CACHE_MAX_CANDIDATES = int(os.getenv("OFFER_CACHE_MAX_CANDIDATES", "32"))
+offer_cache = OfferCache(OFFER_CACHE_TTL_S, OFFER_CACHE_MAX_CANDIDATES)
+
+# QoS reportada pelos listeners: ring buffer de QOS_SAMPLES amostras por
+# (room, idioma); acima dos limites o listener é sinalizado aos publishers.
+QOS_SAMPLES = int(os.getenv("QOS_SAMPLES", "512"))
+QOS_MAX_LOSS = float(os.getenv("QOS_MAX_LOSS", "0.05"))
+QOS_MAX_JITTER_MS = float(os.getenv("QOS_MAX_JITTER_MS", "50"))
+QOS_MAX_RTT_MS = float(os.getenv("QOS_MAX_RTT_MS", "500"))
+qos = QosAggregator(QOS_SAMPLES, QOS_MAX_LOSS, QOS_MAX_JITTER_MS, QOS_MAX_RTT_MS)
+
+# bitrate-hint: degrau (kbps/ptime do Opus) sugerido aos publishers de cada
+# canal conforme a fração de listeners degradados. BITRATE_LADDER vazio desativa.
+BITRATE_LADDER = os.getenv("BITRATE_LADDER", "16/60,24/40,32/20,48/20,64/20")
+BITRATE_DEGRADED_RATIO = float(os.getenv("BITRATE_DEGRADED_RATIO", "0.2"))
+BITRATE_HEALTHY_RATIO = float(os.getenv("BITRATE_HEALTHY_RATIO", "0.05"))
+BITRATE_MIN_LISTENERS = int(os.getenv("BITRATE_MIN_LISTENERS", "1"))
+BITRATE_HINT_INTERVAL_S = float(os.getenv("BITRATE_HINT_INTERVAL_S", "10"))
+bitrate_advisor = BitrateAdvisor(
+    parse_ladder(BITRATE_LADDER),
+    BITRATE_DEGRADED_RATIO,
+    BITRATE_HEALTHY_RATIO,
+    BITRATE_MIN_LISTENERS,
+    BITRATE_HINT_INTERVAL_S,
+)
+bitrate_hints_total = metrics.counter(
+    "signal_bitrate_hints_total", "bitrate-hint emitidos por motivo", ("reason",)
+)
+
+# Time-to-first-audio: join -> 1º offer -> answer -> "connected" reportado
+# pelo cliente (negotiation-state), por room e idioma. Quem não conecta em
+# NEGOTIATION_TIMEOUT_S conta como timeout.
+NEGOTIATION_TIMEOUT_S = float(os.getenv("NEGOTIATION_TIMEOUT_S", "60"))
+negotiation_timer = NegotiationTimer(
+    metrics.histogram(
+        "signal_ttfa_seconds",
+        "Tempo desde o join do listener até cada etapa da negociação",
+        ("room", "lang", "stage"),
+        TTFA_BUCKETS,
+    ),
+    metrics.counter(
+        "signal_negotiations_total", "Negociações de listeners por desfecho", ("outcome",)
+    ),
+    NEGOTIATION_TIMEOUT_S,
+)
+
+# Envelope enxuto: meta do remetente só na 1ª mensagem de cada par (from, to).
+RELAY_SLIM_META = os.getenv("RELAY_SLIM_META", "1") == "1"
+FULL_META_CAP = "full-meta"
+_peer_sessions: dict[str, dict[str, list]] = {}  # from -> {to: [rev, full]}
+_peer_sessions_by_to: dict[str, set[str]] = {}  # to -> {from, ...}
+
+# SFU: com SFU_SECRET definido, serviços SFU registrados (sfu-register) são
+# anexados às rooms e passam a negociar com os listeners no lugar dos
+# publishers.
+SFU_SECRET = os.getenv("SFU_SECRET", "")
+SFU_NODES = "sfu::nodes"
+
+# Papéis privilegiados: publishers e observers entram sem passar pela admissão
+# e enxergam a audiência, então exigem o JWT do serviço user no connect
+# (`auth: {token}` ou Authorization); observers precisam do papel "admin" no
+# token. PUBLISHER_AUTH=0 desativa (bench, desenvolvimento local).
+PUBLISHER_AUTH = os.getenv("PUBLISHER_AUTH", "1") == "1"
+_principals: dict[str, set[str]] = {}  # socket autenticado -> papéis do JWT
+
+# Fallback HLS: com HLS_BASE_URL definido e um SFU na room, listeners além de
+# HLS_LISTENER_THRESHOLD recebem `hls-redirect` em vez de um peer WebRTC. O
+# SFU empacota o áudio de cada idioma em segmentos CMAF servidos pelo gateway.
+HLS_BASE_URL = os.getenv("HLS_BASE_URL", "").rstrip("/")
+HLS_LISTENER_THRESHOLD = int(os.getenv("HLS_LISTENER_THRESHOLD", "200"))
+HLS_TRANSPORT = "hls"
+
+# Árvore de relay: sem SFU na room, cada canal de idioma vira uma árvore em
+# que o publisher alimenta RELAY_TREE_FANOUT listeners e cada listener
+# reencaminha para até `relay_capacity` (declarado pelo cliente) outros.
+RELAY_TREE = os.getenv("RELAY_TREE", "0") == "1"
+RELAY_TREE_FANOUT = int(os.getenv("RELAY_TREE_FANOUT", "4"))
+# (room, lang) -> árvore do canal neste nó; entradas e saídas de listeners só
+# mexem na vaga afetada, o resto (publisher, meta, divergência) refaz do zero
+_relay_trees: dict[tuple[str, str], RelayTree] = {}
+
+# Retomada de sessão: no join o cliente recebe um token; se a conexão cai, o
+# membro fica "suspenso" por RESUME_GRACE_MS (sem broadcasts) e um `resume`
+# com o token devolve rooms, canais e meta ao novo socket. 0 desativa.
+RESUME_GRACE_MS = int(os.getenv("RESUME_GRACE_MS", "30000"))
+_CLIENT_DISCONNECT = "client disconnect"
+_kicked: set[str] = set()  # sockets derrubados pelo servidor: não suspendem
+# socket vivo <-> sid da sessão retomada (só neste nó: a conexão é local)
+_live_sessions: dict[str, str] = {}
+_session_live: dict[str, str] = {}
+
+# Warm restart (presença local): a cada SIGNAL_SNAPSHOT_S as mudanças da
+# presença vão para um journal em disco (serializadas e gravadas numa thread
+# fora do hub); no boot os sids voltam suspensos e os clientes os retomam com
+# `resume`, sem a rodada de joins/broadcasts de uma room vazia.
+SIGNAL_STATE_PATH = os.getenv("SIGNAL_STATE_PATH", "")
+SIGNAL_SNAPSHOT_S = float(os.getenv("SIGNAL_SNAPSHOT_S", "10"))
+SIGNAL_STATE_MAX_BYTES = int(os.getenv("SIGNAL_STATE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Admissão de joins: listeners entram em cada room a no máximo
+# JOIN_RATE_PER_S por segundo (rajada JOIN_BURST); o excedente espera numa
+# fila e os publishers recebem os novos membros de forma cadenciada.
+JOIN_RATE_PER_S = float(os.getenv("JOIN_RATE_PER_S", "20"))
+JOIN_BURST = int(os.getenv("JOIN_BURST", "40"))
+JOIN_QUEUE_MAX = int(os.getenv("JOIN_QUEUE_MAX", "5000"))
+
+# Limites por evento (token bucket por sid e, multiplicado por
+# RATE_LIMIT_IP_FACTOR, por IP). Publishers têm os limites multiplicados por
+# RATE_LIMIT_PUBLISHER_FACTOR (mandam offer/ICE a cada listener novo) e o SFU
+# não é limitado. O excedente é só descartado; RATE_LIMIT_STRIKES > 0 (opt-in)
+# desconecta o sid depois de tantos descartes. RATE_LIMITS vazio desativa.
+RATE_LIMITS = os.getenv("RATE_LIMITS", DEFAULT_LIMITS)
+RATE_LIMIT_IP_FACTOR = float(os.getenv("RATE_LIMIT_IP_FACTOR", "50"))
+RATE_LIMIT_PUBLISHER_FACTOR = float(os.getenv("RATE_LIMIT_PUBLISHER_FACTOR", "20"))
+RATE_LIMIT_STRIKES = int(os.getenv("RATE_LIMIT_STRIKES", "0"))
+rate_limiter = RateLimiter(
+    parse_limits(RATE_LIMITS), RATE_LIMIT_IP_FACTOR, RATE_LIMIT_STRIKES
 )
+_rate_exempt: set[str] = set()  # sockets de SFU registrados neste nó
+_rate_scale: dict[str, float] = {}  # sockets de publishers neste nó
+
+# Monitor do hub: mede o atraso de agendamento a cada HUB_LAG_INTERVAL_MS,
+# avisa (`hub_lag`) acima de HUB_LAG_WARN_MS e loga (`slow_handler`) handlers
+# que passam de SLOW_HANDLER_MS. HUB_STALL_MS > 0 liga a thread que captura a
+# pilha de quem trava o hub por mais que isso.
+HUB_LAG_INTERVAL_MS = int(os.getenv("HUB_LAG_INTERVAL_MS", "100"))
+HUB_LAG_WARN_MS = int(os.getenv("HUB_LAG_WARN_MS", "100"))
+SLOW_HANDLER_MS = int(os.getenv("SLOW_HANDLER_MS", "50"))
+HUB_STALL_MS = int(os.getenv("HUB_STALL_MS", "0"))
+hub_monitor = HubMonitor(
+    socketio,
+    HUB_LAG_INTERVAL_MS / 1000.0,
+    HUB_LAG_WARN_MS / 1000.0,
+    histogram=metrics.histogram("signal_hub_lag_seconds", "Atraso de agendamento do hub"),
+)
+
+# Gravação opt-in do tráfego de entrada (sids anonimizados, sem SDP/ICE) em
+# SIGNAL_RECORD_DIR, para replay com server/bench/replay.py. Para ao passar
+# de SIGNAL_RECORD_MAX_BYTES.
+SIGNAL_RECORD_DIR = os.getenv("SIGNAL_RECORD_DIR", "")
+SIGNAL_RECORD_MAX_BYTES = int(os.getenv("SIGNAL_RECORD_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Limites do meta aceito dos clientes (pares de idioma e capacidades) e
+# rastreamento de alocações para o /memory (MEMORY_TRACE_FRAMES > 0 liga o
+# tracemalloc, que tem custo: só para investigação).
+META_MAX_PAIRS = int(os.getenv("META_MAX_PAIRS", "16"))
+META_MAX_CAPS = int(os.getenv("META_MAX_CAPS", "16"))
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "0"))
 
-room_members: dict[str, set[str]] = defaultdict(set)  # room -> {sid, ...}
-sid_rooms: dict[str, set[str]] = defaultdict(set)  # sid  -> {room, ...}
-sid_meta: dict[str, dict[str, Any]] = defaultdict(dict)
+# Cache do payload público por sid, válido enquanto a revisão do meta
+# (`_rev`, incrementada a cada gravação) não muda.
+MEMBER_CACHE_MAX = int(os.getenv("MEMBER_CACHE_MAX", "50000"))
+_member_cache: dict[str, tuple[int, dict]] = {}
 
 
 # =========================
 # Helpers
 # =========================
+_CANDIDATE_TYP_RE = re.compile(r"\btyp\s+(\w+)\b")
+_HLS_UNSAFE_RE = re.compile(r"[^A-Za-z0-9._-]")
+
+
 def _candidate_type(candidate_obj) -> str | None:
     if isinstance(candidate_obj, dict):
         cand_str = candidate_obj.get("candidate", "") or ""
@@ -94,7 +357,7 @@ def _candidate_type(candidate_obj) -> str | None:
         cand_str = candidate_obj
     else:
         cand_str = ""
-    m = re.search(r"\btyp\s+(\w+)\b", cand_str)
+    m = _CANDIDATE_TYP_RE.search(cand_str)
     return m.group(1) if m else None
 
 
@@ -106,16 +369,115 @@ def _sdp_info(desc: dict) -> dict:
 
 
 def _log_room_state(room: str):
-    size = len(room_members[room])
-    log.info(
-        "room_state",
-        extra={
-            "event": "room_state",
-            "room": room,
-            "size": size,
-            "members": list(room_members[room]),
-        },
-    )
+    """Só o tamanho da room; a lista de membros apenas com DEBUG."""
+    extra = {"event": "room_state", "room": room, "size": presence.room_size(room)}
+    if log.isEnabledFor(logging.DEBUG):
+        extra["members"] = Lazy(lambda: sorted(presence.members(room)))
+    log.info("room_state", extra=extra)
+
+
+def _client_ip() -> str | None:
+    """IP do cliente (o gateway repassa em X-Real-IP)."""
+    return request.headers.get("X-Real-IP") or request.remote_addr
+
+
+def _instrumented(event: str):
+    """
+    Registra a duração do handler no /metrics, marca-o como o handler em
+    execução para o monitor do hub, loga os que passam de SLOW_HANDLER_MS e
+    grava o evento de entrada quando a gravação de tráfego está ligada.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            data = args[0] if args and isinstance(args[0], dict) else {}
+            if traffic_recorder is not None:
+                traffic_recorder.record(event, _sid(), data)
+            running = hub_monitor.begin(event, request.sid, data.get("room"))
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                hub_monitor.end(running)
+                handler_seconds.observe(elapsed, event)
+                if elapsed * 1000 >= SLOW_HANDLER_MS:
+                    log.warning(
+                        "slow_handler",
+                        extra={
+                            "handler": event,
+                            "sid": request.sid,
+                            "room": data.get("room"),
+                            "elapsed_ms": round(elapsed * 1000, 1),
+                        },
+                    )
+
+        return wrapper
+
+    return decorator
+
+
+def _rate_limited(event: str):
+    """Descarta o evento se o sid/IP passou do limite configurado para ele."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            live = request.sid
+            if (
+                rate_limiter.enabled
+                and live not in _rate_exempt
+                and not rate_limiter.allow(
+                    event, live, _client_ip(), _rate_scale.get(live, 1.0)
+                )
+            ):
+                _on_rate_limited(event, live)
+                return None
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _on_rate_limited(event: str, live: str):
+    drops = rate_limiter.sid_drops.get(live, 0)
+    if drops == 1 or drops % 100 == 0:
+        emit("rate-limited", {"event": event, "dropped": drops}, to=live)
+        log.warning(
+            "event_rate_limited",
+            extra={"event": event, "sid": live, "ip": _client_ip(), "dropped": drops},
+        )
+    if rate_limiter.should_disconnect(live):
+        log.warning(
+            "client_disconnected_for_abuse",
+            extra={"event": event, "sid": live, "ip": _client_ip(), "dropped": drops},
+        )
+        _kicked.add(live)
+        disconnect()
+
+
+def _set_rate_scale(live: str, meta: dict):
+    """Publishers (papel no meta) ganham limites multiplicados."""
+    if viewer_kind(meta) == "publisher":
+        _rate_scale[live] = RATE_LIMIT_PUBLISHER_FACTOR
+    else:
+        _rate_scale.pop(live, None)
+
+
+def _sid() -> str:
+    """Sid da sessão do socket atual (o original, se a sessão foi retomada)."""
+    return _live_sessions.get(request.sid, request.sid)
+
+
+def _live_sid(sid: str) -> str:
+    """Socket conectado que atende a sessão `sid` neste nó."""
+    return _session_live.get(sid, sid)
+
+
+def _resume_channel(token: str) -> str:
+    return f"resume::{token}"
 
 
 def _channel_name(room: str, src_code: str) -> str:
@@ -146,50 +508,232 @@ def _extract_sources(meta: dict) -> set[str]:
     return out
 
 
-def _member_payload(sid: str) -> dict:
+def _member_payload(sid: str, meta: dict | None = None) -> dict:
     """
     Payload público do membro para room-info/peer-joined.
     Expõe apenas campos relevantes.
     """
-    meta = dict(sid_meta.get(sid, {}))
+    if meta is None:
+        meta = presence.get_meta(sid)
+    rev = meta.get("_rev", 0)
+    cached = _member_cache.get(sid)
+    if cached is not None and cached[0] == rev:
+        return cached[1]
     payload = {"id": sid}
-    for k in ("role", "pairs", "want", "source", "sources"):
+    for k in ("role", "pairs", "want", "source", "sources", "transport"):
         if k in meta:
             payload[k] = meta[k]
+    if len(_member_cache) >= MEMBER_CACHE_MAX:
+        _member_cache.clear()
+    _member_cache[sid] = (rev, payload)
     return payload
 
 
-def _members_payload(room: str) -> list[dict]:
-    return [_member_payload(s) for s in room_members[room]]
+def _save_meta(sid: str, meta: dict):
+    """Grava o meta incrementando a revisão que invalida o cache do payload."""
+    meta["_rev"] = meta.get("_rev", 0) + 1
+    presence.set_meta(sid, meta)
+
+
+def _client_meta(sid: str, event: str, data: dict) -> dict:
+    """Campos de meta válidos do payload; os rejeitados só vão para o log."""
+    role = presence.get_meta(sid).get("role")
+    fields, rejected = clean_client_meta(data, META_MAX_PAIRS, META_MAX_CAPS, role)
+    if rejected:
+        log.warning(
+            "meta_fields_rejected",
+            extra={"event": event, "sid": sid, "fields": rejected},
+        )
+    return fields
+
+
+def _sfu_mode(room: str) -> bool:
+    """Há um SFU anexado à room?"""
+    return bool(presence.channel_members(view_room(room, "sfu")))
+
+
+def _visible_sids(room: str, sid: str, meta: dict) -> set[str]:
+    """Sids que o viewer enxerga na room, conforme seu papel."""
+    keys = visible_keys(meta, _sfu_mode(room))
+    if keys is None:
+        return presence.members(room)
+    sids: set[str] = set()
+    for key in keys:
+        sids |= presence.channel_members(view_room(room, key))
+    if presence.has_member(room, sid):
+        sids.add(sid)
+    return sids
+
+
+def _room_info(room: str, sid: str, meta: dict) -> dict:
+    """
+    Snapshot do roster na visão do sid, com a sequência de cada stream
+    (view room) em que ele recebe deltas.
+    """
+    seqs = {k: presence.room_seq(view_room(room, k)) for k in view_keys(meta)}
+    metas = presence.get_metas(_visible_sids(room, sid, meta))
+    return {
+        "room": room,
+        "seqs": seqs,
+        "room_size": presence.room_size(room),
+        "members": [_member_payload(s, m) for s, m in metas.items()],
+    }
+
+
+def _emit_to_audience(event: str, room: str, payload: dict, keys: set[str]):
+    # socketio.emit: também é chamado fora de handler (purga de nós mortos)
+    for key in sorted(keys):
+        socketio.emit(event, payload, to=view_room(room, key))
+
+
+def _emit_roster_delta(kind: str, room: str, member: dict, keys: set[str]):
+    """
+    Enfileira um delta (added/removed/updated) para cada stream da audiência
+    do membro. O broadcaster agrupa as mudanças da janela num roster-delta
+    com a próxima sequência do stream; o cliente que perceber um salto de
+    sequência pede um snapshot via list-members.
+    """
+    roster_broadcaster.push(kind, room, member, keys)
 
 
 def _in_room(sid: str, room: str) -> bool:
-    return sid in room_members.get(room, set())
+    return presence.has_member(room, sid)
 
 
-def _augment_with_sender_meta(data: dict) -> dict:
-    sender_meta = sid_meta.get(request.sid, {})
+def _needs_full_sender_meta(sender: str, to_sid: str, rev: int) -> bool:
+    """
+    Handshake por par (from, to): o meta completo do remetente vai só na
+    primeira mensagem do par ou quando o meta dele mudou (nova `_rev`).
+    Destinos com a capacidade "full-meta" recebem sempre o formato legado.
+    """
+    sessions = _peer_sessions.setdefault(sender, {})
+    session = sessions.get(to_sid)
+    if session is None:
+        caps = presence.get_meta(to_sid).get("caps") or []
+        session = [None, FULL_META_CAP in caps]
+        sessions[to_sid] = session
+        _peer_sessions_by_to.setdefault(to_sid, set()).add(sender)
+    if session[1] or session[0] != rev:
+        session[0] = rev
+        return True
+    return False
+
+
+def _forget_peer_sessions(sid: str):
+    for to_sid in _peer_sessions.pop(sid, {}):
+        _peer_sessions_by_to.get(to_sid, set()).discard(sid)
+    for sender in _peer_sessions_by_to.pop(sid, set()):
+        _peer_sessions.get(sender, {}).pop(sid, None)
+
+
+def _augment_with_sender_meta(data: dict, to_sid: str | None = None) -> dict:
+    """
+    Envelope do relay. Broadcasts e mensagens a destinos novos levam
+    role/pairs/source/sources do remetente; nas seguintes do mesmo par vai
+    só `sender_rev`, que referencia o meta já entregue.
+    """
+    sid = _sid()
+    sender_meta = presence.get_meta(sid)
     meta = dict(data.get("meta", {}))
-    if "role" not in meta and "role" in sender_meta:
-        meta["role"] = sender_meta["role"]
-    if "pairs" not in meta and "pairs" in sender_meta:
-        meta["pairs"] = sender_meta["pairs"]
-    if "source" not in meta and "source" in sender_meta:
-        meta["source"] = sender_meta["source"]
-    if "sources" not in meta and "sources" in sender_meta:
-        meta["sources"] = sender_meta["sources"]
+    rev = sender_meta.get("_rev", 0)
+    if (
+        not RELAY_SLIM_META
+        or not to_sid
+        or _needs_full_sender_meta(sid, to_sid, rev)
+    ):
+        for k in ("role", "pairs", "source", "sources"):
+            if k not in meta and k in sender_meta:
+                meta[k] = sender_meta[k]
+    if RELAY_SLIM_META:
+        meta["sender_rev"] = rev
 
     data = dict(data)
-    data["from"] = data.get("from") or request.sid
+    data["from"] = data.get("from") or sid
     data["meta"] = meta
     return data
 
 
+def _track_broadcast_offer(room: str, sid: str, payload: dict):
+    """Offer broadcast de publisher: vai para o cache e conta como 1º offer."""
+    meta = presence.get_meta(sid)
+    if viewer_kind(meta) != "publisher":
+        return
+    langs = served_languages(meta)
+    negotiation_timer.offers_broadcast(room, langs)
+    if offer_cache.enabled:
+        offer_cache.store_offer(room, sid, payload, langs)
+
+
+def _deliver_cached_offers(room: str, sid: str, meta: dict):
+    """
+    Listener recém-chegado recebe na hora os offers broadcast vigentes dos
+    publishers que servem o idioma dele, seguidos dos ICE em cache. Com SFU,
+    HLS ou árvore de relay quem o alimenta é outro nó: nada a entregar.
+    """
+    if not offer_cache.enabled or viewer_kind(meta) != "listener":
+        return
+    want = wanted_language(meta)
+    if (
+        _sfu_mode(room)
+        or meta.get("transport") == HLS_TRANSPORT
+        or (want and _relay_tree_enabled(room))
+    ):
+        return
+    offers = offer_cache.offers_for(room, want)
+    for entry in offers:
+        emit("offer", entry["offer"], to=sid)
+        for cand in entry["candidates"]:
+            emit("ice-candidate", cand, to=sid)
+    if offers:
+        negotiation_timer.offer_relayed(room, sid)
+        log.debug(
+            "cached_offers_delivered",
+            extra={"event": "join", "sid": sid, "room": room, "count": len(offers)},
+        )
+
+
+def _advise_bitrate(room: str, lang: str):
+    """
+    Reavalia o degrau do canal `lang` (publishers em `serves::{lang}`) e o da
+    room inteira (publishers em `serves::*`, que atendem todos os idiomas).
+    """
+    if not bitrate_advisor.enabled:
+        return
+    targets = [(ANY, qos.room_counts(room))]
+    if lang:
+        targets.insert(0, (lang, qos.channel_counts(room, lang)))
+    for key, (listeners, degraded) in targets:
+        hint = bitrate_advisor.evaluate(room, key, listeners, degraded)
+        if hint is None:
+            continue
+        emit(
+            "bitrate-hint",
+            {"room": room, "lang": key, **hint},
+            to=view_room(room, f"serves::{key}"),
+        )
+        bitrate_hints_total.inc(hint["reason"])
+        log.info(
+            "bitrate_hint",
+            extra={"event": "qos-report", "room": room, "lang": key, **hint},
+        )
+
+
+def _deliver_bitrate_hints(room: str, sid: str, meta: dict):
+    """Publisher que entra numa room já rebaixada recebe o degrau vigente."""
+    if not bitrate_advisor.enabled or viewer_kind(meta) != "publisher":
+        return
+    for lang in served_languages(meta) or {ANY}:
+        hint = bitrate_advisor.current(room, lang)
+        if hint is not None:
+            emit("bitrate-hint", {"room": room, "lang": lang, **hint}, to=sid)
+
+
 def _join_source_channels_for_sid(sid: str, room: str, sources: set[str]):
     """Inscreve o sid nos subrooms por origem para aquele room."""
     for src in sources:
         ch = _channel_name(room, src)
-        join_room(ch, sid=sid)
+        join_room(ch, sid=_live_sid(sid))
+        presence.add_channel(ch, sid)
         log.debug(
             "channel_join",
             extra={"event": "channel_join", "sid": sid, "room": room, "channel": ch},
@@ -200,54 +744,478 @@ def _leave_source_channels_for_sid(sid: str, room: str, sources: set[str]):
     """Remove o sid dos subrooms por origem para aquele room."""
     for src in sources:
         ch = _channel_name(room, src)
-        leave_room(ch, sid=sid)
+        leave_room(ch, sid=_live_sid(sid))
+        presence.remove_channel(ch, sid)
         log.debug(
             "channel_leave",
             extra={"event": "channel_leave", "sid": sid, "room": room, "channel": ch},
         )
 
 
-@app.get("/healthz")
-def healthz():
-    return jsonify(status="ok")
+def _broadcast_targets(room: str, meta: dict) -> list[str] | None:
+    """
+    Índice de roteamento de sinalização sem `to`, mantido incrementalmente
+    pelas view rooms (por idioma de destino) e pelos canais ::src:: (por
+    idioma de origem):
+      - publisher -> listeners que querem um idioma que ele serve (ou sem
+        idioma escolhido) + quem consome esse idioma como origem (tradutores);
+      - listener  -> publishers que servem o seu `want` (ou todos, sem `want`).
+    Com SFU anexado, a audiência dos publishers é o próprio SFU.
+    None quando o papel/idioma é desconhecido: cai no broadcast da room.
+    """
+    kind = viewer_kind(meta)
+    sfu = _sfu_mode(room)
+    if kind == "publisher":
+        served = served_languages(meta)
+        if not served:
+            return [view_room(room, "sfu"), view_room(room, "pub")] if sfu else None
+        if sfu:
+            targets = [view_room(room, "sfu")]
+        else:
+            targets = [view_room(room, f"want::{ANY}")]
+            targets += [view_room(room, f"want::{lang}") for lang in sorted(served)]
+        targets += [_channel_name(room, lang) for lang in sorted(served)]
+        return targets
+    if kind == "listener":
+        want = wanted_language(meta)
+        if want:
+            return [
+                view_room(room, f"serves::{want}"),
+                view_room(room, f"serves::{ANY}"),
+                view_room(room, "sfu"),
+            ]
+        return [view_room(room, "pub"), view_room(room, "sfu")]
+    return None
+
+
+def _emit_routed(event: str, room: str, data: dict) -> int | None:
+    """Emite um broadcast de sinalização só para quem pode consumi-lo."""
+    targets = _broadcast_targets(room, presence.get_meta(_sid()))
+    emit(event, data, to=targets or room, include_self=False)
+    return len(targets) if targets else None
+
+
+def _is_registered_sfu(sid: str) -> bool:
+    return bool(SFU_SECRET) and sid in presence.channel_members(SFU_NODES)
+
+
+def _authenticate(auth) -> set[str] | None:
+    """Papéis do JWT enviado no connect; None sem token válido."""
+    token = auth.get("token") if isinstance(auth, dict) else None
+    token = token or request.headers.get("Authorization", "")
+    if not isinstance(token, str):
+        return None
+    if token.lower().startswith("bearer "):
+        token = token[7:]
+    token = token.strip()
+    if not token:
+        return None
+    from db_core.security.token import decode_token  # só com PUBLISHER_AUTH
+
+    try:
+        claims = decode_token(token)
+    except Exception:
+        log.warning("auth_token_rejected", extra={"event": "connect", "sid": request.sid})
+        return None
+    roles = claims.get("roles")
+    return {r for r in roles if isinstance(r, str)} if isinstance(roles, list) else set()
+
+
+def _role_allowed(role) -> bool:
+    """Publishers exigem um socket autenticado; observers, o papel admin."""
+    if not PUBLISHER_AUTH or role not in PUBLISHER_ROLES | OBSERVER_ROLES:
+        return True
+    granted = _principals.get(request.sid)
+    if granted is None:
+        return False
+    return role in PUBLISHER_ROLES or "admin" in granted
+
+
+def _ensure_sfu_attached(room: str):
+    """
+    Pede a um SFU registrado que entre na room, se ainda não houver um.
+    A escolha é estável por room (hash), então nós diferentes escolhem o
+    mesmo SFU.
+    """
+    if not SFU_SECRET or _sfu_mode(room):
+        return
+    nodes = sorted(presence.channel_members(SFU_NODES))
+    if not nodes:
+        return
+    sfu_sid = nodes[zlib.crc32(room.encode()) % len(nodes)]
+    emit("sfu-attach", {"room": room}, to=sfu_sid)
 
 
-@socketio.on("connect")
-def on_connect():
+def _refresh_publisher_views(room: str):
+    """
+    O SFU entrou ou saiu: os publishers passam a (deixar de) ver a audiência,
+    então recebem um snapshot novo.
+    """
+    pubs = presence.channel_members(view_room(room, "pub"))
+    for sid, meta in presence.get_metas(pubs).items():
+        emit("room-info", _room_info(room, sid, meta), to=sid)
+
+
+def _steer_to_sfu(room: str, to_sid: str) -> bool:
+    """
+    Em room com SFU, oferta de publisher para listener não é entregue: o
+    publisher recebe `sfu-steer` apontando o SFU, que é quem serve a audiência.
+    """
+    sid = _sid()
+    metas = presence.get_metas([sid, to_sid])
+    if viewer_kind(metas[sid]) != "publisher":
+        return False
+    if viewer_kind(metas[to_sid]) != "listener":
+        return False
+    sfus = sorted(presence.channel_members(view_room(room, "sfu")))
+    emit("sfu-steer", {"room": room, "to": to_sid, "sfu": sfus}, to=sid)
     log.info(
-        "client_connected",
-        extra={"event": "connect", "sid": request.sid, "ip": request.remote_addr},
+        "offer_steered_to_sfu",
+        extra={"event": "offer", "sid": sid, "room": room, "to": to_sid},
     )
+    return True
 
 
-@socketio.on("disconnect")
-def on_disconnect(reason=None):
-    sid = request.sid
-    meta = sid_meta.get(sid, {})
-    old_sources = _extract_sources(meta)
-    rooms_to_remove = list(sid_rooms.get(sid, []))
-    for room in rooms_to_remove:
-        _leave_source_channels_for_sid(sid, room, old_sources)
-        if sid in room_members[room]:
-            room_members[room].remove(sid)
-            emit(
-                "peer-left",
-                {"member": _member_payload(sid)},
-                room=room,
-                include_self=False,
-            )
-            emit(
-                "room-info",
-                {
-                    "room": room,
-                    "room_size": len(room_members[room]),
-                    "members": _members_payload(room),
-                },
-                room=room,
-            )
-        sid_rooms[sid].discard(room)
+def _hls_path(room: str, lang: str) -> str:
+    """Caminho da playlist do canal `_channel_name(room, lang)` no gateway."""
+    room_dir = _HLS_UNSAFE_RE.sub("_", room)
+    lang_dir = _HLS_UNSAFE_RE.sub("_", lang)
+    return f"{HLS_BASE_URL}/{room_dir}/{lang_dir}/index.m3u8"
+
+
+def _should_use_hls(room: str, meta: dict) -> bool:
+    """Listener novo numa room cuja audiência WebRTC já atingiu o limite?"""
+    if not HLS_BASE_URL or viewer_kind(meta) != "listener":
+        return False
+    if not wanted_language(meta) or not _sfu_mode(room):
+        return False
+    listeners = presence.channel_members(view_room(room, "lst"))
+    return len(listeners) >= HLS_LISTENER_THRESHOLD
+
+
+def _handover_to_hls(room: str, sid: str, meta: dict):
+    """Pede ao SFU o empacotamento do idioma e manda o listener para o HLS."""
+    lang = wanted_language(meta)
+    emit("hls-start", {"room": room, "lang": lang}, room=view_room(room, "sfu"))
+    emit(
+        "hls-redirect",
+        {"room": room, "lang": lang, "url": _hls_path(room, lang)},
+        to=sid,
+    )
+    negotiation_timer.drop(sid, room, "hls")
+    log.info(
+        "listener_handed_to_hls",
+        extra={"event": "hls", "sid": sid, "room": room, "lang": lang},
+    )
+
+
+def _relay_tree_enabled(room: str) -> bool:
+    return RELAY_TREE and not _sfu_mode(room)
+
+
+def _relay_langs(meta: dict) -> set[str]:
+    """Canais de idioma cuja árvore depende deste sid."""
+    kind = viewer_kind(meta)
+    if kind == "publisher":
+        return served_languages(meta)
+    if kind == "listener" and wanted_language(meta):
+        return {wanted_language(meta)}
+    return set()
+
+
+def _relay_capacity(value) -> int:
+    try:
+        return max(0, min(int(value), RELAY_TREE_FANOUT))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _set_relay_parent(room: str, lang: str, sid: str, meta: dict, parent: str | None):
+    if parent:
+        meta["relay"] = {"room": room, "lang": lang, "parent": parent}
+    else:
+        meta.pop("relay", None)
+    _save_meta(sid, meta)
+    emit("relay-parent", {"room": room, "lang": lang, "parent": parent}, to=sid)
+
+
+def _send_relay_children(room: str, lang: str, node: str, kids):
+    emit(
+        "relay-children",
+        {"room": room, "lang": lang, "children": sorted(kids)},
+        to=node,
+    )
+
+
+def _relay_listener_joined(room: str, lang: str, tree: RelayTree, sid: str) -> bool:
+    """Pendura o novo listener na vaga mais rasa; False se a árvore divergiu."""
+    channel = view_room(room, f"want::{lang}")
+    if sid in tree or sid in tree.outside:
+        return True
+    if presence.channel_size(channel) != tree.size() + 1:
+        return False
+    meta = presence.get_meta(sid)
+    if meta.get("transport") == HLS_TRANSPORT:
+        tree.outside.add(sid)
+        return True
+    parent = tree.add(sid, _relay_capacity(meta.get("relay_capacity")))
+    _set_relay_parent(room, lang, sid, meta, parent)
+    _send_relay_children(room, lang, parent, tree.children[parent])
+    return True
+
+
+def _relay_listener_left(room: str, lang: str, tree: RelayTree, sid: str) -> bool:
+    """Religa só os filhos de quem saiu; False se a árvore divergiu."""
+    channel = view_room(room, f"want::{lang}")
+    if sid not in tree and sid not in tree.outside:
+        return presence.channel_size(channel) == tree.size()
+    if presence.channel_size(channel) != tree.size() - 1:
+        return False
+    old_parent = tree.parent.get(sid)
+    moved = tree.remove(sid)
+    metas = presence.get_metas(moved)
+    for orphan, parent in moved.items():
+        _set_relay_parent(room, lang, orphan, metas.get(orphan, {}), parent)
+    for node in {old_parent, *moved.values()} - {None}:
+        _send_relay_children(room, lang, node, tree.children.get(node, ()))
+    return True
+
+
+def _rebalance_relay_tree(
+    room: str,
+    lang: str,
+    joined: str | None = None,
+    left: str | None = None,
+):
+    """
+    Mantém a árvore do canal `lang` da room. A entrada (`joined`) ou saída
+    (`left`) de um listener é aplicada na árvore em cache; qualquer outra
+    mudança, ou uma árvore que divergiu da presença (ex.: mudança feita por
+    outra réplica), recalcula a partir da presença. Em ambos os casos só
+    quem mudou é avisado: `relay-parent` para o listener que trocou de pai e
+    `relay-children` para cada nó cujo conjunto de filhos mudou.
+    """
+    if not _relay_tree_enabled(room) or lang == ANY:
+        return
+    roots = sorted(presence.channel_members(view_room(room, f"serves::{lang}")))
+    roots = roots or sorted(presence.channel_members(view_room(room, f"serves::{ANY}")))
+    tree = _relay_trees.get((room, lang))
+    if tree and roots and tree.root == roots[0]:
+        if joined and _relay_listener_joined(room, lang, tree, joined):
+            return
+        if left and _relay_listener_left(room, lang, tree, left):
+            return
+
+    listeners = presence.channel_members(view_room(room, f"want::{lang}"))
+    all_metas = presence.get_metas(listeners)
+    metas = {s: m for s, m in all_metas.items() if m.get("transport") != HLS_TRANSPORT}
+
+    old = {}
+    for sid, m in metas.items():
+        relay = m.get("relay") or {}
+        if relay.get("room") == room and relay.get("parent"):
+            old[sid] = relay["parent"]
+    if roots:
+        caps = {s: _relay_capacity(m.get("relay_capacity")) for s, m in metas.items()}
+        tree = RelayTree.build(roots[0], caps, old, RELAY_TREE_FANOUT)
+        tree.outside = set(all_metas) - set(metas)
+        _relay_trees[(room, lang)] = tree
+        new = dict(tree.parent)
+    else:
+        _relay_trees.pop((room, lang), None)
+        new = {}
+
+    for sid, meta in metas.items():
+        parent = new.get(sid)
+        if parent != old.get(sid):
+            _set_relay_parent(room, lang, sid, meta, parent)
+
+    old_children, new_children = children_of(old), children_of(new)
+    alive = set(metas) | set(roots)
+    changed = 0
+    for node in set(old_children) | set(new_children):
+        kids = new_children.get(node, set())
+        if node in alive and kids != old_children.get(node, set()):
+            changed += 1
+            _send_relay_children(room, lang, node, kids)
+    if changed:
+        log.info(
+            "relay_tree_rebalanced",
+            extra={
+                "event": "relay-tree",
+                "room": room,
+                "lang": lang,
+                "listeners": len(metas),
+                "changed_nodes": changed,
+            },
+        )
+
+
+def _forget_relay_trees(room: str):
+    for key in [k for k in _relay_trees if k[0] == room]:
+        del _relay_trees[key]
+
+
+def _steer_to_relay_parent(room: str, to_sid: str) -> bool:
+    """
+    Com a árvore ativa, o listener só é alimentado pelo seu pai: ofertas de
+    outros remetentes voltam como `relay-steer` e não são entregues.
+    """
+    relay = presence.get_meta(to_sid).get("relay") or {}
+    if relay.get("room") != room or relay.get("parent") in (None, _sid()):
+        return False
+    emit(
+        "relay-steer",
+        {"room": room, "to": to_sid, "parent": relay["parent"]},
+        to=_sid(),
+    )
+    return True
+
+
+def _join_view_rooms_for_sid(sid: str, room: str, keys: set[str]):
+    """Inscreve o sid nas view rooms (streams do roster) daquele room."""
+    for key in keys:
+        vr = view_room(room, key)
+        join_room(vr, sid=_live_sid(sid))
+        presence.add_channel(vr, sid)
+
+
+def _leave_view_rooms_for_sid(sid: str, room: str, keys: set[str]):
+    for key in keys:
+        vr = view_room(room, key)
+        leave_room(vr, sid=_live_sid(sid))
+        presence.remove_channel(vr, sid)
+
+
+def _enter_view_rooms(room: str, sid: str):
+    """Fim do join: alinha as view rooms do sid ao meta."""
+    if not presence.has_member(room, sid):
+        return
+    meta = presence.get_meta(sid)
+    keys, joined_keys = view_keys(meta), _joined_view_keys(sid, room)
+    if meta.get("suspended"):
+        # caiu antes do flush: o resume entra no que a presença registrou
+        for key in keys - joined_keys:
+            presence.add_channel(view_room(room, key), sid)
+    else:
+        _leave_view_rooms_for_sid(sid, room, joined_keys - keys)
+        _join_view_rooms_for_sid(sid, room, keys - joined_keys)
+    # só agora o sid está em want::/serves:: (o enter pode vir depois do flush)
+    for lang in _relay_langs(meta):
+        _rebalance_relay_tree(room, lang, joined=sid)
+
+
+def _send_room_info(room: str, sid: str):
+    """Snapshot do fim do join (o resume manda o seu)."""
+    if not presence.has_member(room, sid):
+        return
+    meta = presence.get_meta(sid)
+    if not meta.get("suspended"):
+        emit("room-info", _room_info(room, sid, meta), to=sid)
+
+
+def _joined_suffixes(sid: str, prefix: str) -> set[str]:
+    n = len(prefix)
+    return {ch[n:] for ch in presence.channels_of(sid) if ch.startswith(prefix)}
+
+
+def _joined_view_keys(sid: str, room: str) -> set[str]:
+    """
+    View rooms em que o sid de fato entrou naquele room. O meta é global e
+    muda depois (ex.: o ouvinte entra na room principal sem `want` e numa
+    sub-room com `want`), então a saída usa o que a presença registrou.
+    """
+    return _joined_suffixes(sid, view_room(room, ""))
+
+
+def _joined_sources(sid: str, room: str) -> set[str]:
+    """Canais ::src:: em que o sid de fato entrou naquele room."""
+    return _joined_suffixes(sid, _channel_name(room, ""))
+
+
+def _forget_live_socket(live: str):
+    sid = _live_sessions.pop(live, None)
+    if sid is not None and _session_live.get(sid) == live:
+        _session_live.pop(sid, None)
+
 
-    sid_meta.pop(sid, None)
+def _suspend_session(sid: str, meta: dict, reason):
+    """
+    Mantém rooms, canais e meta do sid sem avisar ninguém; se não houver
+    `resume` dentro do prazo, a saída é processada normalmente.
+    """
+    mark = secrets.token_hex(4)
+    meta["suspended"] = mark
+    _save_meta(sid, meta)
+    ice_batcher.drop(sid)
+    offer_cache.invalidate(sid)
+    socketio.start_background_task(_expire_session_later, sid, mark)
+    log.info(
+        "session_suspended",
+        extra={
+            "event": "disconnect",
+            "sid": sid,
+            "reason": reason,
+            "grace_ms": RESUME_GRACE_MS,
+        },
+    )
+
+
+def _run_as(live_sid: str, fn, *args):
+    """
+    Executa `fn` fora de um handler (tarefa de fundo) como se fosse um evento
+    do socket `live_sid`: monta o contexto que emit/join_room/_sid() usam.
+    """
+    with app.test_request_context("/signal"):
+        request.sid = live_sid
+        request.namespace = "/"
+        return fn(*args)
+
+
+def _release_join(live_sid: str, data: dict):
+    """Join liberado pela fila de admissão."""
+    _run_as(live_sid, _join, data)
+
+
+def _expire_session_later(sid: str, mark: str):
+    socketio.sleep(RESUME_GRACE_MS / 1000.0)
+    meta = presence.get_meta(sid)
+    if meta.get("suspended") != mark:
+        return
+    _run_as(sid, _finalize_disconnect, sid, meta, "resume_timeout")
+
+
+def _finalize_disconnect(sid: str, meta: dict, reason):
+    rooms_to_remove = list(presence.rooms_of(sid))
+    member = _member_payload(sid, meta)
+    for room in rooms_to_remove:
+        _leave_source_channels_for_sid(sid, room, _joined_sources(sid, room))
+        _leave_view_rooms_for_sid(sid, room, _joined_view_keys(sid, room))
+        if presence.has_member(room, sid):
+            presence.remove_member(room, sid)
+            audience = audience_keys(meta, _sfu_mode(room))
+            _emit_to_audience("peer-left", room, {"member": member}, audience)
+            _emit_roster_delta("removed", room, member, audience)
+            if meta.get("role") == SFU_ROLE:
+                _refresh_publisher_views(room)
+
+    presence.drop_sid(sid)
+    negotiation_timer.drop(sid)
+    qos.drop_sid(sid)
+    for room in rooms_to_remove:
+        if not presence.room_size(room):
+            negotiation_timer.forget_room(room)
+            qos.forget_room(room)
+            bitrate_advisor.forget_room(room)
+            _forget_relay_trees(room)
+        for lang in _relay_langs(meta):
+            _rebalance_relay_tree(room, lang, left=sid)
+    ice_batcher.drop(sid)
+    offer_cache.invalidate(sid)
+    _forget_peer_sessions(sid)
+    _member_cache.pop(sid, None)
+    if traffic_recorder is not None:
+        traffic_recorder.forget(sid)
     log.info(
         "client_disconnected",
         extra={
@@ -259,8 +1227,366 @@ def on_disconnect(reason=None):
     )
 
 
+def _announce_purged(removed: dict[str, tuple[set[str], dict]], node: str):
+    """Avisa as rooms dos sids removidos da presença (peer-left + delta do roster)."""
+    for sid, (rooms, meta) in removed.items():
+        member = _member_payload(sid, meta)
+        for room in rooms:
+            audience = audience_keys(meta, _sfu_mode(room))
+            _emit_to_audience("peer-left", room, {"member": member}, audience)
+            _emit_roster_delta("removed", room, member, audience)
+        _member_cache.pop(sid, None)
+    if removed:
+        log.info(
+            "stale_presence_purged",
+            extra={"event": "presence_purge", "node": node, "sids": len(removed)},
+        )
+
+
+def _purge_stale_node_state():
+    """
+    Remove do backend compartilhado sids deixados por uma execução anterior
+    deste mesmo nó (crash/redeploy) e avisa as rooms afetadas.
+    """
+    _announce_purged(presence.purge_node(presence.node_id), presence.node_id)
+
+
+def _presence_heartbeat_loop():
+    """
+    Renova o heartbeat deste nó e purga os nós mortos: réplicas recriadas
+    com outro hostname nunca voltam para limpar os próprios sids.
+    """
+    while True:
+        try:
+            presence.heartbeat(PRESENCE_NODE_TTL_S)
+            for node, removed in presence.sweep_dead_nodes().items():
+                _announce_purged(removed, node)
+        except Exception:
+            log.exception("presence_heartbeat_failed")
+        socketio.sleep(PRESENCE_NODE_TTL_S / 3)
+
+
+def _state_journal() -> StateJournal | None:
+    if not SIGNAL_STATE_PATH or presence.persistent:
+        return None
+    return StateJournal(SIGNAL_STATE_PATH, SIGNAL_STATE_MAX_BYTES)
+
+
+def _write_journal(off_hub: bool = True):
+    """
+    No hub só se copiam as mudanças (ou o snapshot, quando o journal precisa
+    ser compactado); json e fsync rodam numa thread real via tpool.
+    """
+    try:
+        if state_journal.needs_snapshot:
+            presence.changes()  # o snapshot já inclui o que estava pendente
+            write, record = state_journal.write_snapshot, presence.snapshot()
+        else:
+            write, record = state_journal.append_changes, presence.changes()
+        if off_hub:
+            tpool.execute(write, record)
+        else:
+            write(record)
+    except Exception:
+        log.exception("state_snapshot_failed")
+
+
+def _snapshot_loop():
+    while True:
+        socketio.sleep(SIGNAL_SNAPSHOT_S)
+        _write_journal()
+
+
+def _restore_local_state():
+    """
+    Restaura o último snapshot e suspende todos os sids restaurados: quem
+    reconectar com o token retoma a sessão sem broadcast; os demais saem
+    quando o prazo de retomada expira.
+    """
+    loaded = state_journal.load_latest()
+    if loaded is None:
+        return
+    ts, state, changes = loaded
+    age_ms = (time.time() - ts) * 1000
+    if age_ms > RESUME_GRACE_MS:
+        log.info("state_snapshot_stale", extra={"event": "restore", "age_ms": int(age_ms)})
+        return
+    sids = presence.restore(state, changes)
+    for sid in sids:
+        meta = presence.get_meta(sid)
+        mark = secrets.token_hex(4)
+        meta["suspended"] = mark
+        _save_meta(sid, meta)
+        socketio.start_background_task(_expire_session_later, sid, mark)
+    log.info(
+        "state_restored",
+        extra={
+            "event": "restore",
+            "sids": len(sids),
+            "rooms": len(presence.rooms()),
+            "age_ms": int(age_ms),
+        },
+    )
+
+
+_purge_stale_node_state()
+
+join_admission = JoinAdmission(
+    socketio, _release_join, JOIN_RATE_PER_S, JOIN_BURST, JOIN_QUEUE_MAX
+)
+
+
+def _count_emitted(send):
+    """Envolve o envio do Engine.IO para contar pacotes e bytes emitidos."""
+
+    def wrapper(eio_sid, data):
+        emitted_packets_total.inc()
+        if isinstance(data, (str, bytes)):
+            emitted_bytes_total.inc(amount=len(data))
+        return send(eio_sid, data)
+
+    return wrapper
+
+
+socketio.server.eio.send = _count_emitted(socketio.server.eio.send)
+
+metrics.collect(
+    "signal_hub_lag_quantile_seconds",
+    "gauge",
+    "Percentis do atraso do hub nas últimas amostras",
+    lambda: [({"quantile": q}, v) for q, v in hub_monitor.percentiles().items()],
+)
+metrics.collect(
+    "signal_log_dropped_total",
+    "counter",
+    "Registros de log não emitidos (amostragem ou fila cheia)",
+    lambda: [
+        ({"reason": "sampled"}, log_sampler.sampled_out),
+        ({"reason": "queue_full"}, log_queue_handler.dropped if log_queue_handler else 0),
+    ],
+)
+metrics.collect(
+    "signal_process_entries",
+    "gauge",
+    "Entradas das estruturas por sid/room fora da presença",
+    lambda: [({"structure": k}, v) for k, v in _process_entries().items()],
+)
+metrics.collect(
+    "signal_qos_degraded_listeners",
+    "gauge",
+    "Listeners com qualidade abaixo dos limites, por room e idioma",
+    lambda: [({"room": r, "lang": lang}, n) for (r, lang), n in qos.degraded_counts().items()],
+)
+metrics.collect(
+    "signal_presence",
+    "gauge",
+    "Rooms, sids, canais e inscrições no backend de presença",
+    lambda: [({"kind": k}, v) for k, v in presence.stats().items()],
+)
+metrics.collect(
+    "signal_room_members",
+    "gauge",
+    "Membros por room",
+    lambda: [({"room": r}, presence.room_size(r)) for r in presence.rooms()],
+)
+metrics.collect(
+    "signal_join_queue",
+    "gauge",
+    "Joins aguardando admissão por room",
+    lambda: [({"room": r}, len(q)) for r, q in join_admission.queues.items()],
+)
+metrics.collect(
+    "signal_ice_batches_pending",
+    "gauge",
+    "Lotes de ICE aguardando envio",
+    lambda: [({}, len(ice_batcher.pending))],
+)
+metrics.collect(
+    "signal_member_cache_entries",
+    "gauge",
+    "Payloads de membro em cache",
+    lambda: [({}, len(_member_cache))],
+)
+metrics.collect(
+    "signal_rate_limit_events_total",
+    "counter",
+    "Eventos aceitos/descartados pelo limitador",
+    lambda: [
+        ({"event": e, "result": r}, n)
+        for e, c in rate_limiter.counters.items()
+        for r, n in c.items()
+    ],
+)
+
+hub_monitor.start()
+if presence.persistent:
+    socketio.start_background_task(_presence_heartbeat_loop)
+if MEMORY_TRACE_FRAMES > 0:
+    tracemalloc.start(MEMORY_TRACE_FRAMES)
+traffic_recorder = None
+if SIGNAL_RECORD_DIR:
+    traffic_recorder = TrafficRecorder(
+        SIGNAL_RECORD_DIR, _candidate_type, SIGNAL_RECORD_MAX_BYTES, execute=tpool.execute
+    )
+    socketio.start_background_task(traffic_recorder.run, socketio)
+    atexit.register(traffic_recorder.flush)
+if HUB_STALL_MS > 0:
+    hub_monitor.start_stall_watchdog(HUB_STALL_MS / 1000.0)
+
+state_journal = _state_journal()
+if state_journal is not None:
+    presence.track_changes()
+    if RESUME_GRACE_MS > 0:
+        _restore_local_state()
+    socketio.start_background_task(_snapshot_loop)
+    # no shutdown o hub já parou: grava direto
+    atexit.register(_write_journal, False)
+
+
+@app.get("/healthz")
+def healthz():
+    return jsonify(status="ok")
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _process_entries() -> dict[str, int]:
+    """Entradas das estruturas por sid/room mantidas fora da presença."""
+    return {
+        "peer_sessions": len(_peer_sessions),
+        "peer_sessions_by_to": len(_peer_sessions_by_to),
+        "member_cache": len(_member_cache),
+        "relay_trees": len(_relay_trees),
+        "live_sessions": len(_live_sessions),
+        "session_live": len(_session_live),
+        "rate_limit_sids": len(rate_limiter.sid_buckets),
+        "rate_limit_ips": len(rate_limiter.ip_buckets),
+        "rate_limit_scaled": len(_rate_scale),
+        "principals": len(_principals),
+        "join_waiting": len(join_admission.waiting),
+        "join_queues": len(join_admission.queues),
+        "ice_batches": len(ice_batcher.pending),
+        "offer_cache_publishers": len(offer_cache.rooms_by_sid),
+        "negotiations_pending": len(negotiation_timer.rooms_by_sid),
+        "qos_listeners": len(qos.listeners),
+        "qos_channels": sum(len(c) for c in qos.buffers.values()),
+        "bitrate_channels": sum(len(c) for c in bitrate_advisor.state.values()),
+        "roster_pending": len(roster_broadcaster.pending),
+        "roster_waiters": sum(len(w) for w in roster_broadcaster.waiters.values()),
+    }
+
+
+def _rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@app.get("/memory")
+def memory_endpoint():
+    """
+    Contabilidade de memória para acompanhar processos de longa duração:
+    RSS, objetos vivos, tamanho de cada estrutura por sid/room e, com
+    MEMORY_TRACE_FRAMES, as maiores origens de alocação.
+    """
+    out = {
+        "rss_bytes": _rss_bytes(),
+        "gc_objects": len(gc.get_objects()),
+        "presence": presence.memory(),
+        "process": _process_entries(),
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics("lineno")[:20]
+        out["tracemalloc"] = {
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top": [{"where": str(s.traceback), "bytes": s.size, "count": s.count} for s in top],
+        }
+    return jsonify(out)
+
+
+@app.get("/qos")
+def qos_endpoint():
+    """Percentis de jitter/perda/RTT/nível por room e idioma (?room= filtra)."""
+    return jsonify(qos.summary(request.args.get("room")))
+
+
+@app.get("/signal-config")
+def signal_config():
+    return jsonify(serializer=SIGNAL_SERIALIZER)
+
+
+@socketio.on("connect")
+@_instrumented("connect")
+def on_connect(auth=None):
+    if PUBLISHER_AUTH:
+        granted = _authenticate(auth)
+        if granted is not None:
+            _principals[request.sid] = granted
+    log.info(
+        "client_connected",
+        extra={"event": "connect", "sid": request.sid, "ip": request.remote_addr},
+    )
+
+
+@socketio.on("disconnect")
+@_instrumented("disconnect")
+def on_disconnect(reason=None):
+    sid = _sid()
+    join_admission.drop(request.sid)
+    rate_limiter.forget(request.sid)
+    _rate_exempt.discard(request.sid)
+    _rate_scale.pop(request.sid, None)
+    _principals.pop(request.sid, None)
+    kicked = request.sid in _kicked
+    _kicked.discard(request.sid)
+    _forget_live_socket(request.sid)
+    meta = presence.get_meta(sid)
+    if (
+        RESUME_GRACE_MS > 0
+        and meta.get("_token")
+        and reason != _CLIENT_DISCONNECT
+        and not kicked
+        and presence.rooms_of(sid)
+    ):
+        _suspend_session(sid, meta, reason)
+        return
+    _finalize_disconnect(sid, meta, reason)
+
+
 @socketio.on("join")
+@_instrumented("join")
+@_rate_limited("join")
 def on_join(data):
+    """
+    Publishers, observers e o SFU entram direto (os dois primeiros só com um
+    socket autenticado, ver PUBLISHER_AUTH); listeners passam pelo controle
+    de admissão da room.
+    """
+    room = data.get("room")
+    role = data.get("role") if isinstance(data.get("role"), str) else None
+    if not _role_allowed(role):
+        log.warning("role_rejected", extra={"event": "join", "sid": _sid(), "room": room, "role": role})
+        emit("join-rejected", {"room": room, "reason": "unauthorized"}, to=request.sid)
+        return
+    if (
+        join_admission.enabled
+        and role not in PUBLISHER_ROLES | OBSERVER_ROLES | {SFU_ROLE}
+        and not presence.has_member(room, _sid())
+        and not join_admission.admit(room, request.sid, data)
+    ):
+        log.info("join_queued", extra={"event": "join", "sid": _sid(), "room": room})
+        return
+    _join(data)
+
+
+def _join(data: dict):
     """
     Espera:
       room: str
@@ -268,18 +1594,27 @@ def on_join(data):
       pairs: [{source:{code}, target:{code}}, ...]  (opcional)
       source: "xx-YY" (origem selecionada, opcional)
       want: "xx-YY"   (listener)
+      relay_capacity: int (listener; quantos outros consegue reencaminhar)
     """
+    sid = _sid()
     room = data.get("room")
-    role = data.get("role")
-    pairs = data.get("pairs")
-    source = data.get("source")
-    want = data.get("want") or data.get("target") or data.get("target_code")
+    fields = _client_meta(sid, "join", data)
+    role = fields.get("role")
+    pairs = fields.get("pairs")
+    source = fields.get("source")
+    want = fields.get("want") or None
+    caps = fields.get("caps")
+    if role == SFU_ROLE and not _is_registered_sfu(sid):
+        log.warning(
+            "sfu_role_rejected",
+            extra={"event": "join", "sid": sid, "room": room},
+        )
+        role = None
 
     join_room(room)
-    room_members[room].add(request.sid)
-    sid_rooms[request.sid].add(room)
+    room_size = presence.add_member(room, sid)
 
-    meta = sid_meta.get(request.sid, {})
+    meta = presence.get_meta(sid)
     if role is not None:
         meta["role"] = role
     if pairs is not None:
@@ -288,127 +1623,178 @@ def on_join(data):
         meta["source"] = source
     if want is not None:
         meta["want"] = want
+    if caps is not None:
+        meta["caps"] = caps
+    if "relay_capacity" in data:
+        meta["relay_capacity"] = _relay_capacity(data["relay_capacity"])
+    new_token = None
+    if RESUME_GRACE_MS > 0 and not meta.get("_token"):
+        new_token = meta["_token"] = secrets.token_urlsafe(18)
+
+    if meta.get("transport") != HLS_TRANSPORT and _should_use_hls(room, meta):
+        meta["transport"] = HLS_TRANSPORT
 
     sources = _extract_sources(meta)
     if sources:
         meta["sources"] = sorted(sources)
-        sid_meta[request.sid] = meta
-        _join_source_channels_for_sid(request.sid, room, sources)
-    else:
-        sid_meta[request.sid] = meta
+    _save_meta(sid, meta)
+    _set_rate_scale(_live_sid(sid), meta)
+    # rejoin com outro meta: sai do que não vale mais nesta room
+    joined_sources = _joined_sources(sid, room)
+    _leave_source_channels_for_sid(sid, room, joined_sources - sources)
+    _join_source_channels_for_sid(sid, room, sources - joined_sources)
+    if new_token:
+        presence.add_channel(_resume_channel(new_token), sid)
+        emit("session", {"token": new_token, "grace_ms": RESUME_GRACE_MS}, to=sid)
 
     log.info(
         "peer_joined",
         extra={
             "event": "join",
-            "sid": request.sid,
+            "sid": sid,
             "room": room,
-            "room_size": len(room_members[room]),
+            "room_size": room_size,
             "role": role,
             "sources": list(sources),
         },
     )
     _log_room_state(room)
 
-    emit(
-        "room-info",
-        {
-            "room": room,
-            "room_size": len(room_members[room]),
-            "members": _members_payload(room),
-        },
-        to=request.sid,
-    )
-    emit(
-        "peer-joined",
-        {"member": _member_payload(request.sid)},
-        room=room,
-        include_self=False,
-    )
-    emit(
-        "room-info",
-        {
-            "room": room,
-            "room_size": len(room_members[room]),
-            "members": _members_payload(room),
-        },
-        room=room,
-        include_self=False,
-    )
+    # O sid só entra nas próprias view rooms depois que o lote pendente da
+    # room (com o próprio added) sai: ele recebe o estado no snapshot, não o
+    # próprio member-added.
+    member = _member_payload(sid, meta)
+    audience = audience_keys(meta, _sfu_mode(room))
+    _emit_to_audience("peer-joined", room, {"member": member}, audience)
+    _emit_roster_delta("added", room, member, audience)
+    if roster_broadcaster.is_pending(room):
+        roster_broadcaster.after_flush(
+            room,
+            lambda: _run_as(_live_sid(sid), _enter_view_rooms, room, sid),
+            lambda: _run_as(_live_sid(sid), _send_room_info, room, sid),
+        )
+    else:
+        _enter_view_rooms(room, sid)
+        _send_room_info(room, sid)
+    if viewer_kind(meta) == "listener":
+        negotiation_timer.joined(room, sid, wanted_language(meta) or "")
+    _deliver_cached_offers(room, sid, meta)
+    _deliver_bitrate_hints(room, sid, meta)
+
+    if meta.get("role") == SFU_ROLE:
+        _refresh_publisher_views(room)
+    else:
+        _ensure_sfu_attached(room)
+    if meta.get("transport") == HLS_TRANSPORT and wanted_language(meta):
+        _handover_to_hls(room, sid, meta)
 
 
 @socketio.on("leave")
+@_instrumented("leave")
+@_rate_limited("leave")
 def on_leave(data):
+    sid = _sid()
     room = data.get("room")
-    meta = sid_meta.get(request.sid, {})
-    old_sources = _extract_sources(meta)
-    _leave_source_channels_for_sid(request.sid, room, old_sources)
+    join_admission.drop(request.sid, room)
+    offer_cache.invalidate(sid, room)
+    negotiation_timer.drop(sid, room)
+    qos.drop_sid(sid, room)
+    meta = presence.get_meta(sid)
+    _leave_source_channels_for_sid(sid, room, _joined_sources(sid, room))
+    _leave_view_rooms_for_sid(sid, room, _joined_view_keys(sid, room))
 
     leave_room(room)
-    if request.sid in room_members[room]:
-        room_members[room].remove(request.sid)
-    sid_rooms[request.sid].discard(room)
-
+    was_member = presence.has_member(room, sid)
+    room_size = presence.remove_member(room, sid)
+
+    if not room_size:
+        negotiation_timer.forget_room(room)
+        qos.forget_room(room)
+        bitrate_advisor.forget_room(room)
+        _forget_relay_trees(room)
     log.info(
         "peer_left",
         extra={
             "event": "leave",
-            "sid": request.sid,
+            "sid": sid,
             "room": room,
-            "room_size": len(room_members[room]),
+            "room_size": room_size,
         },
     )
     _log_room_state(room)
 
-    emit("peer-left", {"member": _member_payload(request.sid)}, room=room)
-    emit(
-        "room-info",
-        {
-            "room": room,
-            "room_size": len(room_members[room]),
-            "members": _members_payload(room),
-        },
-        room=room,
-    )
+    if was_member:
+        member = _member_payload(sid, meta)
+        audience = audience_keys(meta, _sfu_mode(room))
+        _emit_to_audience("peer-left", room, {"member": member}, audience)
+        _emit_roster_delta("removed", room, member, audience)
+        if meta.get("role") == SFU_ROLE:
+            _refresh_publisher_views(room)
+        for lang in _relay_langs(meta):
+            _rebalance_relay_tree(room, lang, left=sid)
 
 
 @socketio.on("update-meta")
+@_instrumented("update-meta")
+@_rate_limited("update-meta")
 def on_update_meta(data):
     """
     Permite ao cliente atualizar seus metadados (ex.: translator muda 'source' ou 'pairs', listener muda 'want').
     Exemplo:
       socket.emit("update-meta", { source: "pt-PT" })
     """
-    sid = request.sid
-    meta = sid_meta.get(sid, {})
-    before_sources = _extract_sources(meta)
-
-    for key in ("role", "pairs", "want", "target", "target_code", "source"):
-        if key in data and data[key] is not None:
-            if key in ("target", "target_code"):
-                meta["want"] = data[key]
-            else:
-                meta[key] = data[key]
-    sid_meta[sid] = meta
+    sid = _sid()
+    meta = presence.get_meta(sid)
+    before_meta = dict(meta)
+
+    offer_cache.invalidate(sid)
+    fields = _client_meta(sid, "update-meta", data)
+    if fields.get("role") == SFU_ROLE and not _is_registered_sfu(sid):
+        fields.pop("role")
+    if not _role_allowed(fields.get("role")):
+        log.warning(
+            "role_rejected",
+            extra={"event": "update-meta", "sid": sid, "role": fields.pop("role")},
+        )
+    meta.update(fields)
+    if data.get("relay_capacity") is not None:
+        meta["relay_capacity"] = _relay_capacity(data["relay_capacity"])
 
     after_sources = _extract_sources(meta)
-    for room in list(sid_rooms.get(sid, [])):
-        for src in before_sources - after_sources:
-            _leave_source_channels_for_sid(sid, room, {src})
-        for src in after_sources - before_sources:
-            _join_source_channels_for_sid(sid, room, {src})
+    rooms = list(presence.rooms_of(sid))
+    if rooms:
         meta["sources"] = sorted(after_sources)
-        sid_meta[sid] = meta
-
-        emit(
-            "room-info",
-            {
-                "room": room,
-                "room_size": len(room_members[room]),
-                "members": _members_payload(room),
-            },
-            room=room,
-        )
+    _save_meta(sid, meta)
+    _set_rate_scale(request.sid, meta)
+
+    # Quem deixou de enxergar o membro recebe removed, quem passou a
+    # enxergar recebe added e os demais, updated.
+    member = _member_payload(sid, meta)
+    new_views = view_keys(meta)
+    for room in rooms:
+        sfu = _sfu_mode(room)
+        old_audience = audience_keys(before_meta, sfu)
+        new_audience = audience_keys(meta, sfu)
+        joined_sources = _joined_sources(sid, room)
+        _leave_source_channels_for_sid(sid, room, joined_sources - after_sources)
+        _join_source_channels_for_sid(sid, room, after_sources - joined_sources)
+
+        old_views = _joined_view_keys(sid, room)
+        _leave_view_rooms_for_sid(sid, room, old_views - new_views)
+        _emit_roster_delta("removed", room, member, old_audience - new_audience)
+        _emit_roster_delta("added", room, member, new_audience - old_audience)
+        _emit_roster_delta("updated", room, member, old_audience & new_audience)
+        _join_view_rooms_for_sid(sid, room, new_views - old_views)
+
+        if old_views != new_views:
+            emit("room-info", _room_info(room, sid, meta), to=sid)
+            _deliver_bitrate_hints(room, sid, meta)
+        if meta.get("transport") == HLS_TRANSPORT and (
+            wanted_language(meta) != wanted_language(before_meta)
+        ):
+            _handover_to_hls(room, sid, meta)
+        for lang in _relay_langs(before_meta) | _relay_langs(meta):
+            _rebalance_relay_tree(room, lang)
 
     log.info(
         "meta_updated",
@@ -420,17 +1806,135 @@ def on_update_meta(data):
     )
 
 
+@socketio.on("resume")
+@_instrumented("resume")
+@_rate_limited("resume")
+def on_resume(data):
+    """
+    Retoma uma sessão suspensa no socket atual. Exemplo:
+      socket.emit("resume", { token: "<token do evento session>" })
+
+    Quem já conhecia o membro não recebe nada: ele continua com o mesmo id e
+    o novo socket passa a receber tudo o que é endereçado a esse id.
+    """
+    live = request.sid
+    token = (data or {}).get("token")
+    holders = presence.channel_members(_resume_channel(token)) if token else set()
+    sid = next(iter(holders), None)
+    meta = presence.get_meta(sid) if sid else {}
+    if not sid or not meta.get("suspended"):
+        emit("resume-failed", {"reason": "expired"}, to=live)
+        log.info("resume_rejected", extra={"event": "resume", "sid": live})
+        return
+
+    meta.pop("suspended", None)
+    _save_meta(sid, meta)
+    presence.claim(sid)
+    _live_sessions[live] = sid
+    _session_live[sid] = live
+
+    # emits `to=sid` (relay, lotes de ICE, snapshots) chegam ao novo socket
+    join_room(sid)
+    rooms = sorted(presence.rooms_of(sid))
+    for room in rooms:
+        join_room(room)
+        for key in _joined_view_keys(sid, room):
+            join_room(view_room(room, key))
+        for src in _joined_sources(sid, room):
+            join_room(_channel_name(room, src))
+    if sid in presence.channel_members(SFU_NODES):
+        join_room(SFU_NODES)
+        _rate_exempt.add(live)
+    _set_rate_scale(live, meta)
+
+    if traffic_recorder is not None:
+        traffic_recorder.resume(live, sid)
+    emit("resumed", {"id": sid, "rooms": rooms}, to=live)
+    for room in rooms:
+        emit("room-info", _room_info(room, sid, meta), to=live)
+    log.info(
+        "session_resumed",
+        extra={"event": "resume", "sid": sid, "live_sid": live, "rooms": rooms},
+    )
+
+
 @socketio.on("list-members")
+@_instrumented("list-members")
+@_rate_limited("list-members")
 def on_list_members(data):
+    """
+    Snapshot do roster na visão do sid. Com `since` igual às sequências
+    atuais ({view: seq}) responde apenas {room, seqs, unchanged: true}.
+    """
+    sid = _sid()
+    room = data.get("room")
+    since = data.get("since")
+    meta = presence.get_meta(sid)
+    seqs = {k: presence.room_seq(view_room(room, k)) for k in view_keys(meta)}
+    if isinstance(since, dict) and since == seqs:
+        emit(
+            "room-info",
+            {
+                "room": room,
+                "seqs": seqs,
+                "room_size": presence.room_size(room),
+                "unchanged": True,
+            },
+            to=sid,
+        )
+        return
+    emit("room-info", _room_info(room, sid, meta), to=sid)
+
+
+@socketio.on("sfu-register")
+@_instrumented("sfu-register")
+@_rate_limited("sfu-register")
+def on_sfu_register(data):
+    """
+    Registro de um serviço SFU. Exemplo:
+      socket.emit("sfu-register", { secret: "<SFU_SECRET>" })
+    """
+    sid = _sid()
+    if not SFU_SECRET or (data or {}).get("secret") != SFU_SECRET:
+        log.warning(
+            "sfu_register_rejected",
+            extra={"event": "sfu-register", "sid": sid},
+        )
+        emit("sfu-registered", {"ok": False}, to=sid)
+        return
+    join_room(SFU_NODES)
+    presence.add_channel(SFU_NODES, sid)
+    _rate_exempt.add(request.sid)
+    meta = presence.get_meta(sid)
+    meta["role"] = SFU_ROLE
+    _save_meta(sid, meta)
+    log.info(
+        "sfu_registered",
+        extra={"event": "sfu-register", "sid": sid},
+    )
+    emit("sfu-registered", {"ok": True, "id": sid}, to=sid)
+
+
+@socketio.on("who-serves")
+@_instrumented("who-serves")
+@_rate_limited("who-serves")
+def on_who_serves(data):
+    """
+    Publishers que servem um idioma na room (padrão: o `want` do próprio sid).
+    Exemplo:
+      socket.emit("who-serves", { room: "ABCD-EFGH", want: "en-US" })
+    """
     room = data.get("room")
+    want = data.get("want") or wanted_language(presence.get_meta(_sid()))
+    if want:
+        publishers = presence.channel_members(view_room(room, f"serves::{want}"))
+        publishers |= presence.channel_members(view_room(room, f"serves::{ANY}"))
+    else:
+        publishers = presence.channel_members(view_room(room, "pub"))
     emit(
-        "room-info",
-        {
-            "room": room,
-            "room_size": len(room_members[room]),
-            "members": _members_payload(room),
-        },
-        to=request.sid,
+        "who-serves",
+        {"room": room, "want": want, "publishers": sorted(publishers)},
+        to=_sid(),
     )
 
 
@@ -438,49 +1942,66 @@ def on_list_members(data):
 # Signaling
 # =========================
 @socketio.on("offer")
+@_instrumented("offer")
+@_rate_limited("offer")
 def on_offer(data):
+    sid = _sid()
     room = data.get("room")
     to_sid = data.get("to")
     offer_meta = _sdp_info(data.get("offer"))
-    data = _augment_with_sender_meta(data)
     if to_sid:
         if not _in_room(to_sid, room):
             log.warning(
                 "offer_target_not_in_room",
                 extra={
                     "event": "offer",
-                    "sid": request.sid,
+                    "sid": sid,
                     "room": room,
                     "to": to_sid,
                 },
             )
             return
+        if _sfu_mode(room) and _steer_to_sfu(room, to_sid):
+            return
+        if _relay_tree_enabled(room) and _steer_to_relay_parent(room, to_sid):
+            return
         log.info(
             "offer_routed_1to1",
             extra={
                 "event": "offer",
-                "sid": request.sid,
+                "sid": sid,
                 "room": room,
                 "to": to_sid,
                 **offer_meta,
                 "src": data.get("meta", {}).get("src"),
             },
         )
-        emit("offer", data, to=to_sid)
+        emit("offer", _augment_with_sender_meta(data, to_sid), to=to_sid)
+        negotiation_timer.offer_relayed(room, to_sid)
     else:
+        payload = _augment_with_sender_meta(data)
+        routes = _emit_routed("offer", room, payload)
+        _track_broadcast_offer(room, sid, payload)
         log.info(
             "offer_broadcast",
-            extra={"event": "offer", "sid": request.sid, "room": room, **offer_meta},
+            extra={
+                "event": "offer",
+                "sid": sid,
+                "room": room,
+                "routes": routes,
+                **offer_meta,
+            },
         )
-        emit("offer", data, room=room, include_self=False)
 
 
 @socketio.on("answer")
+@_instrumented("answer")
+@_rate_limited("answer")
 def on_answer(data):
+    sid = _sid()
     room = data.get("room")
     to_sid = data.get("to")
     answer_meta = _sdp_info(data.get("answer"))
-    data = _augment_with_sender_meta(data)
 
     if to_sid:
         if not _in_room(to_sid, room):
@@ -488,7 +2009,7 @@ def on_answer(data):
                 "answer_target_not_in_room",
                 extra={
                     "event": "answer",
-                    "sid": request.sid,
+                    "sid": sid,
                     "room": room,
                     "to": to_sid,
                 },
@@ -498,29 +2019,88 @@ def on_answer(data):
             "answer_routed_1to1",
             extra={
                 "event": "answer",
-                "sid": request.sid,
+                "sid": sid,
                 "room": room,
                 "to": to_sid,
                 **answer_meta,
                 "src": data.get("meta", {}).get("src"),
             },
         )
-        emit("answer", data, to=to_sid)
+        emit("answer", _augment_with_sender_meta(data, to_sid), to=to_sid)
     else:
+        routes = _emit_routed("answer", room, _augment_with_sender_meta(data))
         log.info(
             "answer_broadcast",
-            extra={"event": "answer", "sid": request.sid, "room": room, **answer_meta},
+            extra={
+                "event": "answer",
+                "sid": sid,
+                "room": room,
+                "routes": routes,
+                **answer_meta,
+            },
         )
-        emit("answer", data, room=room, include_self=False)
+    negotiation_timer.answer_relayed(room, sid)
+
+
+@socketio.on("qos-report")
+@_instrumented("qos-report")
+@_rate_limited("qos-report")
+def on_qos_report(data):
+    """
+    Qualidade de recepção do listener, enviada periodicamente.
+    Exemplo:
+      socket.emit("qos-report", { room, jitter_ms: 12, loss: 0.01, rtt_ms: 80, level: 0.3 })
+    Quando o listener passa a (ou deixa de) estar degradado, os publishers do
+    idioma dele recebem `listener-qos`; quando a fração de degradados do canal
+    muda o degrau da escada, recebem `bitrate-hint`.
+    """
+    if not isinstance(data, dict):
+        return
+    sid = _sid()
+    room = data.get("room")
+    if not _in_room(sid, room):
+        return
+    lang = wanted_language(presence.get_meta(sid)) or ""
+    change = qos.report(room, lang, sid, data)
+    _advise_bitrate(room, lang)
+    if change is None:
+        return
+    degraded, sample = change
+    keys = [f"serves::{lang}", f"serves::{ANY}"] if lang else ["pub"]
+    emit(
+        "listener-qos",
+        {"room": room, "id": sid, "lang": lang, "degraded": degraded, **sample},
+        to=[view_room(room, k) for k in keys],
+    )
+    log.info(
+        "listener_qos_changed",
+        extra={"event": "qos-report", "sid": sid, "room": room, "degraded": degraded, **sample},
+    )
+
+
+@socketio.on("negotiation-state")
+@_instrumented("negotiation-state")
+@_rate_limited("negotiation-state")
+def on_negotiation_state(data):
+    """
+    Estado da conexão WebRTC reportado pelo listener, para o time-to-first-audio.
+    Exemplo:
+      socket.emit("negotiation-state", { room, from: "<sid do publisher>", state: "connected" })
+    """
+    if isinstance(data, dict):
+        negotiation_timer.state(data.get("room"), _sid(), data.get("state"))
 
 
 @socketio.on("ice-candidate")
+@_instrumented("ice-candidate")
+@_rate_limited("ice-candidate")
 def on_ice_candidate(data):
+    sid = _sid()
     room = data.get("room")
     to_sid = data.get("to")
     cand = data.get("candidate")
-    cand_type = _candidate_type(cand)
-    data = _augment_with_sender_meta(data)
+    debug = log.isEnabledFor(logging.DEBUG)
+    cand_type = Lazy(_candidate_type, cand)
 
     if to_sid:
         if not _in_room(to_sid, room):
@@ -528,41 +2108,115 @@ def on_ice_candidate(data):
                 "ice_target_not_in_room",
                 extra={
                     "event": "ice-candidate",
-                    "sid": request.sid,
+                    "sid": sid,
                     "room": room,
                     "to": to_sid,
                 },
             )
             return
+        batched = ice_batcher.enabled and supports_ice_batch(presence.get_meta(to_sid))
+        if debug:
+            log.debug(
+                "ice_routed_1to1",
+                extra={
+                    "event": "ice-candidate",
+                    "sid": sid,
+                    "room": room,
+                    "to": to_sid,
+                    "candidate_type": cand_type,
+                    "batched": batched,
+                },
+            )
+        else:
+            log.count("ice_routed_1to1", logging.DEBUG)
+        if batched:
+            ice_batcher.add(
+                sid,
+                to_sid,
+                cand,
+                lambda: _augment_with_sender_meta(data, to_sid),
+            )
+        else:
+            emit("ice-candidate", _augment_with_sender_meta(data, to_sid), to=to_sid)
+    else:
+        payload = _augment_with_sender_meta(data)
+        routes = _emit_routed("ice-candidate", room, payload)
+        offer_cache.add_candidates(room, sid, [payload])
         log.debug(
-            "ice_routed_1to1",
+            "ice_broadcast",
             extra={
                 "event": "ice-candidate",
-                "sid": request.sid,
+                "sid": sid,
                 "room": room,
-                "to": to_sid,
                 "candidate_type": cand_type,
-                "src": data.get("meta", {}).get("src"),
+                "routes": routes,
             },
         )
-        emit("ice-candidate", data, to=to_sid)
-    else:
-        log.debug(
-            "ice_broadcast",
+
+
+@socketio.on("ice-candidates")
+@_instrumented("ice-candidates")
+@_rate_limited("ice-candidates")
+def on_ice_candidates(data):
+    """
+    Lote de candidatos de um mesmo par.
+    Exemplo:
+      socket.emit("ice-candidates", { room, to, candidates: [c1, c2], end: true })
+    Destinos sem "ice-batch" recebem os candidatos como ice-candidate avulsos.
+    """
+    room = data.get("room")
+    to_sid = data.get("to")
+    candidates = data.get("candidates")
+    if not isinstance(candidates, list):
+        candidates = []
+    end = bool(data.get("end"))
+
+    if to_sid and not _in_room(to_sid, room):
+        log.warning(
+            "ice_target_not_in_room",
             extra={
-                "event": "ice-candidate",
-                "sid": request.sid,
+                "event": "ice-candidates",
+                "sid": _sid(),
                 "room": room,
-                "candidate_type": cand_type,
+                "to": to_sid,
             },
         )
-        emit("ice-candidate", data, room=room, include_self=False)
+        return
+
+    log.debug(
+        "ice_batch_relayed",
+        extra={
+            "event": "ice-candidates",
+            "sid": _sid(),
+            "room": room,
+            "to": to_sid,
+            "count": len(candidates),
+            "end": end,
+        },
+    )
+    data = _augment_with_sender_meta(data, to_sid)
+    if to_sid and supports_ice_batch(presence.get_meta(to_sid)):
+        emit("ice-candidates", data, to=to_sid)
+        return
+
+    envelope = {k: v for k, v in data.items() if k not in ("candidates", "end")}
+    singles = [{**envelope, "candidate": cand} for cand in candidates]
+    if end:
+        # fim dos candidatos: vai adiante como no ice-candidate avulso
+        singles.append({**envelope, "candidate": None})
+    for single in singles:
+        if to_sid:
+            emit("ice-candidate", single, to=to_sid)
+        else:
+            _emit_routed("ice-candidate", room, single)
+    if not to_sid:
+        offer_cache.add_candidates(room, _sid(), singles)
 
 
 @socketio.on_error_default
 def default_error_handler(e):
     log.exception(
-        "socketio_handler_error", extra={"event": "error", "sid": request.sid}
+        "socketio_handler_error", extra={"event": "error", "sid": _sid()}
     )
 
 
@@ -0,0 +1,123 @@
+"""
+Agendador de broadcasts do roster.
+
+Em vez de emitir um delta por mudança, acumula as mudanças de cada room por
+uma janela curta (ROSTER_COALESCE_MS) e emite um único `roster-delta` por
+stream (view room), com uma sequência só. Mudanças do mesmo membro dentro da
+janela são compactadas (ex.: added + updated -> added).
+
+Com janela 0 os deltas saem na hora, como member-added/removed/updated.
+
+Quem entra na room só passa a ouvir os streams depois do flush do lote
+pendente (`after_flush`): o snapshot que ele recebe já inclui essas mudanças,
+inclusive a própria entrada. Todos os que esperavam o mesmo lote entram nas
+view rooms antes de qualquer snapshot ser montado, senão quem recebe o
+snapshot primeiro não enxerga quem entrou depois dele na mesma janela (e o
+delta desse já saiu).
+"""
+
+import logging
+from typing import Any, Callable
+
+from metrics import EventLogger
+from roster_view import view_room
+
+log = EventLogger(logging.getLogger("webrtc_signaling.broadcast"))
+
+
+class RosterBroadcaster:
+    def __init__(self, socketio, presence, window_ms: int = 100):
+        self.socketio = socketio
+        self.presence = presence
+        self.window = max(0, window_ms) / 1000.0
+        # room -> view key -> member id -> (kind, member)
+        self.pending: dict[str, dict[str, dict[str, tuple[str, dict]]]] = {}
+        self.scheduled: set[str] = set()
+        # room -> (entrar, snapshot) a rodar logo depois do próximo flush
+        self.waiters: dict[str, list[tuple[Callable[[], None], Callable[[], None]]]] = {}
+
+    def push(self, kind: str, room: str, member: dict, keys: set[str]):
+        if not keys:
+            return
+        if self.window <= 0:
+            self._emit_single(kind, room, member, keys)
+            return
+
+        views = self.pending.setdefault(room, {})
+        mid = member["id"]
+        for key in keys:
+            changes = views.setdefault(key, {})
+            prev = changes.pop(mid, None)
+            if prev is not None and prev[0] == "added" and kind == "updated":
+                kind_for_key = "added"
+            else:
+                kind_for_key = kind
+            changes[mid] = (kind_for_key, member)
+
+        if room not in self.scheduled:
+            self.scheduled.add(room)
+            self.socketio.start_background_task(self._flush_later, room)
+
+    def is_pending(self, room: str) -> bool:
+        return room in self.pending
+
+    def after_flush(self, room: str, enter: Callable[[], None], snapshot: Callable[[], None]):
+        """
+        Depois que o lote pendente da room sair (fora do handler): roda o
+        `enter` de todos os que esperavam e só então os `snapshot`.
+        """
+        self.waiters.setdefault(room, []).append((enter, snapshot))
+
+    def _flush_later(self, room: str):
+        self.socketio.sleep(self.window)
+        self.flush(room)
+
+    def flush(self, room: str):
+        self.scheduled.discard(room)
+        views = self.pending.pop(room, None)
+        # quem chegar enquanto o emit cede o hub espera o lote seguinte
+        waiters = self.waiters.pop(room, ())
+        if views:
+            self._emit_batch(room, views)
+        for phase in (0, 1):
+            for waiter in waiters:
+                try:
+                    waiter[phase]()
+                except Exception:
+                    log.exception("after_flush_failed", extra={"room": room})
+
+    def _emit_batch(self, room: str, views: dict[str, dict[str, tuple[str, dict]]]):
+        room_size = self.presence.room_size(room)
+        for key in sorted(views):
+            vr = view_room(room, key)
+            payload: dict[str, Any] = {
+                "room": room,
+                "view": key,
+                "seq": self.presence.next_seq(vr),
+                "room_size": room_size,
+                "changes": [
+                    {"type": kind, "member": member}
+                    for kind, member in views[key].values()
+                ],
+            }
+            self.socketio.emit("roster-delta", payload, room=vr)
+
+    def flush_all(self):
+        for room in set(self.pending) | set(self.waiters):
+            self.flush(room)
+
+    def _emit_single(self, kind: str, room: str, member: dict, keys: set[str]):
+        room_size = self.presence.room_size(room)
+        for key in sorted(keys):
+            vr = view_room(room, key)
+            self.socketio.emit(
+                f"member-{kind}",
+                {
+                    "room": room,
+                    "view": key,
+                    "seq": self.presence.next_seq(vr),
+                    "room_size": room_size,
+                    "member": member,
+                },
+                room=vr,
+            )
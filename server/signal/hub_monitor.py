@@ -0,0 +1,148 @@
+"""
+Monitor do hub do eventlet.
+
+Todo o signal roda num único hub: uma chamada bloqueante ou um handler lento
+atrasa todas as rooms. O `HubMonitor`:
+
+  - mede continuamente o atraso de agendamento (dorme `interval` e vê quanto
+    a mais demorou para acordar) e guarda as últimas amostras para percentis;
+  - registra qual handler Socket.IO está rodando (evento, sid, room) e o que
+    mais ocupou o hub desde o último probe, com início e fim, para os avisos
+    de lag apontarem o culpado mesmo quando ele já terminou;
+  - opcionalmente sobe uma thread do SO (fora do hub) que, se o hub parar de
+    responder por `stall` segundos, captura a pilha do greenlet que o está
+    bloqueando.
+"""
+
+import logging
+import sys
+import time
+import traceback
+from collections import deque
+
+from metrics import EventLogger
+
+log = EventLogger(logging.getLogger("webrtc_signaling.hub"))
+
+
+class HubMonitor:
+    def __init__(
+        self,
+        socketio,
+        interval_s: float = 0.1,
+        warn_s: float = 0.1,
+        samples: int = 600,
+        histogram=None,
+    ):
+        self.socketio = socketio
+        self.interval = interval_s
+        self.warn = warn_s
+        self.lags: deque[float] = deque(maxlen=samples)
+        self.histogram = histogram
+        self.heartbeat = time.monotonic()
+        # (evento, sid, room, início) do handler em execução
+        self.current: tuple[str, str | None, str | None, float] | None = None
+        # handler terminado que mais sobrepôs a janela do probe atual:
+        # (sobreposição, evento, sid, room, início, fim)
+        self.worst: tuple[float, str, str | None, str | None, float, float] | None = None
+        self._window_start = time.monotonic()
+
+    def start(self):
+        self.socketio.start_background_task(self._probe)
+
+    def begin(self, event: str, sid: str | None, room: str | None) -> tuple:
+        self.current = (event, sid, room, time.monotonic())
+        return self.current
+
+    def end(self, handler: tuple):
+        """
+        Fecha o handler em execução. Quando o hub atrasa, o bloqueio quase
+        sempre já terminou ao acordar o probe; por isso guarda o handler que
+        mais tempo ocupou a janela do probe. `handler` é o que `begin`
+        devolveu: um handler que cedeu o hub pode terminar depois de outro.
+        """
+        event, sid, room, start = handler
+        if self.current is handler:
+            self.current = None
+        end = time.monotonic()
+        overlap = end - max(start, self._window_start)
+        if self.worst is None or overlap > self.worst[0]:
+            self.worst = (overlap, event, sid, room, start, end)
+
+    def _culprit(self, now: float) -> dict:
+        """Handler (terminado ou em execução) que mais sobrepôs [início da janela, now]."""
+        best = self.worst
+        if self.current is not None:
+            event, sid, room, start = self.current
+            overlap = now - max(start, self._window_start)
+            if best is None or overlap > best[0]:
+                best = (overlap, event, sid, room, start, None)
+        if best is None:
+            return {"handler": None, "sid": None, "room": None}
+        overlap, event, sid, room, start, end = best
+        return {
+            "handler": event,
+            "sid": sid,
+            "room": room,
+            "handler_ms": round(((end if end is not None else now) - start) * 1000, 1),
+            "overlap_ms": round(overlap * 1000, 1),
+            "running": end is None,
+        }
+
+    def _probe(self):
+        while True:
+            before = time.monotonic()
+            self._window_start = before
+            self.worst = None
+            self.socketio.sleep(self.interval)
+            now = time.monotonic()
+            self.heartbeat = now
+            lag = max(0.0, now - before - self.interval)
+            self.lags.append(lag)
+            if self.histogram is not None:
+                self.histogram.observe(lag)
+            if lag >= self.warn:
+                log.warning("hub_lag", extra={"lag_ms": round(lag * 1000, 1), **self._culprit(now)})
+
+    def percentiles(self, qs: tuple[float, ...] = (0.5, 0.9, 0.99)) -> dict[str, float]:
+        values = sorted(self.lags)
+        if not values:
+            return {}
+        out = {str(q): values[min(len(values) - 1, int(q * len(values)))] for q in qs}
+        out["max"] = values[-1]
+        return out
+
+    def start_stall_watchdog(self, stall_s: float):
+        """
+        Thread real do SO: enxerga o hub de fora. Se o heartbeat do probe
+        parar por `stall_s`, loga a pilha da thread principal, que é onde o
+        greenlet bloqueante está executando.
+        """
+        from eventlet import patcher
+
+        threading = patcher.original("threading")
+        real_time = patcher.original("time")
+        main_id = threading.main_thread().ident
+
+        def watch():
+            reported = 0.0
+            while True:
+                real_time.sleep(stall_s / 2)
+                stalled = real_time.monotonic() - self.heartbeat
+                if stalled < stall_s or self.heartbeat == reported:
+                    continue
+                reported = self.heartbeat
+                frame = sys._current_frames().get(main_id)
+                event, sid, room, _ = self.current or (None, None, None, None)
+                log.error(
+                    "hub_stalled",
+                    extra={
+                        "stalled_ms": round(stalled * 1000),
+                        "handler": event,
+                        "sid": sid,
+                        "room": room,
+                        "stack": "".join(traceback.format_stack(frame)) if frame else None,
+                    },
+                )
+
+        threading.Thread(target=watch, name="hub-watchdog", daemon=True).start()
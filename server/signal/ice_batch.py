@@ -0,0 +1,82 @@
+"""
+Micro-batching de ICE candidates por par (from, to).
+
+Clientes legados mandam um `ice-candidate` por candidato. Quando o destino
+anuncia a capacidade "ice-batch", o relay acumula os candidatos do par por
+ICE_BATCH_MS e entrega um único `ice-candidates`. O lote sai antes do prazo
+ao atingir `max_batch` candidatos ou ao receber o fim da coleta
+(candidate nulo/vazio).
+"""
+
+from typing import Any, Callable
+
+ICE_BATCH_CAP = "ice-batch"
+
+
+def is_end_of_candidates(candidate: Any) -> bool:
+    if candidate is None:
+        return True
+    if isinstance(candidate, dict):
+        return not candidate.get("candidate")
+    if isinstance(candidate, str):
+        return not candidate.strip()
+    return False
+
+
+def supports_ice_batch(meta: dict) -> bool:
+    caps = meta.get("caps")
+    return isinstance(caps, list) and ICE_BATCH_CAP in caps
+
+
+class IceBatcher:
+    def __init__(self, socketio, window_ms: int = 20, max_batch: int = 32):
+        self.socketio = socketio
+        self.window = max(0, window_ms) / 1000.0
+        self.max_batch = max_batch
+        # (from, to) -> {"base": dict, "candidates": list, "end": bool}
+        self.pending: dict[tuple[str, str], dict[str, Any]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def add(self, from_sid: str, to_sid: str, candidate: Any, make_base: Callable[[], dict]):
+        """
+        `make_base()` monta o envelope (room, from, meta); só é chamado no
+        primeiro candidato do lote.
+        """
+        key = (from_sid, to_sid)
+        batch = self.pending.get(key)
+        if batch is None:
+            base = {k: v for k, v in make_base().items() if k != "candidate"}
+            batch = {"base": base, "candidates": [], "end": False}
+            self.pending[key] = batch
+            self.socketio.start_background_task(self._flush_later, key)
+
+        end = is_end_of_candidates(candidate)
+        if end:
+            batch["end"] = True
+        else:
+            batch["candidates"].append(candidate)
+
+        if end or len(batch["candidates"]) >= self.max_batch:
+            self.flush(key)
+
+    def _flush_later(self, key: tuple[str, str]):
+        self.socketio.sleep(self.window)
+        self.flush(key)
+
+    def flush(self, key: tuple[str, str]):
+        batch = self.pending.pop(key, None)
+        if batch is None:
+            return
+        payload = dict(batch["base"])
+        payload["candidates"] = batch["candidates"]
+        if batch["end"]:
+            payload["end"] = True
+        self.socketio.emit("ice-candidates", payload, to=key[1])
+
+    def drop(self, sid: str):
+        """Descarta lotes pendentes envolvendo um sid que saiu."""
+        for key in [k for k in self.pending if sid in k]:
+            self.pending.pop(key, None)
@@ -0,0 +1,146 @@
+"""
+Pipeline de logs fora do caminho quente.
+
+Cada linha de log custava formatação (`json.dumps`, timestamp) e escrita no
+stderr dentro do hub. Aqui:
+
+  - `SamplingFilter` descarta, por nome de evento, a fração configurada dos
+    registros DEBUG/INFO de alto volume (ex.: 1% de `ice_routed_1to1`) e só
+    então resolve os campos `Lazy` do `extra`, que não custam nada se o
+    registro for descartado;
+  - `start_async_logging` troca o handler de saída por uma fila: o hub só
+    enfileira (sem bloquear; com a fila cheia o registro é descartado e
+    contado) e uma thread do SO formata e escreve.
+
+Formato de LOG_SAMPLE: "evento=fração,...", ex.: "ice_routed_1to1=0.01".
+"""
+
+import copy
+import logging
+import random
+from logging.handlers import QueueHandler
+
+DEFAULT_SAMPLES = "ice_routed_1to1=0.01,ice_broadcast=0.01,ice_batch_relayed=0.1"
+
+
+class Lazy:
+    """Campo de `extra` calculado só se o registro for de fato emitido."""
+
+    __slots__ = ("fn", "args")
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    def __call__(self):
+        return self.fn(*self.args)
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    rates: dict[str, float] = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item or "=" not in item:
+            continue
+        event, value = item.split("=", 1)
+        try:
+            rate = float(value)
+        except ValueError:
+            raise ValueError(f"LOG_SAMPLE inválido: {item}")
+        rates[event.strip()] = min(1.0, max(0.0, rate))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # avisos e erros nunca são amostrados
+        if record.levelno < logging.WARNING and isinstance(record.msg, str):
+            rate = self.rates.get(record.msg)
+            if rate is not None and rate < 1.0:
+                if random.random() >= rate:
+                    self.sampled_out += 1
+                    return False
+                record.sample_rate = rate
+        for key, value in record.__dict__.items():
+            if isinstance(value, Lazy):
+                record.__dict__[key] = value()
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, queue, full_error):
+        super().__init__(queue)
+        self.full_error = full_error
+        self.dropped = 0
+        self._exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A formatação fica para a thread; aqui só o que depende do estado
+        # atual (args da mensagem, traceback).
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except self.full_error:
+            self.dropped += 1
+
+
+def _os_threading():
+    """threading/queue reais, mesmo com o eventlet tendo feito monkey patch."""
+    try:
+        from eventlet import patcher
+    except ImportError:
+        import queue
+        import threading
+
+        return queue, threading
+    return patcher.original("queue"), patcher.original("threading")
+
+
+def start_async_logging(handler: logging.Handler, max_queue: int = 10000):
+    """
+    Devolve (handler de fila, stop). O `handler` original passa a ser usado
+    só pela thread de escrita; `stop()` esvazia a fila no shutdown.
+    """
+    queue_mod, threading = _os_threading()
+    records = queue_mod.Queue(maxsize=max_queue)
+    queue_handler = _NonBlockingQueueHandler(records, queue_mod.Full)
+    for flt in handler.filters:
+        queue_handler.addFilter(flt)
+    handler.filters = []
+    # o lock criado pelo logging pode ser verde; a thread precisa de um real
+    handler.lock = threading.RLock()
+
+    def drain():
+        while True:
+            record = records.get()
+            if record is None:
+                return
+            try:
+                handler.handle(record)
+            except Exception:
+                handler.handleError(record)
+
+    writer = threading.Thread(target=drain, name="log-writer", daemon=True)
+    writer.start()
+
+    def stop():
+        try:
+            records.put(None, timeout=1.0)
+        except queue_mod.Full:
+            return
+        writer.join(timeout=2.0)
+
+    return queue_handler, stop
@@ -0,0 +1,123 @@
+"""
+Validação do meta enviado pelos clientes (join / update-meta).
+
+O meta de cada sid fica em memória (e no Redis) enquanto ele estiver
+conectado e é repetido em todo room-info, então só entram os campos que o
+signal usa, com tamanho limitado: códigos de idioma curtos, no máximo
+`max_pairs` pares (cada um reduzido a `{source: {code}, target: {code}}`) e
+`max_caps` capacidades; o papel tem de ser um dos conhecidos (`ROLES`).
+Códigos, papéis e capacidades são internados, então milhares de listeners
+com `want: "en-US"` compartilham a mesma string. Campos inválidos são
+descartados e devolvidos para o log.
+
+Os apps de palestrante e tradutor mandam só `src`/`tgt`: para publishers
+`src` vira `source` e `tgt` vira o destino de um par, que é o que a visão do
+roster usa para saber quais idiomas eles servem.
+"""
+
+import re
+import sys
+from typing import Any
+
+from roster_view import PUBLISHER_ROLES, ROLES
+
+TOKEN_MAX = 32
+_LANG_RE = re.compile(r"^[A-Za-z0-9_-]{1,35}$")
+WANT_KEYS = ("want", "target", "target_code", "tgt")
+SOURCE_KEYS = ("source", "src")
+
+
+def _lang(value) -> str | None:
+    """Código de idioma internado; "" continua valendo como "sem idioma"."""
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if not value:
+        return value
+    return sys.intern(value) if _LANG_RE.match(value) else None
+
+
+def _token(value) -> str | None:
+    if isinstance(value, str) and 0 < len(value) <= TOKEN_MAX:
+        return sys.intern(value)
+    return None
+
+
+def _role(value) -> str | None:
+    return sys.intern(value) if isinstance(value, str) and value in ROLES else None
+
+
+def _pairs(value, max_pairs: int) -> list[dict] | None:
+    if not isinstance(value, list) or len(value) > max_pairs:
+        return None
+    out = []
+    for pair in value:
+        if not isinstance(pair, dict):
+            continue
+        clean = {}
+        for side in ("source", "target"):
+            lang = pair.get(side)
+            code = _lang(lang.get("code")) if isinstance(lang, dict) else None
+            if code:
+                clean[side] = {"code": code}
+        if clean:
+            out.append(clean)
+    return out
+
+
+def _caps(value, max_caps: int) -> list[str] | None:
+    if not isinstance(value, list):
+        return None
+    out: list[str] = []
+    for cap in value:
+        cap = _token(cap)
+        if cap and cap not in out:
+            out.append(cap)
+    return out[:max_caps]
+
+
+def _first_key(data: dict[str, Any], keys: tuple[str, ...]) -> str | None:
+    for key in keys:
+        if data.get(key) is not None:
+            return key
+    return None
+
+
+def clean_client_meta(
+    data: dict[str, Any], max_pairs: int, max_caps: int, role: str | None = None
+) -> tuple[dict[str, Any], list[str]]:
+    """
+    Devolve (campos válidos presentes em `data`, nomes dos rejeitados).
+    O idioma desejado vem de `want` ou dos aliases `target`/`target_code`/`tgt`.
+    Para publishers (papel de `data` ou o atual, `role`) `src` é alias de
+    `source` e o idioma de destino, sem `pairs`, vira `[{target: {code}}]`.
+    """
+    fields: dict[str, Any] = {}
+    rejected: list[str] = []
+
+    def take(key: str, value, clean):
+        if value is None:
+            return
+        if clean is None:
+            rejected.append(key)
+        else:
+            fields[key] = clean
+
+    take("role", data.get("role"), _role(data.get("role")))
+    publisher = fields.get("role", role) in PUBLISHER_ROLES
+    source_key = _first_key(data, SOURCE_KEYS if publisher else SOURCE_KEYS[:1])
+    if source_key:
+        take("source", data[source_key], _lang(data[source_key]))
+    take("pairs", data.get("pairs"), _pairs(data.get("pairs"), max_pairs))
+    take("caps", data.get("caps"), _caps(data.get("caps"), max_caps))
+    want_key = _first_key(data, WANT_KEYS)
+    if want_key and publisher:
+        # publisher não pede idioma: o destino é o que ele serve
+        target = _lang(data[want_key])
+        if target is None:
+            rejected.append(want_key)
+        elif data.get("pairs") is None:
+            fields["pairs"] = [{"target": {"code": target}}] if target else []
+    elif want_key:
+        take("want", data[want_key], _lang(data[want_key]))
+    return fields, rejected
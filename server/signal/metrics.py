@@ -0,0 +1,159 @@
+"""
+Métricas do signal no formato texto do Prometheus.
+
+Registro mínimo, sem dependência externa: contadores e histogramas são dicts
+indexados pela tupla de labels (incremento O(1), histograma com bisect sobre
+buckets fixos); gauges e valores de outros componentes são coletados só no
+scrape, por callbacks.
+"""
+
+import logging
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+Sample = tuple[dict[str, str], float]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            out.append(f"{self.name}{_labels(self.labelnames, labels)} {_fmt(value)}")
+        return out
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [contagem por bucket..., +Inf], soma
+        self.values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def drop_series(self, index: int, value):
+        """Remove as séries cujo label na posição `index` vale `value`."""
+        for labels in [k for k in self.values if k[index] == value]:
+            del self.values[labels]
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _fmt(bound)
+                names = self.labelnames + ("le",)
+                out.append(
+                    f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}"
+                )
+            base = _labels(self.labelnames, labels)
+            out.append(f"{self.name}_sum{base} {_fmt(total[0])}")
+            out.append(f"{self.name}_count{base} {cumulative}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Counter | Histogram] = []
+        # (nome, tipo, doc, callback) coletados no scrape
+        self.collectors: list[tuple[str, str, str, Callable[[], list[Sample]]]] = []
+
+    def counter(self, name: str, doc: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, doc, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        doc: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, doc, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self, name: str, kind: str, doc: str, fn: Callable[[], list[Sample]]):
+        self.collectors.append((name, kind, doc, fn))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for name, kind, doc, fn in self.collectors:
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in fn():
+                lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class EventLogger(logging.LoggerAdapter):
+    """
+    Logger que conta cada evento (`offer_target_not_in_room`, `peer_joined`...)
+    por nome e nível na própria chamada: o contador não depende de LOG_LEVEL,
+    da amostragem (LOG_SAMPLE) nem da fila de escrita, que só decidem o que
+    vira linha de log.
+    """
+
+    # contador de eventos (name, level); definido pelo app ao montar /metrics
+    counter: Counter | None = None
+
+    def __init__(self, logger: logging.Logger):
+        super().__init__(logger, {})
+
+    def process(self, msg, kwargs):
+        return msg, kwargs
+
+    def count(self, msg, level: int):
+        """Conta um evento cuja chamada de log foi pulada (ex.: DEBUG desligado)."""
+        if EventLogger.counter is not None:
+            name = msg if isinstance(msg, str) else "other"
+            EventLogger.counter.inc(name, logging.getLevelName(level).lower())
+
+    def log(self, level, msg, *args, **kwargs):
+        self.count(msg, level)
+        # o registro aponta para quem chamou, não para este método
+        kwargs.setdefault("stacklevel", 2)
+        super().log(level, msg, *args, **kwargs)
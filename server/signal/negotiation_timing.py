@@ -0,0 +1,105 @@
+"""
+Time-to-first-audio dos listeners, medido no signal.
+
+Para cada listener que entra numa room o relógio começa no `join` e marca a
+primeira vez que ele recebe um offer (direto, broadcast ou do cache), a
+primeira vez que o answer dele é repassado e o `negotiation-state`
+"connected" que o próprio cliente reporta. Cada etapa vira uma observação no
+histograma (room, idioma, etapa); quem não conecta termina como "failed",
+"abandoned" (saiu antes), "hls" (foi para o HLS) ou "timeout".
+"""
+
+import time
+from typing import Any
+
+# Segundos: a negociação inteira costuma levar de centenas de ms a dezenas de s.
+TTFA_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 60.0)
+
+
+class NegotiationTimer:
+    def __init__(self, histogram, outcomes, timeout_s: float = 60.0):
+        self.histogram = histogram  # labels: room, lang, stage
+        self.outcomes = outcomes  # labels: outcome
+        self.timeout = timeout_s
+        # room -> sid -> {"lang", "t0", "offer", "answer"}
+        self.pending: dict[str, dict[str, dict[str, Any]]] = {}
+        self.rooms_by_sid: dict[str, set[str]] = {}
+        self._last_sweep = time.monotonic()
+
+    def joined(self, room: str, sid: str, lang: str):
+        now = time.monotonic()
+        self._sweep(now)
+        if sid in self.pending.get(room, {}):
+            return
+        self.pending.setdefault(room, {})[sid] = {
+            "lang": lang,
+            "t0": now,
+            "offer": False,
+            "answer": False,
+        }
+        self.rooms_by_sid.setdefault(sid, set()).add(room)
+
+    def _mark(self, room: str, sid: str, stage: str):
+        entry = self.pending.get(room, {}).get(sid)
+        if entry is None or entry[stage]:
+            return
+        entry[stage] = True
+        self.histogram.observe(time.monotonic() - entry["t0"], room, entry["lang"], stage)
+
+    def offer_relayed(self, room: str, sid: str):
+        self._mark(room, sid, "offer")
+
+    def offers_broadcast(self, room: str, langs: set[str]):
+        """Offer sem `to`: chega a todos os pendentes que querem um desses idiomas."""
+        for sid, entry in list(self.pending.get(room, {}).items()):
+            if not langs or not entry["lang"] or entry["lang"] in langs:
+                self._mark(room, sid, "offer")
+
+    def answer_relayed(self, room: str, sid: str):
+        self._mark(room, sid, "answer")
+
+    def state(self, room: str, sid: str, state: str):
+        entry = self.pending.get(room, {}).get(sid)
+        if entry is None:
+            return
+        if state == "connected":
+            self.histogram.observe(
+                time.monotonic() - entry["t0"], room, entry["lang"], "connected"
+            )
+            self._finish(room, sid, "connected")
+        elif state == "failed":
+            self._finish(room, sid, "failed")
+
+    def drop(self, sid: str, room: str | None = None, outcome: str = "abandoned"):
+        for r in [room] if room is not None else list(self.rooms_by_sid.get(sid, ())):
+            if sid in self.pending.get(r, {}):
+                self._finish(r, sid, outcome)
+
+    def forget_room(self, room: str):
+        """Room vazia: descarta os pendentes e as séries dela no histograma."""
+        for sid in list(self.pending.get(room, {})):
+            self._finish(room, sid, "abandoned")
+        self.histogram.drop_series(0, room)
+
+    def _finish(self, room: str, sid: str, outcome: str):
+        sids = self.pending.get(room)
+        if sids is None or sids.pop(sid, None) is None:
+            return
+        if not sids:
+            del self.pending[room]
+        rooms = self.rooms_by_sid.get(sid)
+        if rooms is not None:
+            rooms.discard(room)
+            if not rooms:
+                del self.rooms_by_sid[sid]
+        self.outcomes.inc(outcome)
+
+    def _sweep(self, now: float):
+        """Encerra como "timeout" quem não conectou em `timeout` segundos."""
+        if now - self._last_sweep < min(self.timeout, 10.0):
+            return
+        self._last_sweep = now
+        for room, sids in list(self.pending.items()):
+            for sid, entry in list(sids.items()):
+                if now - entry["t0"] > self.timeout:
+                    self._finish(room, sid, "timeout")
@@ -0,0 +1,81 @@
+"""
+Cache do último offer broadcast de cada publisher.
+
+Um `offer` sem `to` vai uma vez para a audiência presente; quem entra depois
+teria de esperar o publisher reagir ao peer-joined e gerar outro. Aqui o
+último offer broadcast de cada (room, publisher) fica guardado, com os
+idiomas que ele serve e os ICE candidates broadcast que vieram depois dele
+(até `max_candidates`), para ser entregue ao listener assim que ele entra.
+
+Um offer novo substitui o anterior; `update-meta`, `leave`, suspensão e
+desconexão do publisher invalidam. Entradas com mais de `ttl_s` segundos não
+são entregues. O cache é local ao nó: com vários nós, só quem recebeu o
+offer o tem.
+"""
+
+import time
+from typing import Any
+
+from ice_batch import is_end_of_candidates
+
+
+class OfferCache:
+    def __init__(self, ttl_s: float = 300.0, max_candidates: int = 32):
+        self.ttl = ttl_s
+        self.max_candidates = max_candidates
+        # room -> publisher -> {"offer", "candidates", "langs", "ts", "end"}
+        self.entries: dict[str, dict[str, dict[str, Any]]] = {}
+        self.rooms_by_sid: dict[str, set[str]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def store_offer(self, room: str, sid: str, offer: dict, langs: set[str]):
+        self.entries.setdefault(room, {})[sid] = {
+            "offer": offer,
+            "candidates": [],
+            "langs": set(langs),
+            "ts": time.monotonic(),
+            "end": False,
+        }
+        self.rooms_by_sid.setdefault(sid, set()).add(room)
+
+    def add_candidates(self, room: str, sid: str, payloads: list[dict]):
+        """ICE broadcast do publisher; só vale para o offer em cache."""
+        entry = self.entries.get(room, {}).get(sid)
+        if entry is None or entry["end"]:
+            return
+        for payload in payloads:
+            if len(entry["candidates"]) >= self.max_candidates:
+                return
+            entry["candidates"].append(payload)
+            if is_end_of_candidates(payload.get("candidate")):
+                entry["end"] = True
+                return
+
+    def offers_for(self, room: str, want: str | None) -> list[dict[str, Any]]:
+        """Offers vigentes na room para quem quer `want` (None = todos)."""
+        now = time.monotonic()
+        out = []
+        for sid, entry in list(self.entries.get(room, {}).items()):
+            if now - entry["ts"] > self.ttl:
+                self.invalidate(sid, room)
+                continue
+            if want is None or not entry["langs"] or want in entry["langs"]:
+                out.append(entry)
+        return out
+
+    def invalidate(self, sid: str, room: str | None = None):
+        rooms = self.rooms_by_sid.get(sid)
+        if not rooms:
+            return
+        for r in [room] if room is not None else list(rooms):
+            publishers = self.entries.get(r)
+            if publishers is not None:
+                publishers.pop(sid, None)
+                if not publishers:
+                    del self.entries[r]
+            rooms.discard(r)
+        if not rooms:
+            self.rooms_by_sid.pop(sid, None)
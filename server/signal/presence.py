@@ -0,0 +1,645 @@
+"""
+Backends de presença do servidor de sinalização.
+
+Guardam quem está em cada room, em quais rooms cada sid está, o meta de cada
+sid e as inscrições nos canais `::src::`. O `LocalPresence` mantém tudo em
+memória (um único processo / testes); o `RedisPresence` compartilha o estado
+entre workers e nós, permitindo escalar o signal horizontalmente.
+"""
+
+import json
+import os
+import socket
+from typing import Any, Iterable
+
+
+def default_node_id() -> str:
+    """Identificador estável do nó (hostname do container por padrão)."""
+    return os.getenv("SIGNAL_NODE_ID") or socket.gethostname()
+
+
+class PresenceBackend:
+    """Interface comum aos backends de presença."""
+
+    node_id: str
+    # O estado sobrevive a um restart do processo?
+    persistent: bool = False
+
+    # ----- rooms -----
+    def add_member(self, room: str, sid: str) -> int:
+        raise NotImplementedError
+
+    def remove_member(self, room: str, sid: str) -> int:
+        raise NotImplementedError
+
+    def members(self, room: str) -> set[str]:
+        raise NotImplementedError
+
+    def room_size(self, room: str) -> int:
+        raise NotImplementedError
+
+    def has_member(self, room: str, sid: str) -> bool:
+        raise NotImplementedError
+
+    def rooms(self) -> list[str]:
+        raise NotImplementedError
+
+    def rooms_of(self, sid: str) -> set[str]:
+        raise NotImplementedError
+
+    # ----- versão do roster -----
+    def next_seq(self, room: str) -> int:
+        """Incrementa e devolve a sequência do roster da room."""
+        raise NotImplementedError
+
+    def room_seq(self, room: str) -> int:
+        raise NotImplementedError
+
+    # ----- meta -----
+    def get_meta(self, sid: str) -> dict[str, Any]:
+        raise NotImplementedError
+
+    def get_metas(self, sids: Iterable[str]) -> dict[str, dict[str, Any]]:
+        raise NotImplementedError
+
+    def set_meta(self, sid: str, meta: dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    # ----- canais ::src:: -----
+    def add_channel(self, channel: str, sid: str) -> None:
+        raise NotImplementedError
+
+    def remove_channel(self, channel: str, sid: str) -> None:
+        raise NotImplementedError
+
+    def channel_members(self, channel: str) -> set[str]:
+        raise NotImplementedError
+
+    def channel_size(self, channel: str) -> int:
+        raise NotImplementedError
+
+    def channels_of(self, sid: str) -> set[str]:
+        """Canais em que o sid está inscrito (::src:: e view rooms)."""
+        raise NotImplementedError
+
+    # ----- ciclo de vida -----
+    def drop_sid(self, sid: str) -> None:
+        raise NotImplementedError
+
+    def claim(self, sid: str) -> None:
+        """Passa o sid para este nó (resume chegando por outra réplica)."""
+
+    def purge_node(self, node_id: str) -> dict[str, tuple[set[str], dict[str, Any]]]:
+        """Remove os sids órfãos de um nó; devolve {sid: (rooms, meta)} removidos."""
+        raise NotImplementedError
+
+    def heartbeat(self, ttl_s: float) -> None:
+        """Marca este nó como vivo pelos próximos `ttl_s` segundos."""
+
+    def sweep_dead_nodes(self) -> dict[str, dict[str, tuple[set[str], dict[str, Any]]]]:
+        """Purga os nós cujo heartbeat expirou; devolve {nó: retorno de purge_node}."""
+        return {}
+
+    # ----- métricas -----
+    def stats(self) -> dict[str, int]:
+        """Totais de rooms, sids, canais e inscrições (para /metrics)."""
+        raise NotImplementedError
+
+    def memory(self) -> dict[str, int]:
+        """Tamanho das estruturas mantidas por este processo (para /memory)."""
+        return self.stats()
+
+    # ----- snapshot (warm restart) -----
+    def snapshot(self) -> dict[str, Any]:
+        raise NotImplementedError
+
+    def track_changes(self) -> None:
+        """Passa a registrar o que muda, para `changes()`."""
+
+    def changes(self) -> dict[str, Any]:
+        """Sids e sequências alterados desde a última chamada (journal incremental)."""
+        raise NotImplementedError
+
+    def restore(self, state: dict[str, Any], changes: Iterable[dict] = ()) -> set[str]:
+        """Carrega um snapshot e as mudanças seguintes; devolve os sids restaurados."""
+        raise NotImplementedError
+
+
+class _SidState:
+    """Tudo o que o nó guarda de um sid, num único registro compacto."""
+
+    __slots__ = ("rooms", "channels", "meta")
+
+    def __init__(self):
+        self.rooms: set[str] = set()
+        self.channels: set[str] = set()
+        self.meta: dict[str, Any] = {}
+
+
+class LocalPresence(PresenceBackend):
+    """
+    Presença em memória do processo (modo single-worker e testes).
+
+    Consultas nunca criam entradas, e rooms, canais, sequências e sids
+    vazios são removidos assim que esvaziam: o tamanho do estado acompanha
+    o número de conexões, não o histórico do processo.
+
+    Cada mutação marca o sid (ou a sequência) como sujo; `changes()` devolve
+    cópias só do que mudou, para o journal não serializar o estado inteiro.
+    """
+
+    def __init__(self, node_id: str | None = None):
+        self.node_id = node_id or default_node_id()
+        self.room_members: dict[str, set[str]] = {}
+        self.channel_sids: dict[str, set[str]] = {}
+        self.sids: dict[str, _SidState] = {}
+        self.room_seqs: dict[str, int] = {}
+        # None enquanto ninguém consome `changes()` (sem journal)
+        self._dirty_sids: set[str] | None = None
+        self._dirty_seqs: set[str] | None = None
+
+    def track_changes(self) -> None:
+        if self._dirty_sids is None:
+            self._dirty_sids, self._dirty_seqs = set(), set()
+
+    def _touch(self, sid: str):
+        if self._dirty_sids is not None:
+            self._dirty_sids.add(sid)
+
+    def _touch_seq(self, key: str):
+        if self._dirty_seqs is not None:
+            self._dirty_seqs.add(key)
+
+    def _state(self, sid: str) -> _SidState:
+        self._touch(sid)
+        state = self.sids.get(sid)
+        if state is None:
+            state = self.sids[sid] = _SidState()
+        return state
+
+    def _drop_seq(self, key: str):
+        if self.room_seqs.pop(key, None) is not None:
+            self._touch_seq(key)
+
+    def _evict_sid(self, sid: str):
+        state = self.sids.get(sid)
+        if state is not None and not (state.rooms or state.channels or state.meta):
+            del self.sids[sid]
+
+    @staticmethod
+    def _discard(index: dict[str, set[str]], key: str, sid: str) -> int:
+        """Remove o sid do conjunto e o próprio conjunto quando esvazia."""
+        members = index.get(key)
+        if members is None:
+            return 0
+        members.discard(sid)
+        if not members:
+            del index[key]
+        return len(members)
+
+    def add_member(self, room: str, sid: str) -> int:
+        members = self.room_members.setdefault(room, set())
+        members.add(sid)
+        self._state(sid).rooms.add(room)
+        return len(members)
+
+    def remove_member(self, room: str, sid: str) -> int:
+        size = self._discard(self.room_members, room, sid)
+        if not size:
+            self._drop_seq(room)
+        state = self.sids.get(sid)
+        if state is not None:
+            self._touch(sid)
+            state.rooms.discard(room)
+            self._evict_sid(sid)
+        return size
+
+    def members(self, room: str) -> set[str]:
+        return set(self.room_members.get(room, ()))
+
+    def room_size(self, room: str) -> int:
+        return len(self.room_members.get(room, ()))
+
+    def has_member(self, room: str, sid: str) -> bool:
+        return sid in self.room_members.get(room, ())
+
+    def rooms(self) -> list[str]:
+        return list(self.room_members)
+
+    def rooms_of(self, sid: str) -> set[str]:
+        state = self.sids.get(sid)
+        return set(state.rooms) if state is not None else set()
+
+    def next_seq(self, room: str) -> int:
+        seq = self.room_seqs.get(room, 0) + 1
+        # stream sem ninguém inscrito: quem entrar depois recebe o estado no
+        # snapshot, então não há sequência a preservar
+        if room in self.channel_sids or room in self.room_members:
+            self.room_seqs[room] = seq
+            self._touch_seq(room)
+        return seq
+
+    def room_seq(self, room: str) -> int:
+        return self.room_seqs.get(room, 0)
+
+    def get_meta(self, sid: str) -> dict[str, Any]:
+        state = self.sids.get(sid)
+        return dict(state.meta) if state is not None else {}
+
+    def get_metas(self, sids: Iterable[str]) -> dict[str, dict[str, Any]]:
+        out = {}
+        for sid in sids:
+            state = self.sids.get(sid)
+            out[sid] = state.meta if state is not None else {}
+        return out
+
+    def set_meta(self, sid: str, meta: dict[str, Any]) -> None:
+        self._state(sid).meta = dict(meta)
+
+    def add_channel(self, channel: str, sid: str) -> None:
+        self.channel_sids.setdefault(channel, set()).add(sid)
+        self._state(sid).channels.add(channel)
+
+    def remove_channel(self, channel: str, sid: str) -> None:
+        if not self._discard(self.channel_sids, channel, sid):
+            self._drop_seq(channel)
+        state = self.sids.get(sid)
+        if state is not None:
+            self._touch(sid)
+            state.channels.discard(channel)
+            self._evict_sid(sid)
+
+    def channel_members(self, channel: str) -> set[str]:
+        return set(self.channel_sids.get(channel, ()))
+
+    def channel_size(self, channel: str) -> int:
+        return len(self.channel_sids.get(channel, ()))
+
+    def channels_of(self, sid: str) -> set[str]:
+        state = self.sids.get(sid)
+        return set(state.channels) if state is not None else set()
+
+    def drop_sid(self, sid: str) -> None:
+        state = self.sids.pop(sid, None)
+        if state is None:
+            return
+        self._touch(sid)
+        for room in state.rooms:
+            if not self._discard(self.room_members, room, sid):
+                self._drop_seq(room)
+        for ch in state.channels:
+            if not self._discard(self.channel_sids, ch, sid):
+                self._drop_seq(ch)
+
+    def purge_node(self, node_id: str) -> dict[str, tuple[set[str], dict[str, Any]]]:
+        # Em memória o estado morre junto com o processo: nada a limpar.
+        return {}
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "rooms": len(self.room_members),
+            "sids": len(self.sids),
+            "channels": len(self.channel_sids),
+            "subscriptions": sum(len(c) for c in self.channel_sids.values()),
+        }
+
+    def memory(self) -> dict[str, int]:
+        return {
+            **self.stats(),
+            "room_entries": sum(len(m) for m in self.room_members.values()),
+            "seqs": len(self.room_seqs),
+            "meta_fields": sum(len(s.meta) for s in self.sids.values()),
+        }
+
+    def snapshot(self) -> dict[str, Any]:
+        """Cópia do estado inteiro, que pode ser serializada fora do hub."""
+        return {
+            "rooms": {r: sorted(m) for r, m in self.room_members.items()},
+            "channels": {c: sorted(m) for c, m in self.channel_sids.items()},
+            "meta": {s: dict(st.meta) for s, st in self.sids.items() if st.meta},
+            "seqs": dict(self.room_seqs),
+        }
+
+    def changes(self) -> dict[str, Any]:
+        """{"sids": {sid: estado ou None}, "seqs": {stream: seq ou None}}, copiados."""
+        self.track_changes()
+        sids: dict[str, Any] = {}
+        for sid in self._dirty_sids:
+            state = self.sids.get(sid)
+            sids[sid] = None if state is None else {
+                "rooms": sorted(state.rooms),
+                "channels": sorted(state.channels),
+                "meta": dict(state.meta),
+            }
+        seqs = {key: self.room_seqs.get(key) for key in self._dirty_seqs}
+        self._dirty_sids.clear()
+        self._dirty_seqs.clear()
+        return {"sids": sids, "seqs": seqs}
+
+    def _apply_changes(self, changes: dict[str, Any]):
+        for sid, record in (changes.get("sids") or {}).items():
+            state = self.sids.pop(sid, None)
+            if state is not None:
+                for room in state.rooms:
+                    self._discard(self.room_members, room, sid)
+                for ch in state.channels:
+                    self._discard(self.channel_sids, ch, sid)
+            if record:
+                for room in record.get("rooms") or ():
+                    self.add_member(room, sid)
+                for ch in record.get("channels") or ():
+                    self.add_channel(ch, sid)
+                self.set_meta(sid, record.get("meta") or {})
+                self._evict_sid(sid)
+        for key, seq in (changes.get("seqs") or {}).items():
+            if seq is None:
+                self.room_seqs.pop(key, None)
+            else:
+                self.room_seqs[key] = int(seq)
+
+    def restore(self, state: dict[str, Any], changes: Iterable[dict] = ()) -> set[str]:
+        self.room_members.clear()
+        self.channel_sids.clear()
+        self.sids.clear()
+        for room, sids in (state.get("rooms") or {}).items():
+            for sid in sids:
+                self.add_member(room, sid)
+        for channel, sids in (state.get("channels") or {}).items():
+            for sid in sids:
+                self.add_channel(channel, sid)
+        for sid, meta in (state.get("meta") or {}).items():
+            self.set_meta(sid, meta)
+        self.room_seqs = {r: int(v) for r, v in (state.get("seqs") or {}).items()}
+        for record in changes:
+            self._apply_changes(record)
+        if self._dirty_sids is not None:
+            self._dirty_sids.clear()
+            self._dirty_seqs.clear()
+        return set(self.sids)
+
+
+class RedisPresence(PresenceBackend):
+    """
+    Presença compartilhada via Redis.
+
+    Layout das chaves (prefixo configurável):
+      {p}room:{room}        -> SET de sids
+      {p}rooms              -> SET de rooms com membros
+      {p}sid:{sid}:rooms    -> SET de rooms do sid
+      {p}sid:{sid}:chans    -> SET de canais ::src:: do sid
+      {p}chan:{channel}     -> SET de sids do canal
+      {p}meta               -> HASH sid -> meta (json)
+      {p}seq                -> HASH room/canal -> sequência do roster (o campo
+                               sai quando a room/canal esvazia, como no local)
+      {p}node:{node_id}     -> SET de sids conectados no nó
+      {p}nodes              -> SET de nós que já registraram sids
+      {p}alive:{node_id}    -> heartbeat do nó (expira em `ttl_s`)
+      {p}sweep:{node_id}    -> trava de quem está purgando um nó morto
+      {p}stat               -> HASH com os totais de canais e inscrições,
+                               mantidos a cada mudança (o /metrics não varre
+                               `chan:*`); `counted` marca que já foram contados
+    """
+
+    persistent = True
+
+    def __init__(self, url: str, node_id: str | None = None, prefix: str = "sig:"):
+        import redis  # dependência opcional: só no modo multi-nó
+
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+        self.node_id = node_id or default_node_id()
+        self.p = prefix
+
+    def _k_room(self, room: str) -> str:
+        return f"{self.p}room:{room}"
+
+    def _k_sid_rooms(self, sid: str) -> str:
+        return f"{self.p}sid:{sid}:rooms"
+
+    def _k_sid_chans(self, sid: str) -> str:
+        return f"{self.p}sid:{sid}:chans"
+
+    def _k_chan(self, channel: str) -> str:
+        return f"{self.p}chan:{channel}"
+
+    def _k_node(self, node_id: str) -> str:
+        return f"{self.p}node:{node_id}"
+
+    def _k_alive(self, node_id: str) -> str:
+        return f"{self.p}alive:{node_id}"
+
+    def _count_channels(self, subscriptions: int, channels: int):
+        if not subscriptions and not channels:
+            return
+        pipe = self.r.pipeline()
+        if subscriptions:
+            pipe.hincrby(f"{self.p}stat", "subscriptions", subscriptions)
+        if channels:
+            pipe.hincrby(f"{self.p}stat", "channels", channels)
+        pipe.execute()
+
+    def add_member(self, room: str, sid: str) -> int:
+        pipe = self.r.pipeline()
+        pipe.sadd(self._k_room(room), sid)
+        pipe.sadd(self._k_sid_rooms(sid), room)
+        pipe.sadd(f"{self.p}rooms", room)
+        pipe.sadd(self._k_node(self.node_id), sid)
+        pipe.scard(self._k_room(room))
+        return int(pipe.execute()[-1])
+
+    def remove_member(self, room: str, sid: str) -> int:
+        pipe = self.r.pipeline()
+        pipe.srem(self._k_room(room), sid)
+        pipe.srem(self._k_sid_rooms(sid), room)
+        pipe.scard(self._k_room(room))
+        size = int(pipe.execute()[-1])
+        if size == 0:
+            pipe = self.r.pipeline()
+            pipe.srem(f"{self.p}rooms", room)
+            pipe.hdel(f"{self.p}seq", room)
+            pipe.execute()
+        return size
+
+    def members(self, room: str) -> set[str]:
+        return set(self.r.smembers(self._k_room(room)))
+
+    def room_size(self, room: str) -> int:
+        return int(self.r.scard(self._k_room(room)))
+
+    def has_member(self, room: str, sid: str) -> bool:
+        return bool(self.r.sismember(self._k_room(room), sid))
+
+    def rooms(self) -> list[str]:
+        return list(self.r.smembers(f"{self.p}rooms"))
+
+    def rooms_of(self, sid: str) -> set[str]:
+        return set(self.r.smembers(self._k_sid_rooms(sid)))
+
+    def next_seq(self, room: str) -> int:
+        pipe = self.r.pipeline()
+        pipe.hincrby(f"{self.p}seq", room, 1)
+        pipe.exists(self._k_room(room), self._k_chan(room))
+        seq, live = pipe.execute()
+        # stream sem ninguém inscrito: não há sequência a preservar
+        if not live:
+            self.r.hdel(f"{self.p}seq", room)
+        return int(seq)
+
+    def room_seq(self, room: str) -> int:
+        return int(self.r.hget(f"{self.p}seq", room) or 0)
+
+    def get_meta(self, sid: str) -> dict[str, Any]:
+        raw = self.r.hget(f"{self.p}meta", sid)
+        return json.loads(raw) if raw else {}
+
+    def get_metas(self, sids: Iterable[str]) -> dict[str, dict[str, Any]]:
+        sids = list(sids)
+        if not sids:
+            return {}
+        raws = self.r.hmget(f"{self.p}meta", sids)
+        return {s: (json.loads(raw) if raw else {}) for s, raw in zip(sids, raws)}
+
+    def set_meta(self, sid: str, meta: dict[str, Any]) -> None:
+        # só o meta: o dono do sid é o nó do socket (add_member/claim), não
+        # quem escreveu por último (ex.: relay-parent salvo por outra réplica)
+        self.r.hset(f"{self.p}meta", sid, json.dumps(meta, ensure_ascii=False))
+
+    def add_channel(self, channel: str, sid: str) -> None:
+        # MULTI: só uma transação vê o canal passar de 0 para 1 inscrito
+        pipe = self.r.pipeline()
+        pipe.sadd(self._k_chan(channel), sid)
+        pipe.sadd(self._k_sid_chans(sid), channel)
+        pipe.scard(self._k_chan(channel))
+        added, _, size = pipe.execute()
+        if added:
+            self._count_channels(1, 1 if size == 1 else 0)
+
+    def remove_channel(self, channel: str, sid: str) -> None:
+        pipe = self.r.pipeline()
+        pipe.srem(self._k_chan(channel), sid)
+        pipe.srem(self._k_sid_chans(sid), channel)
+        pipe.scard(self._k_chan(channel))
+        removed, _, size = pipe.execute()
+        if not size:
+            self.r.hdel(f"{self.p}seq", channel)
+        if removed:
+            self._count_channels(-1, 0 if size else -1)
+
+    def channel_members(self, channel: str) -> set[str]:
+        return set(self.r.smembers(self._k_chan(channel)))
+
+    def channel_size(self, channel: str) -> int:
+        return int(self.r.scard(self._k_chan(channel)))
+
+    def channels_of(self, sid: str) -> set[str]:
+        return set(self.r.smembers(self._k_sid_chans(sid)))
+
+    def drop_sid(self, sid: str, node_id: str | None = None) -> None:
+        rooms = list(self.r.smembers(self._k_sid_rooms(sid)))
+        chans = list(self.r.smembers(self._k_sid_chans(sid)))
+        pipe = self.r.pipeline()
+        for ch in chans:
+            pipe.srem(self._k_chan(ch), sid)
+        for room in rooms:
+            pipe.srem(self._k_room(room), sid)
+        pipe.delete(self._k_sid_rooms(sid), self._k_sid_chans(sid))
+        pipe.hdel(f"{self.p}meta", sid)
+        pipe.srem(self._k_node(node_id or self.node_id), sid)
+        # tamanhos na mesma transação: só quem esvaziou vê zero
+        for ch in chans:
+            pipe.scard(self._k_chan(ch))
+        for room in rooms:
+            pipe.scard(self._k_room(room))
+        results = pipe.execute()
+        removed = results[: len(chans)]
+        sizes = results[len(chans) + len(rooms) + 3:]
+        chan_sizes, room_sizes = sizes[: len(chans)], sizes[len(chans):]
+        empty_rooms = [r for r, n in zip(rooms, room_sizes) if not n]
+        empty_chans = [c for c, n in zip(chans, chan_sizes) if not n]
+        self._count_channels(
+            -sum(1 for r in removed if r),
+            -sum(1 for r, n in zip(removed, chan_sizes) if r and not n),
+        )
+        if empty_rooms:
+            self.r.srem(f"{self.p}rooms", *empty_rooms)
+        if empty_rooms or empty_chans:
+            self.r.hdel(f"{self.p}seq", *empty_rooms, *empty_chans)
+
+    def claim(self, sid: str) -> None:
+        # sem isso a purga do nó antigo derrubaria o sid já retomado aqui
+        pipe = self.r.pipeline()
+        for node_id in self.r.smembers(f"{self.p}nodes"):
+            if node_id != self.node_id:
+                pipe.srem(self._k_node(node_id), sid)
+        pipe.sadd(self._k_node(self.node_id), sid)
+        pipe.execute()
+
+    def purge_node(self, node_id: str) -> dict[str, tuple[set[str], dict[str, Any]]]:
+        removed: dict[str, tuple[set[str], dict[str, Any]]] = {}
+        for sid in self.r.smembers(self._k_node(node_id)):
+            rooms = set(self.r.smembers(self._k_sid_rooms(sid)))
+            removed[sid] = (rooms, self.get_meta(sid))
+            self.drop_sid(sid, node_id=node_id)
+        self.r.delete(self._k_node(node_id))
+        return removed
+
+    def heartbeat(self, ttl_s: float) -> None:
+        pipe = self.r.pipeline()
+        pipe.set(self._k_alive(self.node_id), "1", px=int(ttl_s * 1000))
+        pipe.sadd(f"{self.p}nodes", self.node_id)
+        pipe.execute()
+
+    def sweep_dead_nodes(self) -> dict[str, dict[str, tuple[set[str], dict[str, Any]]]]:
+        """
+        Nós que sumiram sem purgar (crash, container recriado com outro
+        hostname) deixam de renovar o heartbeat; o primeiro nó vivo a notar
+        pega a trava e remove os sids deles.
+        """
+        removed: dict[str, dict[str, tuple[set[str], dict[str, Any]]]] = {}
+        for node_id in self.r.smembers(f"{self.p}nodes"):
+            if node_id == self.node_id or self.r.exists(self._k_alive(node_id)):
+                continue
+            if not self.r.set(f"{self.p}sweep:{node_id}", self.node_id, nx=True, ex=60):
+                continue
+            removed[node_id] = self.purge_node(node_id)
+            self.r.srem(f"{self.p}nodes", node_id)
+        return removed
+
+    def _recount_channels(self) -> dict[str, int]:
+        """Contagem completa (varre `chan:*`): só quando `{p}stat` ainda não existe."""
+        chans = list(self.r.scan_iter(match=f"{self.p}chan:*", count=1000))
+        pipe = self.r.pipeline()
+        for key in chans:
+            pipe.scard(key)
+        sizes = pipe.execute() if chans else []
+        counts = {"channels": sum(1 for n in sizes if n), "subscriptions": int(sum(sizes))}
+        self.r.hset(f"{self.p}stat", mapping={**counts, "counted": 1})
+        return counts
+
+    def stats(self) -> dict[str, int]:
+        pipe = self.r.pipeline()
+        pipe.scard(f"{self.p}rooms")
+        pipe.hlen(f"{self.p}meta")
+        pipe.hgetall(f"{self.p}stat")
+        rooms, sids, counts = pipe.execute()
+        if "counted" not in counts:
+            counts = self._recount_channels()
+        return {
+            "rooms": int(rooms),
+            "sids": int(sids),
+            "channels": int(counts.get("channels", 0)),
+            "subscriptions": int(counts.get("subscriptions", 0)),
+        }
+
+
+def make_presence(url: str | None = None, node_id: str | None = None) -> PresenceBackend:
+    """
+    Cria o backend a partir de PRESENCE_URL:
+      - vazio / "local"     -> LocalPresence
+      - "redis://..."       -> RedisPresence
+    """
+    url = (url or "").strip()
+    if not url or url == "local":
+        return LocalPresence(node_id=node_id)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisPresence(url, node_id=node_id)
+    raise ValueError(f"PRESENCE_URL não suportada: {url}")
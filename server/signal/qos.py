@@ -0,0 +1,252 @@
+"""
+Agregação da qualidade de recepção reportada pelos listeners (`qos-report`).
+
+Cada (room, canal de idioma) tem um ring buffer de tamanho fixo com as
+últimas amostras (jitter, perda, RTT, nível de áudio); a memória fica em
+`samples` × canais ativos, não importa há quanto tempo a palestra dura. O
+resumo por canal (percentis) é calculado só quando alguém consulta.
+
+Cada listener também tem o último estado (degradado ou não): quem cruza os
+limites em qualquer direção gera uma transição, que o signal repassa aos
+publishers do canal. A contagem de listeners e degradados por canal é mantida
+a cada transição e alimenta o `BitrateAdvisor`, que sugere aos publishers
+descer ou subir um degrau de bitrate/ptime do Opus.
+"""
+
+import math
+import time
+from collections import deque
+from typing import Any
+
+FIELDS = ("jitter_ms", "loss", "rtt_ms", "level")
+# faixas aceitas; fora delas a amostra do campo é descartada
+_RANGES = {
+    "jitter_ms": (0.0, 10_000.0),
+    "loss": (0.0, 1.0),
+    "rtt_ms": (0.0, 60_000.0),
+    "level": (0.0, 1.0),
+}
+
+
+def _number(value, field: str) -> float | None:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    low, high = _RANGES[field]
+    if not math.isfinite(value) or not low <= value <= high:
+        return None
+    return float(value)
+
+
+def parse_ladder(spec: str) -> list[tuple[int, int]]:
+    """"16/60,24/40,32/20" -> [(kbps, ptime_ms), ...] em ordem crescente de bitrate."""
+    ladder: list[tuple[int, int]] = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        kbps, _, ptime = item.partition("/")
+        try:
+            ladder.append((int(kbps), int(ptime or 20)))
+        except ValueError:
+            raise ValueError(f"BITRATE_LADDER inválido: {item}")
+    return sorted(ladder)
+
+
+def _percentiles(values: list[float]) -> dict[str, float]:
+    values = sorted(values)
+    out = {}
+    for q in (0.5, 0.9, 0.99):
+        out[f"p{int(q * 100)}"] = round(values[min(len(values) - 1, int(q * len(values)))], 4)
+    return out
+
+
+class QosAggregator:
+    def __init__(
+        self,
+        samples: int = 512,
+        max_loss: float = 0.05,
+        max_jitter_ms: float = 50.0,
+        max_rtt_ms: float = 500.0,
+    ):
+        self.samples = samples
+        self.max_loss = max_loss
+        self.max_jitter_ms = max_jitter_ms
+        self.max_rtt_ms = max_rtt_ms
+        # room -> lang -> amostras (tuplas na ordem de FIELDS; None = ausente)
+        self.buffers: dict[str, dict[str, deque[tuple]]] = {}
+        # sid -> room -> (lang, degradado?)
+        self.listeners: dict[str, dict[str, tuple[str, bool]]] = {}
+        # room -> lang -> [listeners, degradados]
+        self.counts: dict[str, dict[str, list[int]]] = {}
+
+    def _degraded(self, sample: dict[str, float | None]) -> bool:
+        return (
+            (sample["loss"] or 0.0) >= self.max_loss
+            or (sample["jitter_ms"] or 0.0) >= self.max_jitter_ms
+            or (sample["rtt_ms"] or 0.0) >= self.max_rtt_ms
+        )
+
+    def report(
+        self, room: str, lang: str, sid: str, data: dict[str, Any]
+    ) -> tuple[bool, dict[str, float | None]] | None:
+        """
+        Guarda a amostra. Devolve (degradado, amostra) quando o estado do
+        listener mudou; None caso contrário ou se não havia nenhum campo válido.
+        """
+        sample = {f: _number(data.get(f), f) for f in FIELDS}
+        if all(v is None for v in sample.values()):
+            return None
+        channels = self.buffers.setdefault(room, {})
+        buffer = channels.get(lang)
+        if buffer is None:
+            buffer = channels[lang] = deque(maxlen=self.samples)
+        buffer.append(tuple(sample[f] for f in FIELDS))
+
+        degraded = self._degraded(sample)
+        rooms = self.listeners.setdefault(sid, {})
+        previous = rooms.get(room)
+        rooms[room] = (lang, degraded)
+        self._tally(room, previous, -1)
+        self._tally(room, rooms[room], 1)
+        # primeiro report saudável não é transição
+        if (previous is None and degraded) or (previous and previous[1] != degraded):
+            return degraded, sample
+        return None
+
+    def _tally(self, room: str, entry: tuple[str, bool] | None, delta: int):
+        if entry is None:
+            return
+        lang, degraded = entry
+        channels = self.counts.setdefault(room, {})
+        count = channels.setdefault(lang, [0, 0])
+        count[0] += delta
+        if degraded:
+            count[1] += delta
+        if count[0] <= 0:
+            del channels[lang]
+            if not channels:
+                del self.counts[room]
+
+    def drop_sid(self, sid: str, room: str | None = None):
+        rooms = self.listeners.get(sid)
+        if rooms is None:
+            return
+        for r in [room] if room is not None else list(rooms):
+            self._tally(r, rooms.pop(r, None), -1)
+        if not rooms:
+            del self.listeners[sid]
+
+    def forget_room(self, room: str):
+        self.buffers.pop(room, None)
+
+    def channel_counts(self, room: str, lang: str) -> tuple[int, int]:
+        """(listeners com report, degradados) do canal."""
+        listeners, degraded = self.counts.get(room, {}).get(lang, (0, 0))
+        return listeners, degraded
+
+    def room_counts(self, room: str) -> tuple[int, int]:
+        listeners = degraded = 0
+        for n, d in self.counts.get(room, {}).values():
+            listeners += n
+            degraded += d
+        return listeners, degraded
+
+    def degraded_counts(self) -> dict[tuple[str, str], int]:
+        return {
+            (room, lang): count[1]
+            for room, channels in self.counts.items()
+            for lang, count in channels.items()
+            if count[1]
+        }
+
+    def summary(self, room: str | None = None) -> dict[str, dict[str, Any]]:
+        """Percentis por room e canal, sobre as amostras em buffer."""
+        degraded = self.degraded_counts()
+        rooms = [room] if room is not None else sorted(self.buffers)
+        out: dict[str, dict[str, Any]] = {}
+        for r in rooms:
+            for lang, buffer in sorted(self.buffers.get(r, {}).items()):
+                channel: dict[str, Any] = {
+                    "samples": len(buffer),
+                    "degraded_listeners": degraded.get((r, lang), 0),
+                }
+                for i, field in enumerate(FIELDS):
+                    values = [s[i] for s in buffer if s[i] is not None]
+                    if values:
+                        channel[field] = _percentiles(values)
+                out.setdefault(r, {})[lang or "*"] = channel
+        return out
+
+
+class BitrateAdvisor:
+    """
+    Degrau de bitrate sugerido por (room, canal). Começa no topo da escada;
+    desce um degrau quando a fração de listeners degradados chega a
+    `degraded_ratio` e sobe um quando fica em `healthy_ratio` ou menos. Entre
+    dois movimentos passam ao menos `interval_s` segundos para descer e o
+    triplo para subir, então uma oscilação curta não faz o publisher
+    renegociar o encoder a cada report.
+    """
+
+    def __init__(
+        self,
+        ladder: list[tuple[int, int]],
+        degraded_ratio: float = 0.2,
+        healthy_ratio: float = 0.05,
+        min_listeners: int = 1,
+        interval_s: float = 10.0,
+    ):
+        self.ladder = ladder
+        self.degraded_ratio = degraded_ratio
+        self.healthy_ratio = healthy_ratio
+        self.min_listeners = min_listeners
+        self.interval = interval_s
+        # room -> lang -> [degrau, instante do último movimento]
+        self.state: dict[str, dict[str, list]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.ladder)
+
+    def _hint(self, step: int, reason: str) -> dict[str, Any]:
+        kbps, ptime = self.ladder[step]
+        return {
+            "bitrate_kbps": kbps,
+            "ptime_ms": ptime,
+            "step": step,
+            "steps": len(self.ladder),
+            "reason": reason,
+        }
+
+    def evaluate(
+        self, room: str, lang: str, listeners: int, degraded: int
+    ) -> dict[str, Any] | None:
+        """Devolve o hint quando o degrau do canal muda; None caso contrário."""
+        if not self.ladder or listeners < self.min_listeners:
+            return None
+        top = len(self.ladder) - 1
+        channels = self.state.setdefault(room, {})
+        state = channels.get(lang)
+        if state is None:
+            state = channels[lang] = [top, -math.inf]
+        step, since = state
+        now = time.monotonic()
+        ratio = degraded / listeners
+        if ratio >= self.degraded_ratio and step > 0 and now - since >= self.interval:
+            step, reason = step - 1, "degraded"
+        elif ratio <= self.healthy_ratio and step < top and now - since >= 3 * self.interval:
+            step, reason = step + 1, "healthy"
+        else:
+            return None
+        state[0], state[1] = step, now
+        return {**self._hint(step, reason), "listeners": listeners, "degraded": degraded}
+
+    def current(self, room: str, lang: str) -> dict[str, Any] | None:
+        """Hint vigente do canal, se estiver abaixo do topo (para publisher que entra depois)."""
+        state = self.state.get(room, {}).get(lang)
+        if not self.ladder or state is None or state[0] >= len(self.ladder) - 1:
+            return None
+        return self._hint(state[0], "current")
+
+    def forget_room(self, room: str):
+        self.state.pop(room, None)
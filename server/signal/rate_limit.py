@@ -0,0 +1,123 @@
+"""
+Limitação de taxa por conexão e por IP no caminho quente da sinalização.
+
+Cada tipo de evento tem um token bucket (`taxa/s` e `rajada`) por sid e outro,
+mais folgado, por IP (várias pessoas atrás do mesmo NAT do evento dividem o
+IP). Eventos acima do limite são descartados e contados; só com `strikes` > 0
+o sid que acumula descartes demais é desconectado. Publishers negociam com a
+audiência inteira e recebem os limites multiplicados por `scale`.
+
+Formato de RATE_LIMITS: "evento=taxa/rajada,...", com "*" como padrão:
+  "ice-candidate=200/400,update-meta=2/5,list-members=1/3,*=20/40"
+"""
+
+import time
+
+# Publishers negociam com muitos listeners: offer/ICE têm folga maior.
+DEFAULT_LIMITS = (
+    "ice-candidate=200/400,ice-candidates=50/100,offer=50/100,answer=50/100,"
+    "update-meta=2/5,list-members=1/3,who-serves=2/5,qos-report=0.2/2,*=20/40"
+)
+
+
+def parse_limits(spec: str) -> dict[str, tuple[float, float]]:
+    limits: dict[str, tuple[float, float]] = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item or "=" not in item:
+            continue
+        event, value = item.split("=", 1)
+        rate, _, burst = value.partition("/")
+        try:
+            rate_f = float(rate)
+            burst_f = float(burst) if burst else rate_f
+        except ValueError:
+            raise ValueError(f"RATE_LIMITS inválido: {item}")
+        limits[event.strip()] = (rate_f, max(1.0, burst_f))
+    return limits
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        limits: dict[str, tuple[float, float]],
+        ip_factor: float = 50.0,
+        strikes: int = 0,
+        idle_s: float = 60.0,
+    ):
+        self.limits = limits
+        self.ip_factor = ip_factor
+        # descartes tolerados por sid antes de desconectar (0 = só descarta)
+        self.strikes = strikes
+        self.idle = idle_s
+        # sid/ip -> evento -> [tokens, último refill]
+        self.sid_buckets: dict[str, dict[str, list[float]]] = {}
+        self.ip_buckets: dict[str, dict[str, list[float]]] = {}
+        self.sid_drops: dict[str, int] = {}
+        self.counters: dict[str, dict[str, int]] = {}
+        self._last_sweep = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.limits)
+
+    def _limit(self, event: str) -> tuple[float, float] | None:
+        return self.limits.get(event) or self.limits.get("*")
+
+    @staticmethod
+    def _take(
+        buckets: dict[str, list[float]], event: str, rate: float, burst: float, now: float
+    ) -> bool:
+        bucket = buckets.get(event)
+        if bucket is None:
+            bucket = buckets[event] = [burst, now]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+        return False
+
+    def allow(self, event: str, sid: str, ip: str | None, scale: float = 1.0) -> bool:
+        limit = self._limit(event)
+        if limit is None:
+            return True
+        rate, burst = limit[0] * scale, limit[1] * scale
+        now = time.monotonic()
+        self._sweep(now)
+        ok = self._take(self.sid_buckets.setdefault(sid, {}), event, rate, burst, now)
+        if ok and ip:
+            ok = self._take(
+                self.ip_buckets.setdefault(ip, {}),
+                event,
+                rate * self.ip_factor,
+                burst * self.ip_factor,
+                now,
+            )
+        counter = self.counters.setdefault(event, {"allowed": 0, "dropped": 0})
+        if ok:
+            counter["allowed"] += 1
+        else:
+            counter["dropped"] += 1
+            self.sid_drops[sid] = self.sid_drops.get(sid, 0) + 1
+        return ok
+
+    def should_disconnect(self, sid: str) -> bool:
+        return bool(self.strikes) and self.sid_drops.get(sid, 0) >= self.strikes
+
+    def forget(self, sid: str):
+        self.sid_drops.pop(sid, None)
+        self.sid_buckets.pop(sid, None)
+
+    def _sweep(self, now: float):
+        """Remove IPs parados há `idle` segundos para não crescer sem limite."""
+        if now - self._last_sweep < self.idle:
+            return
+        self._last_sweep = now
+        for ip in [
+            ip
+            for ip, buckets in self.ip_buckets.items()
+            if all(now - b[1] > self.idle for b in buckets.values())
+        ]:
+            self.ip_buckets.pop(ip, None)
@@ -0,0 +1,176 @@
+"""
+Árvore de relay entre listeners (alternativa ao SFU).
+
+O publisher de um canal de idioma alimenta no máximo `fanout` listeners; cada
+listener com capacidade declarada (`relay_capacity`) reencaminha o áudio para
+até essa quantidade de listeners, e assim por diante. Cada salto soma
+latência, então quem entra vai sempre para o nó mais raso com vaga: a
+profundidade fica em torno de log_k(N).
+
+`RelayTree` mantém a árvore de um canal entre entradas e saídas: uma entrada
+ocupa uma vaga e uma saída só religa os filhos de quem saiu, então só os nós
+afetados renegociem. `plan_tree` recalcula do zero preservando o máximo
+possível das ligações existentes (troca de publisher, mudança de meta).
+"""
+
+import heapq
+import itertools
+from collections import deque
+
+
+def children_of(parents: dict[str, str]) -> dict[str, set[str]]:
+    out: dict[str, set[str]] = {}
+    for sid, parent in parents.items():
+        out.setdefault(parent, set()).add(sid)
+    return out
+
+
+class RelayTree:
+    def __init__(self, root: str, fanout: int):
+        self.root = root
+        self.fanout = max(1, fanout)
+        self.parent: dict[str, str] = {}
+        self.children: dict[str, set[str]] = {root: set()}
+        self.cap: dict[str, int] = {root: self.fanout}
+        self.depth: dict[str, int] = {root: 0}
+        # listeners do canal que ficam fora da árvore (ex.: entregues ao HLS)
+        self.outside: set[str] = set()
+        # vagas por (profundidade, ordem de chegada); entradas velhas (nó cheio,
+        # fora da árvore ou com outra profundidade) são descartadas na leitura
+        self._slots: list[tuple[int, int, str]] = []
+        self._order = itertools.count()
+        self._offer(root)
+
+    def __contains__(self, sid: str) -> bool:
+        return sid in self.parent
+
+    def size(self) -> int:
+        """Listeners do canal conhecidos pela árvore (dentro ou fora dela)."""
+        return len(self.parent) + len(self.outside)
+
+    def height(self) -> int:
+        return max(self.depth.values())
+
+    def _offer(self, sid: str):
+        if len(self.children.get(sid, ())) < self.cap.get(sid, 0):
+            heapq.heappush(self._slots, (self.depth[sid], next(self._order), sid))
+
+    def _free_slot(self) -> str | None:
+        """Nó mais raso com vaga (a raiz, se não houver nenhum)."""
+        while self._slots:
+            depth, _, sid = self._slots[0]
+            if self.depth.get(sid) == depth and len(self.children.get(sid, ())) < self.cap.get(sid, 0):
+                return sid
+            heapq.heappop(self._slots)
+        return None
+
+    def _link(self, sid: str, parent: str, cap: int):
+        self.parent[sid] = parent
+        self.children.setdefault(parent, set()).add(sid)
+        self.children.setdefault(sid, set())
+        self.cap[sid] = max(0, min(cap, self.fanout))
+        self.depth[sid] = self.depth[parent] + 1
+        self._offer(sid)
+
+    def _settle(self, top: str):
+        """Recalcula a profundidade da subárvore religada e oferece as vagas dela."""
+        queue = deque([top])
+        while queue:
+            node = queue.popleft()
+            self.depth[node] = self.depth[self.parent[node]] + 1
+            self._offer(node)
+            queue.extend(sorted(self.children.get(node, ())))
+
+    def add(self, sid: str, cap: int) -> str:
+        """Pendura o listener no nó mais raso com vaga; devolve o pai."""
+        parent = self._free_slot() or self.root
+        self._link(sid, parent, cap)
+        return parent
+
+    def remove(self, sid: str) -> dict[str, str]:
+        """
+        Tira o listener da árvore. Os filhos dele (com as próprias
+        subárvores) vão para as vagas mais rasas, os de maior capacidade
+        primeiro; devolve {filho: novo pai}.
+        """
+        parent = self.parent.pop(sid, None)
+        if parent is None:
+            self.outside.discard(sid)
+            return {}
+        self.children[parent].discard(sid)
+        orphans = self.children.pop(sid, set())
+        del self.cap[sid], self.depth[sid]
+        # as subárvores dos órfãos saem do índice até serem religadas, então
+        # nenhum órfão vai parar embaixo de si mesmo
+        queue = deque(orphans)
+        while queue:
+            node = queue.popleft()
+            self.depth.pop(node, None)
+            queue.extend(self.children.get(node, ()))
+        self._offer(parent)
+
+        moved: dict[str, str] = {}
+        for orphan in sorted(orphans, key=lambda s: (-self.cap[s], s)):
+            new_parent = self._free_slot() or self.root
+            self.parent[orphan] = new_parent
+            self.children.setdefault(new_parent, set()).add(orphan)
+            self._settle(orphan)
+            moved[orphan] = new_parent
+        return moved
+
+    @classmethod
+    def build(
+        cls,
+        root: str,
+        capacities: dict[str, int],
+        parents: dict[str, str | None],
+        fanout: int,
+    ) -> "RelayTree":
+        """
+        Árvore para os listeners de `capacities`:
+
+        - ligações atuais são mantidas enquanto o pai continua na árvore e tem
+          vaga (percorrida em largura a partir da raiz);
+        - órfãos (novos ou cujo pai saiu) entram no nó mais raso com vaga, os
+          de maior capacidade primeiro, levando junto os filhos que ainda
+          couberem;
+        - sem vaga nenhuma, o listener fica direto no publisher (como no mesh).
+        """
+        tree = cls(root, fanout)
+        old_children = children_of(
+            {s: p for s, p in parents.items() if s in capacities and p}
+        )
+
+        def keep_links(top: str):
+            queue = deque([top])
+            while queue:
+                node = queue.popleft()
+                for child in sorted(old_children.get(node, ())):
+                    if child in tree.parent or child == root:
+                        continue
+                    if len(tree.children[node]) >= tree.cap[node]:
+                        break
+                    tree._link(child, node, capacities[child])
+                    queue.append(child)
+
+        keep_links(root)
+        orphans = sorted(
+            (s for s in capacities if s not in tree.parent),
+            key=lambda s: (-max(0, min(capacities[s], tree.fanout)), s),
+        )
+        for sid in orphans:
+            if sid in tree.parent:
+                continue
+            tree.add(sid, capacities[sid])
+            keep_links(sid)
+        return tree
+
+
+def plan_tree(
+    root: str,
+    capacities: dict[str, int],
+    parents: dict[str, str | None],
+    fanout: int,
+) -> dict[str, str]:
+    """Calcula {listener: pai} para os listeners de `capacities` (ver `RelayTree.build`)."""
+    return dict(RelayTree.build(root, capacities, parents, fanout).parent)
@@ -0,0 +1,141 @@
+"""
+Visões do roster por papel.
+
+Cada sid de uma room participa de "view rooms" (`{room}::view::{key}`) que
+definem quem enxerga quem:
+
+  - publishers (speaker/translator/relay) veem os demais publishers e a
+    audiência dos idiomas que servem;
+  - listeners veem apenas os publishers que servem o idioma `want`
+    (ou todos os publishers, se ainda não escolheram idioma);
+  - observers (admin) e o SFU veem a room inteira.
+
+Com um SFU anexado à room (`sfu=True`) os publishers deixam de ver a
+audiência: quem negocia com os listeners é o SFU.
+
+As mesmas view rooms são usadas para endereçar os deltas do roster (cada uma
+com sua própria sequência) e como índice para montar snapshots sem varrer a
+room inteira.
+"""
+
+PUBLISHER_ROLES = {"speaker", "translator", "relay"}
+OBSERVER_ROLES = {"admin"}
+LISTENER_ROLES = {"listener", "user"}
+SFU_ROLE = "sfu"
+ROLES = PUBLISHER_ROLES | OBSERVER_ROLES | LISTENER_ROLES | {SFU_ROLE}
+
+ANY = "*"
+
+
+def viewer_kind(meta: dict) -> str:
+    role = meta.get("role")
+    if role in PUBLISHER_ROLES:
+        return "publisher"
+    if role in OBSERVER_ROLES:
+        return "observer"
+    if role == SFU_ROLE:
+        return "sfu"
+    return "listener"
+
+
+def served_languages(meta: dict) -> set[str]:
+    """
+    Idiomas que um publisher entrega à audiência:
+      - speaker: as origens (`source` / `pairs[].source.code`)
+      - translator/relay: os destinos (`pairs[].target.code`)
+    """
+    role = meta.get("role")
+    out: set[str] = set()
+    if role == "speaker":
+        src = meta.get("source")
+        if isinstance(src, str) and src.strip():
+            out.add(src.strip())
+        key = "source"
+    else:
+        key = "target"
+    pairs = meta.get("pairs") or []
+    if isinstance(pairs, list):
+        for p in pairs:
+            try:
+                code = (p or {}).get(key, {}).get("code")
+                if isinstance(code, str) and code.strip():
+                    out.add(code.strip())
+            except Exception:
+                continue
+    return out
+
+
+def wanted_language(meta: dict) -> str | None:
+    want = meta.get("want")
+    if isinstance(want, str) and want.strip():
+        return want.strip()
+    return None
+
+
+def view_room(room: str, key: str) -> str:
+    return f"{room}::view::{key}"
+
+
+def view_keys(meta: dict) -> set[str]:
+    """Streams (view rooms) dos quais o sid recebe deltas."""
+    kind = viewer_kind(meta)
+    if kind == "observer":
+        return {"all"}
+    if kind == "sfu":
+        return {"sfu"}
+    if kind == "publisher":
+        served = served_languages(meta)
+        return {"pub"} | ({f"serves::{lang}" for lang in served} or {f"serves::{ANY}"})
+    want = wanted_language(meta)
+    return {"lst", f"want::{want or ANY}"}
+
+
+def audience_keys(meta: dict, sfu: bool = False) -> set[str]:
+    """
+    Streams que devem receber deltas sobre um membro com este meta.
+    Cada viewer está em no máximo uma delas, então recebe o delta uma vez.
+    """
+    kind = viewer_kind(meta)
+    keys = {"all", "sfu"}
+    if kind == "observer":
+        keys.add("pub")
+    elif kind == "sfu":
+        keys |= {"pub", "lst"}
+    elif kind == "publisher":
+        keys.add("pub")
+        served = served_languages(meta)
+        if served:
+            keys |= {f"want::{lang}" for lang in served}
+            keys.add(f"want::{ANY}")
+        else:
+            keys.add("lst")
+    elif not sfu:
+        want = wanted_language(meta)
+        if want:
+            keys |= {f"serves::{want}", f"serves::{ANY}"}
+        else:
+            keys.add("pub")
+    return keys
+
+
+def visible_keys(meta: dict, sfu: bool = False) -> set[str] | None:
+    """
+    View rooms cujos membros compõem o snapshot do viewer.
+    None significa "a room inteira".
+    """
+    kind = viewer_kind(meta)
+    if kind in ("observer", "sfu"):
+        return None
+    if kind == "publisher":
+        if sfu:
+            return {"pub", "all", "sfu"}
+        served = served_languages(meta)
+        if not served:
+            return None
+        return (
+            {"pub", "all", "sfu", f"want::{ANY}"} | {f"want::{lang}" for lang in served}
+        )
+    want = wanted_language(meta)
+    if want:
+        return {f"serves::{want}", f"serves::{ANY}", "sfu"}
+    return {"pub", "sfu"}
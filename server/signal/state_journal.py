@@ -0,0 +1,77 @@
+"""
+Journal local do estado de presença (warm restart).
+
+O arquivo é append-only, uma linha JSON por registro: um snapshot completo
+(`state`) seguido de registros incrementais (`changes`, só os sids e
+sequências que mudaram desde o anterior). No boot o último snapshot íntegro é
+restaurado e as mudanças seguintes reaplicadas em ordem. Quando o arquivo
+passa de `max_bytes` (e no primeiro registro de cada processo) ele é
+reescrito só com um snapshot novo, via arquivo temporário + rename, então uma
+queda no meio não corrompe o journal.
+
+Os métodos fazem I/O bloqueante (json + fsync): o signal os chama fora do hub.
+"""
+
+import json
+import os
+import time
+from typing import Any
+
+
+class StateJournal:
+    def __init__(self, path: str, max_bytes: int = 8 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._size: int | None = None  # None = ainda sem snapshot deste processo
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def needs_snapshot(self) -> bool:
+        return self._size is None or self._size > self.max_bytes
+
+    def write_snapshot(self, state: dict[str, Any]):
+        """Reescreve o journal só com este snapshot."""
+        line = json.dumps({"ts": time.time(), "state": state}, ensure_ascii=False) + "\n"
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._size = len(line)
+
+    def append_changes(self, changes: dict[str, Any]) -> bool:
+        """Acrescenta um registro incremental; False se não havia mudança."""
+        if not changes.get("sids") and not changes.get("seqs"):
+            return False
+        line = json.dumps({"ts": time.time(), "changes": changes}, ensure_ascii=False) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._size = (self._size or 0) + len(line)
+        return True
+
+    def load_latest(self) -> tuple[float, dict[str, Any], list[dict[str, Any]]] | None:
+        """(timestamp do último registro, snapshot, mudanças seguintes), se houver."""
+        if not os.path.exists(self.path):
+            return None
+        ts, state, changes = 0.0, None, []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # última linha truncada por uma queda
+                if "state" in record:
+                    state, changes = record["state"] or {}, []
+                elif state is not None and "changes" in record:
+                    changes.append(record["changes"])
+                else:
+                    continue
+                ts = float(record.get("ts", 0))
+        if state is None:
+            return None
+        return ts, state, changes
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# os módulos do signal são planos (app.py importa `presence`, `broadcast`...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
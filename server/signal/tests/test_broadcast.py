@@ -0,0 +1,73 @@
+from broadcast import RosterBroadcaster
+from presence import LocalPresence
+from roster_view import view_room
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.emitted = []
+        self.tasks = []
+
+    def emit(self, event, payload, room=None):
+        self.emitted.append((event, room, payload))
+
+    def start_background_task(self, fn, *args):
+        self.tasks.append((fn, args))
+
+    def sleep(self, _seconds):
+        pass
+
+    def run_tasks(self):
+        while self.tasks:
+            fn, args = self.tasks.pop(0)
+            fn(*args)
+
+
+def _visible(presence, room):
+    return presence.channel_members(view_room(room, "pub")) | presence.channel_members(view_room(room, "lst"))
+
+
+def _join(broadcaster, presence, room, sid, view_key, audience, snapshots):
+    """Mesmo roteiro do `_join`: delta para a audiência e entrada adiada."""
+    presence.add_member(room, sid)
+    broadcaster.push("added", room, {"id": sid}, audience)
+    assert broadcaster.is_pending(room)
+    broadcaster.after_flush(
+        room,
+        lambda: presence.add_channel(view_room(room, view_key), sid),
+        lambda: snapshots.append((sid, _visible(presence, room))),
+    )
+
+
+def test_joiners_of_one_window_see_each_other_in_the_snapshot():
+    sio, presence = FakeSocketIO(), LocalPresence("n1")
+    broadcaster = RosterBroadcaster(sio, presence, window_ms=100)
+    snapshots = []
+
+    # speaker e listener entram na mesma janela de coalescência
+    _join(broadcaster, presence, "R::pt-BR", "speaker", "pub", {"lst", "all"}, snapshots)
+    _join(broadcaster, presence, "R::pt-BR", "listener", "lst", {"pub", "all"}, snapshots)
+    sio.run_tasks()
+
+    # o lote (com os dois added) saiu antes de ambos entrarem nas view rooms,
+    # então cada um precisa enxergar o outro no snapshot
+    assert [event for event, _, _ in sio.emitted] == ["roster-delta"] * 3
+    seen = dict(snapshots)
+    assert seen["speaker"] == {"speaker", "listener"}
+    assert seen["listener"] == {"speaker", "listener"}
+    assert not broadcaster.waiters
+
+
+def test_joiner_of_next_window_waits_for_next_batch():
+    sio, presence = FakeSocketIO(), LocalPresence("n1")
+    broadcaster = RosterBroadcaster(sio, presence, window_ms=100)
+    snapshots = []
+
+    _join(broadcaster, presence, "R", "a", "lst", {"pub"}, snapshots)
+    sio.run_tasks()
+    assert [sid for sid, _ in snapshots] == ["a"]
+
+    _join(broadcaster, presence, "R", "b", "lst", {"pub"}, snapshots)
+    assert [sid for sid, _ in snapshots] == ["a"]
+    sio.run_tasks()
+    assert snapshots[-1] == ("b", {"a", "b"})
@@ -0,0 +1,22 @@
+import logging
+
+from metrics import Counter, EventLogger
+
+
+def test_events_are_counted_regardless_of_log_level(monkeypatch):
+    counter = Counter("signal_log_events_total", "", ("name", "level"))
+    monkeypatch.setattr(EventLogger, "counter", counter)
+    logger = logging.getLogger("webrtc_signaling.test_metrics")
+    logger.setLevel(logging.WARNING)
+    log = EventLogger(logger)
+
+    log.debug("ice_routed_1to1", extra={"room": "r"})
+    log.info("peer_joined")
+    log.warning("offer_target_not_in_room")
+    log.count("ice_routed_1to1", logging.DEBUG)
+
+    assert counter.values == {
+        ("ice_routed_1to1", "debug"): 2,
+        ("peer_joined", "info"): 1,
+        ("offer_target_not_in_room", "warning"): 1,
+    }
@@ -0,0 +1,126 @@
+import fnmatch
+
+from presence import RedisPresence
+
+
+class FakeRedis:
+    """Só os comandos que o RedisPresence usa, sobre dicts e sets em memória."""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def sadd(self, key, *values):
+        members = self.data.setdefault(key, set())
+        before = len(members)
+        members.update(values)
+        return len(members) - before
+
+    def srem(self, key, *values):
+        members = self.data.get(key, set())
+        before = len(members)
+        members.difference_update(values)
+        if not members:
+            self.data.pop(key, None)
+        return before - len(members)
+
+    def smembers(self, key):
+        return set(self.data.get(key, ()))
+
+    def scard(self, key):
+        return len(self.data.get(key, ()))
+
+    def sismember(self, key, value):
+        return value in self.data.get(key, ())
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def hmget(self, key, fields):
+        return [self.data.get(key, {}).get(f) for f in fields]
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hdel(self, key, *fields):
+        h = self.data.get(key, {})
+        n = sum(1 for f in fields if h.pop(f, None) is not None)
+        if not h:
+            self.data.pop(key, None)
+        return n
+
+    def hincrby(self, key, field, amount):
+        h = self.data.setdefault(key, {})
+        h[field] = int(h.get(field, 0)) + amount
+        return h[field]
+
+    def exists(self, *keys):
+        return sum(1 for k in keys if k in self.data)
+
+    def delete(self, *keys):
+        return sum(1 for k in keys if self.data.pop(k, None) is not None)
+
+    def set(self, key, value, px=None, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def scan_iter(self, match=None, count=None):
+        return [k for k in list(self.data) if fnmatch.fnmatch(k, match)]
+
+
+class FakePipeline:
+    def __init__(self, r):
+        self.r, self.ops = r, []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.ops.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        ops, self.ops = self.ops, []
+        return [getattr(self.r, name)(*args, **kwargs) for name, args, kwargs in ops]
+
+
+def _node(r, node_id):
+    presence = RedisPresence.__new__(RedisPresence)
+    presence.r, presence.node_id, presence.p = r, node_id, "sig:"
+    presence.heartbeat(30)
+    return presence
+
+
+def test_resume_on_other_node_survives_purge_of_old_node():
+    r = FakeRedis()
+    a, b = _node(r, "a"), _node(r, "b")
+    a.add_member("room", "s1")
+    a.add_member("room", "s2")
+    a.set_meta("s1", {"role": "listener"})
+
+    # s1 retoma a sessão pela réplica b; a morre depois
+    b.set_meta("s1", {"role": "listener"})
+    b.claim("s1")
+    removed = b.purge_node("a")
+
+    assert set(removed) == {"s2"}
+    assert b.members("room") == {"s1"}
+    assert b.get_meta("s1") == {"role": "listener"}
+    assert r.smembers("sig:node:b") == {"s1"}
+
+
+def test_set_meta_does_not_take_ownership():
+    r = FakeRedis()
+    a, b = _node(r, "a"), _node(r, "b")
+    a.add_member("room", "s1")
+
+    b.set_meta("s1", {"relay": {"parent": "p"}})
+
+    assert r.smembers("sig:node:a") == {"s1"}
+    assert r.smembers("sig:node:b") == set()
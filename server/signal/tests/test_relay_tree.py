@@ -0,0 +1,57 @@
+import math
+import random
+
+from relay_tree import RelayTree, plan_tree
+
+
+def _check(tree: RelayTree):
+    """Pais, filhos e profundidades consistentes, sem ciclos e sem estourar vagas."""
+    for sid, parent in tree.parent.items():
+        assert sid in tree.children[parent]
+        assert tree.depth[sid] == tree.depth[parent] + 1
+    for node, kids in tree.children.items():
+        if node != tree.root and kids:
+            assert len(kids) <= tree.cap[node]
+
+
+def _bound(n: int, cap: int, fanout: int) -> int:
+    # raiz com `fanout` filhos, cada nível seguinte multiplica por `cap`
+    return 1 + math.ceil(math.log(max(2, n / fanout), cap)) + 1
+
+
+def test_incremental_joins_keep_tree_shallow():
+    tree = RelayTree("pub", fanout=4)
+    for i in range(2000):
+        tree.add(f"l{i}", 2)
+        if i in (59, 999, 1999):
+            assert tree.height() <= _bound(i + 1, 2, 4)
+    _check(tree)
+
+
+def test_joins_and_leaves_keep_tree_shallow_and_consistent():
+    rnd = random.Random(7)
+    tree = RelayTree("pub", fanout=4)
+    alive: list[str] = []
+    for i in range(3000):
+        if alive and rnd.random() < 0.35:
+            sid = alive.pop(rnd.randrange(len(alive)))
+            moved = tree.remove(sid)
+            assert sid not in tree
+            assert all(tree.parent[o] == p for o, p in moved.items())
+        else:
+            sid = f"l{i}"
+            tree.add(sid, rnd.choice((0, 1, 2, 3)))
+            alive.append(sid)
+    _check(tree)
+    assert set(tree.parent) == set(alive)
+    assert tree.height() <= 2 * _bound(len(alive), 2, 4)
+
+
+def test_plan_keeps_links_and_survives_deep_old_chains():
+    caps = {f"l{i}": 1 for i in range(5000)}
+    chain = {f"l{i}": (f"l{i - 1}" if i else "pub") for i in range(5000)}
+    placed = plan_tree("pub", caps, chain, fanout=4)
+    assert placed == chain  # tudo cabe: nenhuma ligação muda
+
+    fresh = RelayTree.build("pub", {f"l{i}": 2 for i in range(60)}, {}, fanout=4)
+    assert fresh.height() <= _bound(60, 2, 4)
@@ -0,0 +1,48 @@
+import gzip
+import json
+
+from traffic_recorder import TrafficRecorder
+
+
+def _lines(path):
+    with gzip.open(path, "rt") as f:
+        return [json.loads(line) for line in f][1:]
+
+
+def test_aliases_are_dropped_with_the_session_and_never_reused(tmp_path):
+    rec = TrafficRecorder(str(tmp_path), lambda cand: "host")
+    rec.record("connect", "a", {})
+    rec.record("connect", "b", {})
+    rec.record("offer", "a", {"room": "r", "to": "b", "offer": {"sdp": "x"}})
+    rec.forget("b")
+    rec.record("offer", "a", {"room": "r", "to": "b", "offer": {"sdp": "x"}})
+    rec.record("connect", "c", {})
+    rec.resume("c", "a")
+    rec.forget("a")
+    rec.flush()
+
+    assert rec.aliases == {}
+    assert [line[1:] for line in _lines(rec.path)] == [
+        ["connect", "1"],
+        ["connect", "2"],
+        ["offer", "1", {"room": "r", "to": "2", "sdp_len": 1}],
+        ["offer", "1", {"room": "r", "to": "0", "sdp_len": 1}],
+        ["connect", "3"],
+        ["resume", "3", {"session": "1"}],
+    ]
+
+
+def test_flush_runs_the_write_in_execute(tmp_path):
+    calls = []
+
+    def execute(fn, *args):
+        calls.append(fn)
+        return fn(*args)
+
+    rec = TrafficRecorder(str(tmp_path), lambda cand: None, execute=execute)
+    rec.record("join", "a", {"room": "r", "role": "listener"})
+    rec.flush(off_hub=True)
+
+    assert calls == [rec._write]
+    assert rec.buffer == []
+    assert _lines(rec.path)[0][1:] == ["join", "1", {"room": "r", "role": "listener"}]
@@ -0,0 +1,177 @@
+"""
+Gravação do tráfego de sinalização de entrada, para replay em benchmark.
+
+Cada evento vira uma linha JSON compacta `[t_ms, evento, alias, payload?]`
+num arquivo gzip (`signal-AAAAMMDD-HHMMSS.trace.gz` no diretório
+configurado; a primeira linha é o cabeçalho). Os sids da sessão viram
+aliases sequenciais ("1", "2"...), inclusive nos campos `to`; um `resume`
+grava o alias do socket novo e o da sessão retomada, cujos eventos seguintes
+continuam no alias da sessão. O alias sai do mapa quando a sessão termina
+(`forget`); um `to` para uma sessão já encerrada vira "0". O payload guarda só a
+forma da sessão: room/papel/idiomas do join, tamanho do SDP, tipo do
+candidato ICE. SDP, candidatos, tokens e IPs não são gravados.
+
+As linhas ficam num buffer e vão para o disco a cada `flush_s`: o hub só troca
+o buffer, a compressão gzip e a escrita rodam em `execute` (no app,
+`tpool.execute`, numa thread real). Passando de `max_bytes` a gravação para.
+"""
+
+import gzip
+import itertools
+import json
+import logging
+import os
+import time
+from typing import Any, Callable
+
+from metrics import EventLogger
+
+log = EventLogger(logging.getLogger("webrtc_signaling.recorder"))
+
+TRACE_VERSION = 2
+RECORDED_EVENTS = {
+    "connect",
+    "disconnect",
+    "join",
+    "leave",
+    "update-meta",
+    "offer",
+    "answer",
+    "ice-candidate",
+    "ice-candidates",
+}
+META_KEYS = (
+    "role",
+    "pairs",
+    "source",
+    "want",
+    "target",
+    "target_code",
+    "tgt",
+    "caps",
+    "relay_capacity",
+)
+
+
+class TrafficRecorder:
+    def __init__(
+        self,
+        directory: str,
+        candidate_type: Callable[[Any], str | None],
+        max_bytes: int = 200 * 1024 * 1024,
+        flush_s: float = 1.0,
+        execute: Callable[..., Any] = lambda fn, *args: fn(*args),
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(
+            directory, time.strftime("signal-%Y%m%d-%H%M%S.trace.gz", time.gmtime())
+        )
+        self.candidate_type = candidate_type
+        self.max_bytes = max_bytes
+        self.flush_s = flush_s
+        self.execute = execute
+        self.enabled = True
+        self.written = 0
+        self.aliases: dict[str, str] = {}
+        self._next_alias = itertools.count(1)
+        self.t0 = time.monotonic()
+        self.buffer: list[str] = [
+            json.dumps(
+                {
+                    "v": TRACE_VERSION,
+                    "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                }
+            )
+        ]
+
+    def alias(self, sid: str) -> str:
+        alias = self.aliases.get(sid)
+        if alias is None:
+            alias = self.aliases[sid] = str(next(self._next_alias))
+        return alias
+
+    def forget(self, sid: str):
+        """Fim da sessão: o alias não é mais usado (nem reaproveitado)."""
+        self.aliases.pop(sid, None)
+
+    def record(self, event: str, sid: str, data: Any):
+        if not self.enabled or event not in RECORDED_EVENTS:
+            return
+        line: list[Any] = [
+            int((time.monotonic() - self.t0) * 1000),
+            event,
+            self.alias(sid),
+        ]
+        payload = self._shape(event, data) if isinstance(data, dict) else None
+        if payload:
+            line.append(payload)
+        self.buffer.append(json.dumps(line, ensure_ascii=False, separators=(",", ":")))
+
+    def resume(self, live: str, session: str):
+        """O socket `live` retomou a sessão `session` (o token não é gravado)."""
+        if not self.enabled:
+            return
+        line = [
+            int((time.monotonic() - self.t0) * 1000),
+            "resume",
+            self.alias(live),
+            {"session": self.alias(session)},
+        ]
+        self.buffer.append(json.dumps(line, ensure_ascii=False, separators=(",", ":")))
+        # os eventos seguintes do socket saem no alias da sessão
+        self.forget(live)
+
+    def _shape(self, event: str, data: dict[str, Any]) -> dict[str, Any]:
+        """Só o que o replay precisa para reproduzir a sessão."""
+        out: dict[str, Any] = {}
+        if data.get("room") is not None:
+            out["room"] = data["room"]
+        if isinstance(data.get("to"), str):
+            out["to"] = self.aliases.get(data["to"], "0")
+        if event in ("join", "update-meta"):
+            out.update({k: data[k] for k in META_KEYS if data.get(k) is not None})
+        elif event in ("offer", "answer"):
+            desc = data.get(event)
+            sdp = desc.get("sdp") if isinstance(desc, dict) else None
+            out["sdp_len"] = len(sdp) if isinstance(sdp, str) else 0
+        elif event == "ice-candidate":
+            cand = data.get("candidate")
+            # None = fim dos candidatos
+            out["typ"] = self.candidate_type(cand) if cand else None
+        elif event == "ice-candidates":
+            cands = data.get("candidates")
+            out["typs"] = [
+                self.candidate_type(c) for c in (cands if isinstance(cands, list) else [])
+            ]
+            out["end"] = bool(data.get("end"))
+        return out
+
+    def _write(self, lines: list[str]) -> int:
+        chunk = ("\n".join(lines) + "\n").encode()
+        # cada flush é um membro gzip novo; o arquivo concatenado continua válido
+        with gzip.open(self.path, "ab") as f:
+            f.write(chunk)
+        return len(chunk)
+
+    def flush(self, off_hub: bool = False):
+        if not self.buffer:
+            return
+        lines, self.buffer = self.buffer, []
+        if off_hub:
+            self.written += self.execute(self._write, lines)
+        else:
+            self.written += self._write(lines)
+        if self.written >= self.max_bytes:
+            self.enabled = False
+            log.warning(
+                "traffic_recording_stopped",
+                extra={"path": self.path, "bytes": self.written},
+            )
+
+    def run(self, socketio):
+        while self.enabled:
+            socketio.sleep(self.flush_s)
+            try:
+                self.flush(off_hub=True)
+            except Exception:
+                log.exception("traffic_recording_flush_failed")